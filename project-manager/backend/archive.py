@@ -0,0 +1,235 @@
+"""
+Archivo de tareas completadas (almacenamiento caliente/frío).
+
+Las tareas completadas hace más de TASK_ARCHIVE_AFTER_DAYS días se mueven de
+tasks a archived_tasks, así que GET /tasks y el resto de recorridos por
+owner_id solo ven el trabajo reciente. Cada tarea conserva su id, y sus notas
+y puntos críticos se guardan como JSON en la propia fila. /tasks/completed,
+GET /tasks/{id}, la búsqueda, las estadísticas y la exportación leen de las
+dos tablas, y los contadores por proyecto incluyen las archivadas. Cualquier
+escritura sobre una tarea archivada la devuelve antes a tasks
+(``restore_task``). Las tareas con adjuntos se quedan en tasks porque
+attachments.task_id apunta a esa tabla.
+
+El archivador mueve lotes de TASK_ARCHIVE_BATCH_SIZE tareas, cada uno en su
+propia transacción y con SKIP LOCKED, así que nunca espera ni bloquea durante
+mucho tiempo a las filas que esté escribiendo la aplicación. Corre dentro de
+la API cada TASK_ARCHIVE_INTERVAL segundos (``archiver``), que de paso borra
+las subidas reanudables abandonadas (storage.cleanup_partial_uploads), o se
+lanza a mano:
+
+    python archive.py
+"""
+
+import asyncio
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import chat_context
+import crud
+import database
+import http_cache
+import models
+import schemas
+import storage
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+TASK_ARCHIVE_AFTER_DAYS = int(os.getenv("TASK_ARCHIVE_AFTER_DAYS", "90"))  # 0: no se archiva
+TASK_ARCHIVE_BATCH_SIZE = int(os.getenv("TASK_ARCHIVE_BATCH_SIZE", "500"))
+TASK_ARCHIVE_INTERVAL = float(os.getenv("TASK_ARCHIVE_INTERVAL", "3600"))
+TASK_ARCHIVE_BATCH_SLEEP = float(os.getenv("TASK_ARCHIVE_BATCH_SLEEP", "0.1"))
+
+# Columnas de tasks que se copian tal cual
+TASK_COLUMNS = [column.name for column in models.Task.__table__.columns]
+
+
+def _item_json(schema, item) -> dict:
+    return schema.model_validate(item).model_dump(mode="json")
+
+
+def _item_row(schema, data: dict) -> dict:
+    return schema.model_validate(data).model_dump()
+
+
+def archive_cutoff(now: Optional[datetime] = None) -> datetime:
+    return (now or datetime.now(timezone.utc)) - timedelta(days=TASK_ARCHIVE_AFTER_DAYS)
+
+# ==================== ARCHIVAR ====================
+
+
+async def archive_batch(db: AsyncSession, cutoff: datetime, limit: int = TASK_ARCHIVE_BATCH_SIZE) -> Dict[int, int]:
+    """
+    Mover a archived_tasks hasta ``limit`` tareas completadas antes de
+    ``cutoff`` y confirmar. Devuelve las tareas archivadas por usuario.
+    """
+    task = models.Task
+    has_attachments = select(models.Attachment.id).where(models.Attachment.task_id == task.id).exists()
+    rows = (await db.execute(
+        select(*task.__table__.columns)
+        .where(task.completed == True, task.completed_at < cutoff, ~has_attachments)
+        .order_by(task.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )).mappings().all()
+    if not rows:
+        await db.rollback()
+        return {}
+
+    task_ids = [row["id"] for row in rows]
+    notes, points = {}, {}
+    for note in await db.scalars(
+        select(models.TaskNote).where(models.TaskNote.task_id.in_(task_ids)).order_by(models.TaskNote.id)
+    ):
+        notes.setdefault(note.task_id, []).append(_item_json(schemas.TaskNote, note))
+    for point in await db.scalars(
+        select(models.TaskCriticalPoint)
+        .where(models.TaskCriticalPoint.task_id.in_(task_ids))
+        .order_by(models.TaskCriticalPoint.id)
+    ):
+        points.setdefault(point.task_id, []).append(_item_json(schemas.TaskCriticalPoint, point))
+
+    await db.execute(insert(models.ArchivedTask), [
+        {
+            **dict(row),
+            "notes": notes.get(row["id"], []),
+            "critical_points": points.get(row["id"], []),
+            "notes_text": "\n".join(note["text"] for note in notes.get(row["id"], [])) or None,
+        }
+        for row in rows
+    ])
+    await db.execute(delete(models.TaskNote).where(models.TaskNote.task_id.in_(task_ids)))
+    await db.execute(delete(models.TaskCriticalPoint).where(models.TaskCriticalPoint.task_id.in_(task_ids)))
+    await db.execute(delete(task).where(task.id.in_(task_ids)).execution_options(synchronize_session=False))
+
+    owners = Counter(row["owner_id"] for row in rows)
+    for owner_id in owners:
+        # Las tareas salen de GET /tasks: cambia la versión de las respuestas cacheadas
+        await crud.next_change_seq(db, owner_id)
+    await db.commit()
+    for owner_id in owners:
+        http_cache.invalidate(owner_id)
+        chat_context.summaries.invalidate(owner_id)
+    return dict(owners)
+
+
+async def archive_completed_tasks(cutoff: Optional[datetime] = None) -> int:
+    """Archivar todas las tareas pendientes de archivar, lote a lote"""
+    if TASK_ARCHIVE_AFTER_DAYS <= 0:
+        return 0
+    cutoff = cutoff or archive_cutoff()
+    total = 0
+    while True:
+        async with database.AsyncSessionLocal() as db:
+            archived = sum((await archive_batch(db, cutoff)).values())
+        total += archived
+        if archived < TASK_ARCHIVE_BATCH_SIZE:
+            break
+        await asyncio.sleep(TASK_ARCHIVE_BATCH_SLEEP)
+    if total:
+        logger.info("Tareas archivadas", extra={"count": total, "cutoff": cutoff.isoformat()})
+    return total
+
+
+class Archiver:
+    """Ejecución periódica del archivador dentro de la API"""
+
+    def __init__(self, interval: float = TASK_ARCHIVE_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.archived = 0
+        self.uploads_removed = 0
+        self.runs = 0
+
+    async def start(self) -> None:
+        # Aunque no se archive (TASK_ARCHIVE_AFTER_DAYS=0) sigue limpiando subidas
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # Un lote interrumpido no llega a confirmarse
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                self.archived += await archive_completed_tasks()
+                self.runs += 1
+            except Exception:
+                logger.exception("Error archivando tareas")
+            try:
+                self.uploads_removed += await storage.cleanup_partial_uploads()
+            except Exception:
+                logger.exception("Error borrando subidas abandonadas")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {"runs": self.runs, "archived": self.archived, "uploads_removed": self.uploads_removed}
+
+
+archiver = Archiver()
+
+# ==================== LEER Y RESTAURAR ====================
+
+
+async def is_archived(db: AsyncSession, owner_id: int, task_id: int) -> bool:
+    archived = models.ArchivedTask
+    return await db.scalar(
+        select(archived.id).where(archived.id == task_id, archived.owner_id == owner_id)
+    ) is not None
+
+
+async def get_archived_task(db: AsyncSession, owner_id: int, task_id: int) -> Optional[dict]:
+    """Tarea archivada con la forma de schemas.TaskDetail"""
+    archived = models.ArchivedTask
+    names = list(schemas.Task.model_fields)
+    row = (await db.execute(
+        select(*[getattr(archived, name) for name in names], archived.notes, archived.critical_points)
+        .where(archived.id == task_id, archived.owner_id == owner_id)
+    )).first()
+    if row is None:
+        return None
+    *values, notes, points = row
+    return {**dict(zip(names, values)), "notes": notes or [], "critical_points": points or []}
+
+
+async def restore_task(db: AsyncSession, owner_id: int, task_id: int) -> bool:
+    """
+    Devolver una tarea archivada a tasks, con sus notas y puntos críticos, en
+    la transacción del llamador. Devuelve False si no estaba archivada.
+    """
+    archived = models.ArchivedTask
+    row = (await db.execute(
+        delete(archived)
+        .where(archived.id == task_id, archived.owner_id == owner_id)
+        .returning(*[archived.__table__.c[name] for name in TASK_COLUMNS], archived.notes, archived.critical_points)
+        .execution_options(synchronize_session=False)
+    )).mappings().first()
+    if row is None:
+        return False
+    await db.execute(insert(models.Task), [{name: row[name] for name in TASK_COLUMNS}])
+    if row["notes"]:
+        await db.execute(insert(models.TaskNote), [_item_row(schemas.TaskNote, note) for note in row["notes"]])
+    if row["critical_points"]:
+        await db.execute(
+            insert(models.TaskCriticalPoint),
+            [_item_row(schemas.TaskCriticalPoint, point) for point in row["critical_points"]],
+        )
+    logger.info("Tarea restaurada del archivo", extra={"task_id": task_id, "owner_id": owner_id})
+    return True
+
+
+if __name__ == "__main__":
+    from logs import setup_logging
+
+    setup_logging()
+    print(f"📦 Tareas archivadas: {asyncio.run(archive_completed_tasks())}")
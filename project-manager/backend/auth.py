@@ -1,27 +1,82 @@
 from datetime import datetime, timedelta
 from typing import Optional
+import os
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
 import models
+import passwords
 import schemas
+import sessions
+from cache import CacheBackend, MemoryCache
 from database import get_db
+from ratelimit import RateLimiter
 
 # Configuration
 SECRET_KEY = "your-secret-key-here-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+
+# Intentos de login/registro: por IP y por cuenta, antes de gastar un hash
+LOGIN_RATE_LIMIT_PER_MINUTE = float(os.getenv("LOGIN_RATE_LIMIT_PER_MINUTE", "20"))
+LOGIN_ACCOUNT_RATE_LIMIT_PER_MINUTE = float(os.getenv("LOGIN_ACCOUNT_RATE_LIMIT_PER_MINUTE", "5"))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# Caché de usuarios autenticados indexada por el "sub" del token (email).
+# Guarda un schemas.User desacoplado de la sesión, no el objeto ORM.
+user_cache: CacheBackend = MemoryCache(maxsize=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+def set_user_cache_backend(backend: CacheBackend):
+    """Sustituir la caché local por otra (p. ej. una compartida entre workers)"""
+    global user_cache
+    user_cache = backend
+
+def invalidate_cached_user(email: str):
+    """Eliminar un usuario de la caché tras modificarlo o borrarlo"""
+    user_cache.delete(email)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_user_on_change(mapper, connection, target):
+    invalidate_cached_user(target.email)
+    # Si cambió el email, la entrada antigua también queda obsoleta
+    for old_email in inspect(target).attrs.email.history.deleted:
+        invalidate_cached_user(old_email)
+
+login_ip_limiter = RateLimiter(rate=LOGIN_RATE_LIMIT_PER_MINUTE, per=60.0)
+login_account_limiter = RateLimiter(rate=LOGIN_ACCOUNT_RATE_LIMIT_PER_MINUTE, per=60.0)
+
+def check_login_rate(request: Request, account: Optional[str] = None):
+    """429 si la IP (o la cuenta) ha agotado sus intentos"""
+    client_ip = request.client.host if request.client else "unknown"
+    retry_after = login_ip_limiter.acquire(client_ip)
+    if not retry_after and account:
+        retry_after = login_account_limiter.acquire(account.lower())
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, try again later",
+            headers={"Retry-After": str(int(retry_after) + 1)},
+        )
+
+def _hashing_unavailable():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server busy, try again later",
+        headers={"Retry-After": "1"},
+    )
+
+async def get_password_hash(password: str) -> str:
+    try:
+        return await passwords.hash_password(password)
+    except passwords.HashingOverloaded:
+        raise _hashing_unavailable()
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -33,41 +88,125 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_user_by_username(db: Session, username: str):
+def create_refresh_token(email: str, user_id: int, sid: str):
+    expire = datetime.utcnow() + timedelta(days=sessions.REFRESH_TOKEN_EXPIRE_DAYS)
+    to_encode = {"sub": email, "uid": user_id, "sid": sid, "jti": sessions.new_id(), "type": "refresh", "exp": expire}
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+def issue_tokens(email: str, user_id: int, sid: Optional[str] = None) -> dict:
+    """Access token y refresh token de una sesión (nueva si no se indica ``sid``)"""
+    sid = sid or sessions.new_id()
+    access_token = create_access_token(
+        data={"sub": email, "uid": user_id, "sid": sid},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": create_refresh_token(email, user_id, sid),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+async def rotate_refresh_token(refresh_token: str) -> dict:
+    """
+    Canjear un refresh token por un par nuevo de la misma sesión. Un token ya
+    canjeado indica que se ha filtrado: se revoca toda la sesión.
+    """
+    try:
+        payload = jwt.decode(refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise _credentials_exception()
+    sid, jti = payload.get("sid"), payload.get("jti")
+    if payload.get("type") != "refresh" or not sid or not jti or payload.get("sub") is None:
+        raise _credentials_exception()
+    if sessions.store.is_session_revoked(sid):
+        raise _credentials_exception()
+    if not await sessions.store.revoke_token(jti, payload["exp"]):
+        await sessions.store.revoke_session(sid, sessions.session_expiry())
+        raise _credentials_exception()
+    return issue_tokens(payload["sub"], payload["uid"], sid)
+
+def refresh_token_session(refresh_token: str) -> Optional[str]:
+    """Sesión de un refresh token con firma válida, aunque ya haya caducado"""
+    try:
+        payload = jwt.decode(refresh_token, SECRET_KEY, algorithms=[ALGORITHM], options={"verify_exp": False})
+    except JWTError:
+        return None
+    return payload.get("sid") if payload.get("type") == "refresh" else None
+
+async def revoke_session(sid: str):
+    await sessions.store.revoke_session(sid, sessions.session_expiry())
+
+async def get_user_by_username(db: AsyncSession, username: str):
     """Obtener usuario por username"""  # ✅ CORREGIDO
-    return db.query(models.User).filter(models.User.username == username).first()
+    return await db.scalar(select(models.User).where(models.User.username == username))
 
-def get_user_by_email(db: Session, email: str):
+async def get_user_by_email(db: AsyncSession, email: str):
     """Obtener usuario por email"""
-    return db.query(models.User).filter(models.User.email == email).first()
+    return await db.scalar(select(models.User).where(models.User.email == email))
 
-def authenticate_user(db: Session, username: str, password: str):
+async def authenticate_user(db: AsyncSession, username: str, password: str):
     """Autenticar usuario - username es el email en OAuth2"""
     # En el estándar OAuth2, username puede ser email
-    user = get_user_by_email(db, username)
+    user = await get_user_by_email(db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    try:
+        valid, new_hash = await passwords.verify_and_update(password, user.hashed_password)
+    except passwords.HashingOverloaded:
+        raise _hashing_unavailable()
+    if not valid:
         return False
+    if new_hash:
+        # Hash con un esquema o coste antiguo: se rehace ahora que se conoce la contraseña
+        user.hashed_password = new_hash
+        await db.commit()
+    login_account_limiter.reset(username.lower())
     return user
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """Obtener usuario actual desde el token"""
-    credentials_exception = HTTPException(
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_access_token(token: str) -> dict:
+    """Validar la firma y expiración del token y devolver su payload"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(email=email)
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    if payload.get("sub") is None or payload.get("type") == "refresh":
+        raise _credentials_exception()
+    sid = payload.get("sid")
+    if sid and sessions.store.is_session_revoked(sid):
+        # Sesión cerrada con /logout
+        raise _credentials_exception()
+    return payload
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    """Obtener usuario actual desde el token (con caché por email)"""
+    payload = decode_access_token(token)
+    token_data = schemas.TokenData(email=payload.get("sub"))
+    
+    cached_user = user_cache.get(token_data.email)
+    if cached_user is not None:
+        return cached_user
     
-    user = get_user_by_email(db, email=token_data.email)
+    user = await get_user_by_email(db, email=token_data.email)
     if user is None:
-        raise credentials_exception
-    return user
\ No newline at end of file
+        raise _credentials_exception()
+    cached_user = schemas.User.model_validate(user)
+    user_cache.set(token_data.email, cached_user)
+    return cached_user
+
+async def get_current_user_id(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> int:
+    """Obtener solo el id del usuario; usa el claim "uid" sin tocar la BD"""
+    payload = decode_access_token(token)
+    user_id = payload.get("uid")
+    if user_id is not None:
+        return int(user_id)
+    # Tokens emitidos antes de incluir "uid"
+    user = await get_current_user(token, db)
+    return user.id
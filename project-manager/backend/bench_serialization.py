@@ -0,0 +1,85 @@
+"""
+Microbenchmark de la serialización de listados de tareas
+Ejecutar: python bench_serialization.py [1000 10000 100000]
+
+Compara el camino anterior de GET /tasks (objetos ORM -> modelos pydantic de
+response_model -> json) con el actual (tuplas de la consulta -> dicts ->
+orjson). No necesita base de datos: las filas se generan en memoria.
+"""
+
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from pydantic import TypeAdapter
+
+import compression
+import crud
+import models
+import schemas
+import serialization
+
+COLUMNS = list(crud.TASK_FIELDS)
+
+
+def make_rows(n: int) -> list:
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    sample = {
+        "title": "Revisar presupuesto del proyecto",
+        "description": "Comprobar las partidas del trimestre y preparar el informe",
+        "priority": "high",
+        "status": "pending",
+        "category": "finanzas",
+        "project_id": 3,
+        "progress": 40,
+        "completed": False,
+        "completed_at": None,
+        "owner_id": 1,
+        "updated_at": None,
+    }
+    rows = []
+    for i in range(n):
+        values = dict(sample, id=i + 1, created_at=now + timedelta(minutes=i), due_date=now + timedelta(days=i % 30))
+        rows.append(tuple(values[name] for name in COLUMNS))
+    return rows
+
+
+def old_path(rows: list) -> bytes:
+    # Lo que hacía FastAPI con response_model=List[schemas.Task] sobre entidades ORM
+    tasks = [models.Task(**dict(zip(COLUMNS, row))) for row in rows]
+    adapter = TypeAdapter(List[schemas.Task])
+    validated = adapter.validate_python(tasks, from_attributes=True)
+    content = adapter.dump_python(validated, mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def new_path(rows: list) -> bytes:
+    return serialization.dumps(serialization.rows_to_dicts(COLUMNS, rows))
+
+
+def timed(func, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(sizes):
+    print(f"orjson: {'sí' if serialization.orjson is not None else 'no'}, brotli: {'sí' if compression.brotli is not None else 'no'}")
+    print(f"{'tareas':>8} {'anterior':>10} {'actual':>10} {'mejora':>7} {'bytes':>10} {'gzip':>9} {'br':>9}")
+    for n in sizes:
+        rows = make_rows(n)
+        old = timed(old_path, rows)
+        new = timed(new_path, rows)
+        body = new_path(rows)
+        gzipped = len(compression.compress(body, "gzip"))
+        brotli_size = len(compression.compress(body, "br")) if compression.brotli is not None else "-"
+        print(f"{n:>8} {old * 1000:>8.1f}ms {new * 1000:>8.1f}ms {old / new:>6.1f}x {len(body):>10} {gzipped:>9} {brotli_size:>9}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
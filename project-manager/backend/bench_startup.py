@@ -0,0 +1,83 @@
+"""
+Benchmark del arranque en frío de la API
+Ejecutar: python bench_startup.py [repeticiones]
+
+Importa main (que construye la app con create_app) en un intérprete nuevo
+varias veces y compara la mediana con STARTUP_BUDGET_SECONDS; sale con
+código 1 si se supera o si el import ha cargado alguna integración que debe
+ser perezosa (cliente de Gemini, drivers de base de datos). Muestra también
+los módulos que más tardan en importarse según ``python -X importtime``.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "1.5"))
+# Módulos que no deben cargarse hasta que se usan
+LAZY_MODULES = ("google.generativeai", "psycopg2", "asyncpg", "aiosqlite", "PIL")
+
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+loaded = [name for name in sys.argv[1:] if name in sys.modules]
+print(elapsed, ",".join(loaded))
+"""
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def cold_import() -> tuple:
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE, *LAZY_MODULES],
+        cwd=HERE, capture_output=True, text=True, check=True,
+    )
+    elapsed, _, loaded = result.stdout.strip().rpartition("\n")[-1].partition(" ")
+    return float(elapsed), [name for name in loaded.split(",") if name]
+
+
+def slowest_imports(limit: int = 10) -> list:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=HERE, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.removeprefix("import time:").split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        rows.append((int(parts[1]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main(repeat: int) -> int:
+    times, eager = [], set()
+    for _ in range(repeat):
+        elapsed, loaded = cold_import()
+        times.append(elapsed)
+        eager.update(loaded)
+    median = statistics.median(times)
+    print(f"import main: mediana {median * 1000:.0f}ms, mín {min(times) * 1000:.0f}ms, "
+          f"máx {max(times) * 1000:.0f}ms ({repeat} ejecuciones, presupuesto {STARTUP_BUDGET_SECONDS * 1000:.0f}ms)")
+    print("Módulos más lentos (acumulado):")
+    for cumulative, name in slowest_imports():
+        print(f"  {cumulative / 1000:>8.1f}ms  {name}")
+
+    ok = True
+    if eager:
+        print(f"❌ Cargados al importar (deberían ser perezosos): {', '.join(sorted(eager))}")
+        ok = False
+    if median > STARTUP_BUDGET_SECONDS:
+        print("❌ Arranque por encima del presupuesto")
+        ok = False
+    if ok:
+        print("✅ Arranque dentro del presupuesto")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5))
@@ -0,0 +1,282 @@
+"""
+Contexto del chat: resumen compacto de las tareas y proyectos del usuario.
+
+El resumen se construye una vez desde la base de datos y después se mantiene
+de forma incremental desde los endpoints que crean, modifican o borran tareas
+y proyectos, así que cada mensaje del chat no vuelve a recorrer las tareas.
+Las operaciones masivas simplemente lo invalidan. Cada worker tiene su propia
+copia, que se reconstruye al pasar CHAT_SUMMARY_TTL_SECONDS para recoger los
+cambios hechos en otros procesos.
+"""
+
+import bisect
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+CHAT_SUMMARY_TTL_SECONDS = float(os.getenv("CHAT_SUMMARY_TTL_SECONDS", "300"))
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "2000"))
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "10"))
+SUMMARY_MAX_ITEMS = 5
+
+def _aware(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _by_name(item) -> str:
+    # status/priority pueden ser NULL
+    return str(item[0])
+
+
+def task_snapshot(task) -> dict:
+    """Campos de una tarea que intervienen en el resumen"""
+    return {
+        "id": task.id,
+        "title": task.title,
+        "status": task.status,
+        "priority": task.priority,
+        "completed": bool(task.completed),
+        "due_date": _aware(task.due_date) if task.due_date else None,
+    }
+
+
+def project_snapshot(project) -> dict:
+    return {"id": project.id, "name": project.name, "status": project.status}
+
+
+class TaskSummary:
+    """Contadores y fechas límite de un usuario, actualizables tarea a tarea"""
+
+    def __init__(self):
+        self.by_status = Counter()
+        self.by_priority = Counter()
+        self.completed = 0
+        self.total = 0
+        # Tareas abiertas con fecha límite, ordenadas por (due_date, id)
+        self._due = []
+        self._titles = {}
+        self.projects = {}
+
+    def add_task(self, task: dict) -> None:
+        self.total += 1
+        self.by_status[task["status"]] += 1
+        self.by_priority[task["priority"]] += 1
+        if task["completed"]:
+            self.completed += 1
+        elif task["due_date"] is not None:
+            bisect.insort(self._due, (task["due_date"], task["id"]))
+            self._titles[task["id"]] = (task["title"], task["priority"])
+
+    def remove_task(self, task: dict) -> None:
+        self.total -= 1
+        self.by_status[task["status"]] -= 1
+        self.by_priority[task["priority"]] -= 1
+        if task["completed"]:
+            self.completed -= 1
+        elif task["due_date"] is not None:
+            key = (task["due_date"], task["id"])
+            index = bisect.bisect_left(self._due, key)
+            if index < len(self._due) and self._due[index] == key:
+                del self._due[index]
+            self._titles.pop(task["id"], None)
+
+    def update_task(self, before: dict, after: dict) -> None:
+        self.remove_task(before)
+        self.add_task(after)
+
+    def render(self, now: Optional[datetime] = None) -> str:
+        now = now or datetime.now(timezone.utc)
+        lines = [f"Tareas: {self.total} en total, {self.completed} completadas."]
+        if self.total:
+            statuses = ", ".join(f"{k}: {v}" for k, v in sorted(self.by_status.items(), key=_by_name) if v)
+            priorities = ", ".join(f"{k}: {v}" for k, v in sorted(self.by_priority.items(), key=_by_name) if v)
+            lines.append(f"Por estado: {statuses}.")
+            lines.append(f"Por prioridad: {priorities}.")
+
+        split = bisect.bisect_left(self._due, (now, -1))
+        if split:
+            lines.append(f"Vencidas: {split}.")
+            for due_date, task_id in self._due[:split][:SUMMARY_MAX_ITEMS]:
+                title, priority = self._titles[task_id]
+                lines.append(f"- VENCIDA {due_date:%Y-%m-%d} [{priority}] {title}")
+        upcoming = self._due[split:split + SUMMARY_MAX_ITEMS]
+        if upcoming:
+            lines.append("Próximas fechas límite:")
+            for due_date, task_id in upcoming:
+                title, priority = self._titles[task_id]
+                lines.append(f"- {due_date:%Y-%m-%d} [{priority}] {title}")
+
+        if self.projects:
+            by_status = Counter(p["status"] for p in self.projects.values())
+            counts = ", ".join(f"{k}: {v}" for k, v in sorted(by_status.items(), key=_by_name))
+            lines.append(f"Proyectos: {len(self.projects)} ({counts}).")
+            active = sorted(p["name"] for p in self.projects.values() if p["status"] == "activo")
+            if active:
+                lines.append("Proyectos activos: " + ", ".join(active[:SUMMARY_MAX_ITEMS]))
+        return "\n".join(lines)
+
+
+class SummaryStore:
+    """Resúmenes por usuario en memoria del proceso"""
+
+    def __init__(self, ttl: float = CHAT_SUMMARY_TTL_SECONDS):
+        self.ttl = ttl
+        self._summaries = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def _current(self, user_id: int) -> Optional[TaskSummary]:
+        entry = self._summaries.get(user_id)
+        if entry is None:
+            return None
+        summary, built_at = entry
+        if time.monotonic() - built_at > self.ttl:
+            return None
+        return summary
+
+    async def get(self, db: AsyncSession, user_id: int) -> TaskSummary:
+        summary = self._current(user_id)
+        if summary is None:
+            summary = await build_summary(db, user_id)
+            with self._lock:
+                self._summaries[user_id] = (summary, time.monotonic())
+                self.builds += 1
+        return summary
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._summaries.pop(user_id, None)
+
+    # Hooks llamados desde los endpoints; si el usuario no tiene resumen no hay nada que mantener
+    def task_created(self, user_id: int, task) -> None:
+        with self._lock:
+            summary = self._current(user_id)
+            if summary is not None:
+                summary.add_task(task_snapshot(task))
+
+    def task_updated(self, user_id: int, before: dict, task) -> None:
+        with self._lock:
+            summary = self._current(user_id)
+            if summary is not None:
+                summary.update_task(before, task_snapshot(task))
+
+    def task_deleted(self, user_id: int, before: dict) -> None:
+        with self._lock:
+            summary = self._current(user_id)
+            if summary is not None:
+                summary.remove_task(before)
+
+    def project_saved(self, user_id: int, project) -> None:
+        with self._lock:
+            summary = self._current(user_id)
+            if summary is not None:
+                summary.projects[project.id] = project_snapshot(project)
+
+
+async def build_summary(db: AsyncSession, user_id: int) -> TaskSummary:
+    """Construir el resumen con una agregación y la lista de fechas abiertas"""
+    summary = TaskSummary()
+    counts = await db.execute(
+        select(models.Task.status, models.Task.priority, models.Task.completed, func.count())
+        .where(models.Task.owner_id == user_id)
+        .group_by(models.Task.status, models.Task.priority, models.Task.completed)
+    )
+    for status, priority, completed, count in counts:
+        summary.total += count
+        summary.by_status[status] += count
+        summary.by_priority[priority] += count
+        if completed:
+            summary.completed += count
+
+    due_rows = await db.execute(
+        select(models.Task.id, models.Task.title, models.Task.priority, models.Task.due_date)
+        .where(
+            models.Task.owner_id == user_id,
+            models.Task.completed == False,
+            models.Task.due_date.isnot(None),
+        )
+    )
+    for task_id, title, priority, due_date in due_rows:
+        summary._due.append((_aware(due_date), task_id))
+        summary._titles[task_id] = (title, priority)
+    summary._due.sort()
+
+    projects = await db.execute(
+        select(models.Project.id, models.Project.name, models.Project.status)
+        .where(models.Project.owner_id == user_id)
+    )
+    for project_id, name, status in projects:
+        summary.projects[project_id] = {"id": project_id, "name": name, "status": status}
+    return summary
+
+
+summaries = SummaryStore()
+
+
+# ==================== PRESUPUESTO DE TOKENS ====================
+
+def estimate_tokens(text: str) -> int:
+    """Aproximación barata: ~4 caracteres por token"""
+    return (len(text) + 3) // 4
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max(max_tokens * 4 - 1, 0)] + "…"
+
+
+def build_prompt(
+    username: str,
+    summary_text: str,
+    history: List[dict],
+    message: str,
+    budget: int = CHAT_CONTEXT_TOKEN_BUDGET,
+) -> str:
+    """
+    Componer el prompt sin pasar de ``budget`` tokens estimados.
+
+    El mensaje actual siempre entra; el resumen puede ocupar hasta la mitad
+    de lo que quede (se recorta por líneas) y el historial usa el resto,
+    descartando primero los mensajes más antiguos.
+    """
+    header = f"Eres un asistente de gestión de proyectos y tareas para el usuario {username}.\n\n"
+    footer = f"user: {message}\n\nassistant:"
+    remaining = budget - estimate_tokens(header) - estimate_tokens(footer)
+
+    context = ""
+    if summary_text and remaining > 0:
+        kept = []
+        used = estimate_tokens("Resumen de sus tareas:\n\n")
+        for line in summary_text.split("\n"):
+            cost = estimate_tokens(line + "\n")
+            if used + cost > remaining // 2:
+                break
+            kept.append(line)
+            used += cost
+        if kept:
+            context = "Resumen de sus tareas:\n" + "\n".join(kept) + "\n\n"
+            remaining -= used
+
+    lines = []
+    for msg in reversed(history[-CHAT_HISTORY_MAX_MESSAGES:]):
+        if remaining <= 0:
+            break
+        line = f"{msg.get('role', 'user')}: {msg.get('content', '')}\n"
+        cost = estimate_tokens(line)
+        if cost > remaining:
+            line = _truncate(line.rstrip("\n"), remaining) + "\n"
+            cost = remaining
+        lines.append(line)
+        remaining -= cost
+    lines.reverse()
+
+    return header + context + "".join(lines) + footer
@@ -0,0 +1,103 @@
+"""
+Comprobación de que los listados no hacen una consulta por fila (N+1)
+Ejecutar: python check_queries.py [N]
+
+Crea una base de datos SQLite temporal con un usuario que tiene un proyecto
+con 1 tarea y otro que tiene N proyectos con N tareas cada uno, y pide como
+cada uno GET /projects?include=task_summary y
+GET /projects/{id}?include=tasks,task_summary. Las consultas de cada
+petición se leen del histograma http_request_db_queries de metrics.py; sale
+con código 1 si el número cambia entre el caso de 1 y el de N.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+# Antes de importar la app: base de datos propia y un único worker sin tareas de fondo
+_DB_DIR = tempfile.mkdtemp(prefix="check_queries_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'check.sqlite')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ.pop("DATABASE_REPLICA_URL", None)
+os.environ.pop("ASYNC_DATABASE_REPLICA_URL", None)
+os.environ["API_WORKERS"] = "1"
+os.environ["API_BACKGROUND_TASKS"] = "false"
+os.environ["HTTP_RESPONSE_CACHE_USERS"] = "0"
+
+from fastapi.testclient import TestClient
+
+import auth
+import database
+import main
+import metrics
+import models
+
+# (ruta de la plantilla, URL con {project_id})
+ENDPOINTS = (
+    ("/projects", "/projects?include=task_summary"),
+    ("/projects/{project_id}", "/projects/{project_id}?include=tasks,task_summary"),
+)
+
+
+def seed(email: str, projects: int, tasks_per_project: int) -> tuple:
+    """Crear un usuario con sus proyectos y tareas; devuelve (user_id, id del primer proyecto)"""
+    with database.SessionLocal() as db:
+        user = models.User(email=email, username=email.split("@")[0], hashed_password="-")
+        db.add(user)
+        db.flush()
+        first_project = None
+        for p in range(projects):
+            project = models.Project(name=f"Proyecto {p}", owner_id=user.id)
+            project.counters = models.ProjectTaskCounter(
+                task_count=tasks_per_project, completed_count=0, progress_sum=0
+            )
+            db.add(project)
+            db.flush()
+            first_project = first_project or project.id
+            db.add_all(
+                models.Task(title=f"Tarea {t}", owner_id=user.id, project_id=project.id)
+                for t in range(tasks_per_project)
+            )
+        db.commit()
+        return user.id, first_project
+
+
+def query_counts(client: TestClient, email: str, user_id: int, project_id: int) -> dict:
+    token = auth.issue_tokens(email, user_id)["access_token"]
+    counts = {}
+    for route, url in ENDPOINTS:
+        before_count, before_sum = metrics.request_queries.totals(route)
+        response = client.get(url.format(project_id=project_id), headers={"Authorization": f"Bearer {token}"})
+        response.raise_for_status()
+        after_count, after_sum = metrics.request_queries.totals(route)
+        if after_count != before_count + 1:
+            raise RuntimeError(f"{route}: no se ha medido la petición")
+        counts[url] = int(after_sum - before_sum)
+    return counts
+
+
+def main_check(n: int) -> int:
+    models.Base.metadata.create_all(bind=database.get_sync_engine())
+    small = seed("uno@example.com", projects=1, tasks_per_project=1)
+    large = seed("muchos@example.com", projects=n, tasks_per_project=n)
+
+    client = TestClient(main.create_app(main.Settings(routers=["projects"])))
+    small_counts = query_counts(client, "uno@example.com", *small)
+    large_counts = query_counts(client, "muchos@example.com", *large)
+
+    ok = True
+    for url, expected in small_counts.items():
+        got = large_counts[url]
+        mark = "✅" if got == expected else "❌"
+        print(f"{mark} GET {url}: {expected} consultas con 1 tarea, {got} con {n}x{n}")
+        ok = ok and got == expected
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    try:
+        code = main_check(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
+    finally:
+        shutil.rmtree(_DB_DIR, ignore_errors=True)
+    sys.exit(code)
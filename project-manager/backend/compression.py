@@ -0,0 +1,104 @@
+"""
+Compresión gzip/brotli de las respuestas.
+
+Solo se comprimen respuestas completas (un único bloque de cuerpo) de tipo
+texto/JSON que pasen de COMPRESSION_MIN_SIZE bytes. Las respuestas en streaming
+(SSE, descargas por bloques) se dejan pasar tal cual para no retener eventos
+ni romper los Range. Brotli se usa si el cliente lo acepta y el paquete
+``brotli`` está instalado.
+"""
+
+import gzip
+import os
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli es opcional
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+# A partir de este tamaño se comprime en un hilo para no bloquear el event loop
+THREADPOOL_MIN_SIZE = 256 * 1024
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/x-ndjson")
+
+
+def choose_encoding(accept_encoding: str) -> str:
+    accepted = {
+        part.split(";")[0].strip().lower()
+        for part in accept_encoding.split(",")
+        if not part.strip().endswith("q=0")
+    }
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return ""
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            if start_message is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start_message["headers"])
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or "content-encoding" in headers
+                or "content-range" in headers
+                or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            ):
+                # Streaming, pequeña o ya codificada: se envía sin tocar
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            if len(body) >= THREADPOOL_MIN_SIZE:
+                body = await run_in_threadpool(compress, body, encoding)
+            else:
+                body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body, "more_body": False})
+
+        await self.app(scope, receive, send_wrapper)
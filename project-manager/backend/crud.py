@@ -0,0 +1,517 @@
+"""
+Consultas sobre tareas reutilizadas por los endpoints
+"""
+
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import delete, func, insert, literal, select, union_all, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+import pagination
+import schemas
+import serialization
+
+# Columnas por las que se puede ordenar el listado (prefijo "-" = descendente)
+TASK_SORT_COLUMNS = {
+    "created_at": models.Task.created_at,
+    "due_date": models.Task.due_date,
+    "title": models.Task.title,
+}
+NULLABLE_SORT_COLUMNS = {"due_date"}
+
+# Columnas que se pueden pedir con ?fields=
+TASK_FIELDS = {name: getattr(models.Task, name) for name in schemas.Task.model_fields}
+
+MAX_PAGE_SIZE = 500
+MAX_BULK_SIZE = 10000
+
+
+def parse_task_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Validar ?fields=a,b,c; lanza ValueError si hay columnas desconocidas"""
+    if fields is None:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in TASK_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if "id" not in names:
+        names.insert(0, "id")
+    return names
+
+
+def task_filter_conditions(
+    owner_id: int,
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    category: Optional[str] = None,
+    project_id: Optional[int] = None,
+    completed: Optional[bool] = None,
+    due_from: Optional[datetime] = None,
+    due_to: Optional[datetime] = None,
+) -> list:
+    """Condiciones WHERE de los filtros de tareas"""
+    conditions = [models.Task.owner_id == owner_id]
+    if status is not None:
+        conditions.append(models.Task.status == status)
+    if priority is not None:
+        conditions.append(models.Task.priority == priority)
+    if category is not None:
+        conditions.append(models.Task.category == category)
+    if project_id is not None:
+        conditions.append(models.Task.project_id == project_id)
+    if completed is not None:
+        conditions.append(models.Task.completed == completed)
+    if due_from is not None:
+        conditions.append(models.Task.due_date >= due_from)
+    if due_to is not None:
+        conditions.append(models.Task.due_date <= due_to)
+    return conditions
+
+
+def filter_tasks(stmt, owner_id: int, **filters):
+    """Aplicar los filtros del listado de tareas a un SELECT"""
+    return stmt.where(*task_filter_conditions(owner_id, **filters))
+
+
+async def list_tasks(
+    db: AsyncSession,
+    owner_id: int,
+    sort: str = "created_at",
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    **filters,
+):
+    """
+    Listar tareas del usuario con filtros, orden y paginación por cursor.
+
+    Devuelve (tareas como dicts, next_cursor). Con ``fields`` solo se
+    seleccionan esas columnas.
+    """
+    descending = sort.startswith("-")
+    sort_key = sort.lstrip("-")
+    if sort_key not in TASK_SORT_COLUMNS:
+        raise ValueError(f"Invalid sort: {sort}")
+    sort_column = TASK_SORT_COLUMNS[sort_key]
+    nullable = sort_key in NULLABLE_SORT_COLUMNS
+
+    # Se seleccionan columnas y no entidades: las filas se convierten en dicts
+    # sin crear objetos ORM ni modelos pydantic (ver serialization.py)
+    field_names = parse_task_fields(fields) or list(TASK_FIELDS)
+    columns = [TASK_FIELDS[name] for name in field_names]
+    if sort_key not in field_names:
+        # Siempre se selecciona la columna de orden para poder generar el cursor
+        columns.append(sort_column)
+    if "id" not in field_names:
+        columns.append(models.Task.id)
+    stmt = select(*columns)
+
+    stmt = filter_tasks(stmt, owner_id, **filters)
+
+    if cursor:
+        value, last_id = pagination.decode_cursor(cursor, sort)
+        stmt = stmt.where(
+            pagination.keyset_filter(sort_column, models.Task.id, value, last_id, descending, nullable)
+        )
+
+    order_column = sort_column.desc() if descending else sort_column.asc()
+    if nullable:
+        order_column = order_column.nullslast()
+    id_order = models.Task.id.desc() if descending else models.Task.id.asc()
+    stmt = stmt.order_by(order_column, id_order)
+
+    if limit is not None:
+        limit = min(limit, MAX_PAGE_SIZE)
+        stmt = stmt.limit(limit + 1)
+    rows = (await db.execute(stmt)).all()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = pagination.encode_cursor(sort, getattr(last, sort_key), last.id)
+
+    if len(columns) > len(field_names):
+        rows = [row[:len(field_names)] for row in rows]
+    return serialization.rows_to_dicts(field_names, rows), next_cursor
+
+
+async def list_completed_tasks(db: AsyncSession, owner_id: int) -> List[dict]:
+    """Tareas completadas del usuario, las de tasks y las archivadas, por fecha de creación"""
+    names = list(TASK_FIELDS)
+    hot, archived = models.Task, models.ArchivedTask
+    combined = union_all(
+        select(*[getattr(hot, name) for name in names]).where(hot.owner_id == owner_id, hot.completed == True),
+        select(*[getattr(archived, name) for name in names]).where(archived.owner_id == owner_id),
+    ).subquery()
+    rows = (await db.execute(select(combined).order_by(combined.c.created_at, combined.c.id))).all()
+    return serialization.rows_to_dicts(names, rows)
+
+
+# ==================== OPERACIONES MASIVAS ====================
+
+def completion_changes(update_data: dict) -> dict:
+    """Añadir los cambios derivados de marcar o desmarcar una tarea como completada"""
+    update_data = dict(update_data)
+    if "completed" in update_data and update_data["completed"]:
+        update_data["completed_at"] = datetime.utcnow()
+        update_data["status"] = "completed"
+    elif "completed" in update_data and not update_data["completed"]:
+        update_data["completed_at"] = None
+        update_data["status"] = "pending"
+    return update_data
+
+
+async def missing_projects(db: AsyncSession, owner_id: int, project_ids) -> set:
+    """Ids de proyecto que no existen o no pertenecen al usuario"""
+    project_ids = {pid for pid in project_ids if pid is not None}
+    if not project_ids:
+        return set()
+    owned = (await db.scalars(
+        select(models.Project.id).where(
+            models.Project.owner_id == owner_id,
+            models.Project.id.in_(project_ids),
+        )
+    )).all()
+    return project_ids - set(owned)
+
+
+def _selection_conditions(owner_id: int, ids: Optional[List[int]], filters: Optional[dict]) -> list:
+    if ids is None and filters is None:
+        raise ValueError("Either ids or filter must be provided")
+    if ids is not None and len(ids) > MAX_BULK_SIZE:
+        raise ValueError(f"At most {MAX_BULK_SIZE} ids per request")
+    conditions = task_filter_conditions(owner_id, **(filters or {}))
+    if ids is not None:
+        conditions.append(models.Task.id.in_(ids))
+    return conditions
+
+
+async def bulk_create_tasks(db: AsyncSession, owner_id: int, tasks: List[dict]) -> List[models.Task]:
+    """Insertar varias tareas con un único INSERT ... RETURNING"""
+    if len(tasks) > MAX_BULK_SIZE:
+        raise ValueError(f"At most {MAX_BULK_SIZE} tasks per request")
+    if not tasks:
+        return []
+    now = datetime.utcnow()
+    seq = await next_change_seq(db, owner_id)
+    rows = [{**task, "owner_id": owner_id, "created_at": now, "change_seq": seq} for task in tasks]
+    created = (await db.scalars(insert(models.Task).returning(models.Task), rows)).all()
+    await refresh_project_counters(db, {task.project_id for task in created})
+    return created
+
+
+async def bulk_update_tasks(
+    db: AsyncSession,
+    owner_id: int,
+    changes: dict,
+    ids: Optional[List[int]] = None,
+    filters: Optional[dict] = None,
+) -> List[int]:
+    """Actualizar las tareas seleccionadas con un único UPDATE ... RETURNING"""
+    if not changes:
+        raise ValueError("No changes provided")
+    conditions = _selection_conditions(owner_id, ids, filters)
+    affects_counters = bool(COUNTER_FIELDS & changes.keys())
+    if affects_counters:
+        projects = await _selected_project_ids(db, conditions)
+    seq = await next_change_seq(db, owner_id)
+    stmt = (
+        update(models.Task)
+        .where(*conditions)
+        .values(**completion_changes(changes), change_seq=seq)
+        .returning(models.Task.id)
+        .execution_options(synchronize_session=False)
+    )
+    task_ids = (await db.scalars(stmt)).all()
+    if affects_counters and task_ids:
+        await refresh_project_counters(db, projects | {changes.get("project_id")})
+    return task_ids
+
+
+async def bulk_delete_tasks(
+    db: AsyncSession,
+    owner_id: int,
+    ids: Optional[List[int]] = None,
+    filters: Optional[dict] = None,
+) -> List[int]:
+    """Borrar las tareas seleccionadas con un único DELETE ... RETURNING"""
+    stmt = (
+        delete(models.Task)
+        .where(*_selection_conditions(owner_id, ids, filters))
+        .returning(models.Task.id, models.Task.project_id)
+        .execution_options(synchronize_session=False)
+    )
+    rows = (await db.execute(stmt)).all()
+    task_ids = [task_id for task_id, _ in rows]
+    await record_deletions(db, owner_id, "task", task_ids)
+    await refresh_project_counters(db, {project_id for _, project_id in rows})
+    return task_ids
+
+
+# ==================== CONTADORES POR PROYECTO ====================
+# project_task_counters permite pintar las tarjetas de proyecto sin recorrer
+# sus tareas. Las escrituras de una tarea aplican la diferencia; las masivas
+# recalculan solo los proyectos afectados.
+
+COUNTER_FIELDS = {"project_id", "completed", "progress"}
+
+
+def counter_snapshot(task) -> dict:
+    """Campos de una tarea que afectan a los contadores de su proyecto"""
+    return {
+        "project_id": task.project_id,
+        "completed": bool(task.completed),
+        "progress": task.progress or 0,
+    }
+
+
+async def adjust_project_counters(db: AsyncSession, before: Optional[dict], after: Optional[dict]) -> None:
+    """Aplicar la diferencia entre dos versiones de una tarea (None = no existe)"""
+    deltas = {}
+    for snapshot, sign in ((before, -1), (after, 1)):
+        if snapshot is None or snapshot["project_id"] is None:
+            continue
+        delta = deltas.setdefault(snapshot["project_id"], [0, 0, 0])
+        delta[0] += sign
+        delta[1] += sign * int(snapshot["completed"])
+        delta[2] += sign * snapshot["progress"]
+    counter = models.ProjectTaskCounter
+    for project_id, (tasks, completed, progress) in deltas.items():
+        if not (tasks or completed or progress):
+            continue
+        await db.execute(
+            update(counter)
+            .where(counter.project_id == project_id)
+            .values(
+                task_count=counter.task_count + tasks,
+                completed_count=counter.completed_count + completed,
+                progress_sum=counter.progress_sum + progress,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def _selected_project_ids(db: AsyncSession, conditions: list) -> set:
+    return set((await db.scalars(
+        select(models.Task.project_id).where(*conditions).distinct()
+    )).all())
+
+
+async def refresh_project_counters(db: AsyncSession, project_ids) -> None:
+    """Recalcular los contadores de varios proyectos con un único UPDATE"""
+    project_ids = {pid for pid in project_ids if pid is not None}
+    if not project_ids:
+        return
+    counter = models.ProjectTaskCounter
+
+    def aggregate(expression, completed_only: bool = False):
+        # Las tareas archivadas siguen contando para su proyecto
+        parts = []
+        for model in (models.Task, models.ArchivedTask):
+            conditions = [model.project_id == counter.project_id]
+            if completed_only:
+                conditions.append(model.completed == True)
+            parts.append(select(expression(model)).where(*conditions).correlate(counter).scalar_subquery())
+        return parts[0] + parts[1]
+
+    await db.execute(
+        update(counter)
+        .where(counter.project_id.in_(project_ids))
+        .values(
+            task_count=aggregate(lambda model: func.count()),
+            completed_count=aggregate(lambda model: func.count(), completed_only=True),
+            progress_sum=aggregate(lambda model: func.coalesce(func.sum(model.progress), 0)),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+# ==================== PROYECTOS CON SUS TAREAS ====================
+# GET /projects?include=task_summary y GET /projects/{id}?include=tasks
+# devuelven los proyectos con sus hijos en un número fijo de consultas, sea
+# cual sea el número de tareas: el resumen sale de project_task_counters con
+# un JOIN y las tareas de una única consulta por project_id.
+
+PROJECT_FIELDS = {name: getattr(models.Project, name) for name in schemas.Project.model_fields}
+PROJECT_INCLUDES = ("task_summary", "tasks")
+
+
+def parse_project_include(include: Optional[str], allowed=PROJECT_INCLUDES) -> set:
+    """Validar ?include=a,b; lanza ValueError si hay valores desconocidos"""
+    if include is None:
+        return set()
+    names = {name.strip() for name in include.split(",") if name.strip()}
+    unknown = names - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown include: {', '.join(sorted(unknown))}")
+    return names
+
+
+def _project_query(include: set):
+    columns = list(PROJECT_FIELDS.values())
+    query = select(*columns)
+    if "task_summary" in include:
+        counter = models.ProjectTaskCounter
+        query = select(
+            *columns,
+            func.coalesce(counter.task_count, 0),
+            func.coalesce(counter.completed_count, 0),
+            func.coalesce(counter.progress_sum, 0),
+        ).outerjoin(counter, counter.project_id == models.Project.id)
+    return query
+
+
+def _project_dict(row, include: set) -> dict:
+    project = dict(zip(PROJECT_FIELDS, row))
+    if "task_summary" in include:
+        task_count, completed_count, progress_sum = row[len(PROJECT_FIELDS):]
+        project["task_summary"] = {
+            "task_count": task_count,
+            "completed_count": completed_count,
+            "completion_rate": completed_count / task_count if task_count else 0.0,
+            "average_progress": progress_sum / task_count if task_count else 0.0,
+        }
+    return project
+
+
+async def list_projects(db: AsyncSession, owner_id: int, include: set = frozenset()) -> List[dict]:
+    """Proyectos del usuario como dicts (una consulta)"""
+    rows = await db.execute(
+        _project_query(include).where(models.Project.owner_id == owner_id).order_by(models.Project.id)
+    )
+    return [_project_dict(row, include) for row in rows]
+
+
+async def get_project(db: AsyncSession, owner_id: int, project_id: int, include: set = frozenset()) -> Optional[dict]:
+    """Un proyecto como dict (una consulta, dos con include=tasks); None si no existe"""
+    row = (await db.execute(
+        _project_query(include).where(models.Project.id == project_id, models.Project.owner_id == owner_id)
+    )).first()
+    if row is None:
+        return None
+    project = _project_dict(row, include)
+    if "tasks" in include:
+        task_rows = await db.execute(
+            select(*TASK_FIELDS.values())
+            .where(models.Task.project_id == project_id, models.Task.owner_id == owner_id)
+            .order_by(models.Task.id)
+        )
+        project["tasks"] = serialization.rows_to_dicts(list(TASK_FIELDS), task_rows)
+    return project
+
+
+# ==================== SINCRONIZACIÓN ====================
+# Cada usuario tiene un contador (users.change_seq) que se incrementa en cada
+# escritura; las filas tocadas guardan el valor en su change_seq y los borrados
+# dejan un tombstone en deleted_records. Un cliente offline pide lo que cambió
+# desde el último número que vio.
+
+SYNC_TASK_COLUMNS = list(schemas.Task.model_fields)
+SYNC_PROJECT_COLUMNS = list(schemas.Project.model_fields)
+MAX_SYNC_PAGE_SIZE = 1000
+
+
+async def next_change_seq(db: AsyncSession, owner_id: int) -> int:
+    """
+    Reservar el siguiente número de cambio del usuario. El UPDATE bloquea la
+    fila del usuario hasta el commit, así que los números se hacen visibles
+    en orden y un cliente no puede saltarse un cambio.
+    """
+    user = models.User
+    return await db.scalar(
+        update(user)
+        .where(user.id == owner_id)
+        .values(change_seq=user.change_seq + 1)
+        .returning(user.change_seq)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def record_deletions(db: AsyncSession, owner_id: int, entity: str, entity_ids, seq: Optional[int] = None) -> None:
+    """Dejar un tombstone por cada registro borrado"""
+    if not entity_ids:
+        return
+    if seq is None:
+        seq = await next_change_seq(db, owner_id)
+    await db.execute(insert(models.DeletedRecord), [
+        {"owner_id": owner_id, "entity": entity, "entity_id": entity_id, "change_seq": seq}
+        for entity_id in entity_ids
+    ])
+
+
+async def record_project_deletion(db: AsyncSession, owner_id: int, project_id: int) -> None:
+    """Tombstones de un proyecto y de las tareas que se borran en cascada con él"""
+    seq = await next_change_seq(db, owner_id)
+    await db.execute(
+        insert(models.DeletedRecord).from_select(
+            ["owner_id", "entity", "entity_id", "change_seq"],
+            select(models.Task.owner_id, literal("task"), models.Task.id, literal(seq))
+            .where(models.Task.project_id == project_id)
+            .union_all(
+                select(models.ArchivedTask.owner_id, literal("task"), models.ArchivedTask.id, literal(seq))
+                .where(models.ArchivedTask.project_id == project_id)
+            ),
+        )
+    )
+    await record_deletions(db, owner_id, "project", [project_id], seq)
+
+
+async def changes_since(db: AsyncSession, owner_id: int, since: int, limit: int) -> dict:
+    """
+    Filas cambiadas y borradas con change_seq > since.
+
+    La página se corta en un número de cambio completo (una operación masiva
+    comparte número), así que ``seq`` siempre es un punto de reanudación seguro.
+    """
+    if limit < 1 or limit > MAX_SYNC_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_SYNC_PAGE_SIZE}")
+    task, project, deleted = models.Task, models.Project, models.DeletedRecord
+
+    seqs = union_all(
+        select(task.change_seq.label("seq")).where(task.owner_id == owner_id, task.change_seq > since),
+        select(project.change_seq).where(project.owner_id == owner_id, project.change_seq > since),
+        select(deleted.change_seq).where(deleted.owner_id == owner_id, deleted.change_seq > since),
+    ).subquery()
+    pending = (await db.scalars(select(seqs.c.seq).order_by(seqs.c.seq).limit(limit + 1))).all()
+    has_more = len(pending) > limit
+    if has_more:
+        # Se corta justo antes del número que no cabe; si un único cambio
+        # tiene más filas que el límite, se envía entero
+        overflow = pending[limit]
+        upto = overflow - 1 if pending[0] < overflow else overflow
+    else:
+        upto = await db.scalar(select(models.User.change_seq).where(models.User.id == owner_id)) or 0
+        upto = max(upto, since)
+
+    def window(column):
+        return column > since, column <= upto
+
+    task_rows = (await db.execute(
+        select(*(getattr(task, name) for name in SYNC_TASK_COLUMNS))
+        .where(task.owner_id == owner_id, *window(task.change_seq))
+        .order_by(task.change_seq, task.id)
+    )).all()
+    project_rows = (await db.execute(
+        select(*(getattr(project, name) for name in SYNC_PROJECT_COLUMNS))
+        .where(project.owner_id == owner_id, *window(project.change_seq))
+        .order_by(project.change_seq, project.id)
+    )).all()
+    deleted_rows = (await db.execute(
+        select(deleted.entity, deleted.entity_id)
+        .where(deleted.owner_id == owner_id, *window(deleted.change_seq))
+        .order_by(deleted.change_seq, deleted.id)
+    )).all()
+
+    return {
+        "seq": upto,
+        "has_more": has_more,
+        "task_columns": SYNC_TASK_COLUMNS,
+        "tasks": [list(row) for row in task_rows],
+        "project_columns": SYNC_PROJECT_COLUMNS,
+        "projects": [list(row) for row in project_rows],
+        "deleted_tasks": [entity_id for entity, entity_id in deleted_rows if entity == "task"],
+        "deleted_projects": [entity_id for entity, entity_id in deleted_rows if entity == "project"],
+    }
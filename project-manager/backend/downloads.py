@@ -0,0 +1,174 @@
+"""
+Respuestas de descarga de adjuntos: ETag fuerte, 304, Range y sendfile.
+
+Como los archivos se guardan por su sha256 nunca cambian, así que el ETag
+es el propio hash y se pueden cachear como "immutable".
+Si hay un proxy delante (nginx, Apache) se le delega el envío del archivo
+con X-Accel-Redirect / X-Sendfile para que use sendfile sin pasar por Python.
+El Content-Type lo elige quien sube el archivo, así que solo las imágenes
+rasterizadas y los PDF se muestran inline; el resto (HTML, SVG...) se descarga
+como attachment y siempre con nosniff, para que nunca se ejecute en el origen
+de la API.
+"""
+
+import os
+import re
+import tempfile
+from typing import Optional
+from urllib.parse import quote
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+import storage
+from http_cache import etag_matches
+
+# Cabecera para delegar el envío al proxy ("X-Accel-Redirect" o "X-Sendfile")
+SENDFILE_HEADER = os.getenv("ATTACHMENT_SENDFILE_HEADER")
+# Prefijo de la location interna del proxy que apunta a UPLOAD_DIR (solo X-Accel-Redirect)
+SENDFILE_PREFIX = os.getenv("ATTACHMENT_SENDFILE_PREFIX", "/protected-uploads/")
+
+CACHE_CONTROL = "private, max-age=31536000, immutable"
+THUMBNAIL_SIZES = (128, 256, 512)
+# Imágenes más grandes no generan miniatura (evita bombas de descompresión)
+THUMBNAIL_MAX_PIXELS = int(os.getenv("THUMBNAIL_MAX_PIXELS", str(50_000_000)))
+# Tipos que se pueden mostrar inline sin ejecutar nada en el navegador
+INLINE_CONTENT_TYPES = frozenset({
+    "image/png", "image/jpeg", "image/gif", "image/webp", "image/avif", "image/bmp",
+    "application/pdf",
+})
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: Optional[str], size: int):
+    """
+    Interpretar un Range de un solo intervalo; devuelve (inicio, fin) inclusivos,
+    None si no hay que aplicar Range, o lanza ValueError si no es satisfacible.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        # Varios intervalos u otras unidades: se sirve el archivo completo
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("Unsatisfiable range")
+    return start, min(end, size - 1)
+
+
+def _iter_file_range(path: str, start: int, end: int):
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = fh.read(min(storage.CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(
+    request: Request,
+    path: str,
+    storage_key: str,
+    etag: str,
+    filename: str,
+    content_type: Optional[str],
+) -> Response:
+    """Responder con el archivo aplicando If-None-Match, Range e If-Range"""
+    media_type = (content_type or "").split(";")[0].strip().lower() or "application/octet-stream"
+    disposition = "inline" if media_type in INLINE_CONTENT_TYPES else "attachment"
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"{disposition}; filename*=UTF-8''{quote(filename)}",
+        "X-Content-Type-Options": "nosniff",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={k: headers[k] for k in ("ETag", "Cache-Control")})
+
+    if SENDFILE_HEADER:
+        # El proxy resuelve Range y condicionales sobre el archivo real
+        target = SENDFILE_PREFIX + storage_key if SENDFILE_HEADER.lower() == "x-accel-redirect" else os.path.abspath(path)
+        headers[SENDFILE_HEADER] = target
+        return Response(status_code=200, headers=headers, media_type=media_type)
+
+    size = os.path.getsize(path)
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range and if_range.strip() != etag:
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        # FileResponse envía el archivo por bloques sin cargarlo en memoria
+        return FileResponse(path, media_type=media_type, headers=headers, stat_result=os.stat(path))
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _iter_file_range(path, start, end), status_code=206, headers=headers, media_type=media_type
+    )
+
+
+# ==================== MINIATURAS ====================
+
+def thumbnail_key(sha256: str, size: int) -> str:
+    return f".thumbs/{sha256[:2]}/{sha256}-{size}.png"
+
+
+def _render_thumbnail(source: str, target: str, size: int) -> bool:
+    try:
+        from PIL import Image
+    except ImportError:
+        return False
+    Image.MAX_IMAGE_PIXELS = THUMBNAIL_MAX_PIXELS
+    try:
+        with Image.open(source) as image:
+            width, height = image.size
+            if width * height > THUMBNAIL_MAX_PIXELS:
+                return False
+            image.thumbnail((size, size))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # Temporal único: dos peticiones pueden generar la misma miniatura a la vez
+            fd, tmp_target = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as fh:
+                    image.save(fh, format="PNG", optimize=True)
+                os.replace(tmp_target, target)
+            except BaseException:
+                os.remove(tmp_target)
+                raise
+    except (OSError, ValueError, Image.DecompressionBombError):
+        # No es una imagen que Pillow sepa leer, o es demasiado grande
+        return False
+    return True
+
+
+async def ensure_thumbnail(source_key: str, sha256: str, size: int) -> Optional[str]:
+    """Ruta de la miniatura (generándola y cacheándola en disco si hace falta)"""
+    key = thumbnail_key(sha256, size)
+    target = storage.storage_path(key)
+    if os.path.exists(target):
+        return key
+    if await run_in_threadpool(_render_thumbnail, storage.storage_path(source_key), target, size):
+        return key
+    return None
@@ -0,0 +1,333 @@
+"""
+Feed de cambios en tiempo real por usuario.
+
+Los endpoints publican un evento después de cada commit (tarea o proyecto
+creado/actualizado/borrado, con los campos cambiados) y los clientes lo
+reciben por SSE o WebSocket. Cada evento lleva una versión creciente por
+usuario; el broker guarda los últimos EVENTS_BUFFER_SIZE para que un cliente
+que se reconecta pida solo lo que se perdió en vez de recargarlo todo.
+
+``InMemoryBroker`` sirve para un único proceso. Con varios workers
+(main.Settings.workers > 1) se usa ``DatabaseBroker``: los eventos se guardan
+en la tabla events, su id es la versión (creciente, aunque no consecutiva por
+usuario) y cada worker la consulta cada EVENTS_POLL_INTERVAL segundos para
+repartir a sus suscriptores lo publicado en cualquier proceso. Se conservan
+EVENTS_RETENTION_SECONDS segundos; pedir algo más antiguo devuelve 410 igual
+que cuando se desborda el buffer en memoria.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, func, or_, select
+
+import database
+import models
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", "1000"))
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "0.5"))
+EVENTS_RETENTION_SECONDS = float(os.getenv("EVENTS_RETENTION_SECONDS", "3600"))
+EVENTS_PRUNE_INTERVAL = 60.0
+# Huecos en los ids (transacciones que confirman fuera de orden) que se siguen buscando
+EVENTS_GAP_TIMEOUT = 5.0
+EVENTS_MAX_GAP = 1000
+
+
+class ResyncRequired(Exception):
+    """La versión pedida ya no está en el buffer: el cliente debe recargar"""
+
+
+class Broker:
+    """Interfaz del broker de eventos"""
+
+    async def publish(self, user_id: int, event_type: str, data: dict) -> dict:
+        raise NotImplementedError
+
+    def subscribe(self, user_id: int) -> "Subscription":
+        raise NotImplementedError
+
+    async def events_since(self, user_id: int, version: int) -> List[dict]:
+        raise NotImplementedError
+
+    async def current_version(self, user_id: int) -> int:
+        raise NotImplementedError
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+
+class Subscription:
+    """Cola de eventos de un cliente conectado"""
+
+    def __init__(self, broker: "InMemoryBroker", user_id: int):
+        self.broker = broker
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+    def push(self, event: dict) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Cliente demasiado lento: se le pide que resincronice
+            self.overflowed = True
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Siguiente evento, o None si vence el timeout (para enviar keepalives)"""
+        if self.overflowed:
+            raise ResyncRequired()
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self.broker._unsubscribe(self)
+
+
+class _UserChannel:
+    def __init__(self):
+        self.version = 0
+        self.buffer = deque(maxlen=EVENTS_BUFFER_SIZE)
+        self.subscribers = set()
+
+
+class InMemoryBroker(Broker):
+    def __init__(self):
+        self._channels = {}
+        self.published = 0
+
+    def _channel(self, user_id: int) -> _UserChannel:
+        channel = self._channels.get(user_id)
+        if channel is None:
+            channel = self._channels[user_id] = _UserChannel()
+        return channel
+
+    async def publish(self, user_id: int, event_type: str, data: dict) -> dict:
+        channel = self._channel(user_id)
+        channel.version += 1
+        event = {
+            "version": channel.version,
+            "type": event_type,
+            "ts": time.time(),
+            "data": jsonable_encoder(data),
+        }
+        channel.buffer.append(event)
+        for subscription in list(channel.subscribers):
+            subscription.push(event)
+        self.published += 1
+        return event
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(self, user_id)
+        self._channel(user_id).subscribers.add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription) -> None:
+        channel = self._channels.get(subscription.user_id)
+        if channel is not None:
+            channel.subscribers.discard(subscription)
+
+    async def events_since(self, user_id: int, version: int) -> List[dict]:
+        channel = self._channel(user_id)
+        if version > channel.version:
+            # Versión de otro proceso o de antes de un reinicio
+            raise ResyncRequired()
+        if version == channel.version:
+            return []
+        oldest = channel.buffer[0]["version"] if channel.buffer else channel.version + 1
+        if version + 1 < oldest:
+            raise ResyncRequired()
+        return [event for event in channel.buffer if event["version"] > version]
+
+    async def current_version(self, user_id: int) -> int:
+        return self._channel(user_id).version
+
+    def stats(self) -> dict:
+        return {
+            "channels": len(self._channels),
+            "subscribers": sum(len(c.subscribers) for c in self._channels.values()),
+            "published": self.published,
+        }
+
+
+class DatabaseBroker(InMemoryBroker):
+    """
+    Broker compartido entre workers a través de la tabla events. Los
+    suscriptores siguen en memoria; solo se comparten los eventos.
+    """
+
+    def __init__(self, poll_interval: float = EVENTS_POLL_INTERVAL):
+        super().__init__()
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._last_id: Optional[int] = None
+        self._gaps: Dict[int, float] = {}  # id no visto -> cuándo se detectó
+        self._pruned_at = 0.0
+        self.polls = 0
+        self.delivered = 0
+
+    @staticmethod
+    def _event(row) -> dict:
+        return {"version": row.id, "type": row.type, "ts": row.ts, "data": row.data}
+
+    async def publish(self, user_id: int, event_type: str, data: dict) -> dict:
+        row = models.Event(owner_id=user_id, type=event_type, ts=time.time(), data=jsonable_encoder(data))
+        try:
+            async with database.AsyncSessionLocal() as db:
+                db.add(row)
+                await db.commit()
+        except Exception:
+            # La escritura ya está confirmada: el cliente lo verá al recargar
+            logger.exception("Error publicando evento", extra={"owner_id": user_id, "type": event_type})
+            return {}
+        self.published += 1
+        if self._wakeup is not None:
+            # Los suscriptores de este worker lo reciben en el siguiente sondeo, ya
+            self._wakeup.set()
+        return self._event(row)
+
+    async def _max_id(self, db) -> int:
+        return await db.scalar(select(func.max(models.Event.id))) or 0
+
+    async def events_since(self, user_id: int, version: int) -> List[dict]:
+        event = models.Event
+        async with database.AsyncSessionLocal() as db:
+            newest = await self._max_id(db)
+            oldest = await db.scalar(select(func.min(event.id))) or newest + 1
+            if version > newest or version + 1 < oldest:
+                # Versión de otra base de datos o de eventos ya purgados
+                raise ResyncRequired()
+            rows = (await db.execute(
+                select(event.id, event.type, event.ts, event.data)
+                .where(event.owner_id == user_id, event.id > version)
+                .order_by(event.id)
+                .limit(EVENTS_BUFFER_SIZE + 1)
+            )).all()
+        if len(rows) > EVENTS_BUFFER_SIZE:
+            raise ResyncRequired()
+        return [self._event(row) for row in rows]
+
+    async def current_version(self, user_id: int) -> int:
+        async with database.AsyncSessionLocal() as db:
+            return await self._max_id(db)
+
+    async def poll(self) -> None:
+        """Repartir a los suscriptores de este worker los eventos nuevos"""
+        event = models.Event
+        now = time.time()
+        self._gaps = {gap: seen for gap, seen in self._gaps.items() if now - seen < EVENTS_GAP_TIMEOUT}
+        async with database.AsyncSessionLocal() as db:
+            if self._last_id is None:
+                self._last_id = await self._max_id(db)
+                return
+            condition = event.id > self._last_id
+            if self._gaps:
+                condition = or_(condition, event.id.in_(list(self._gaps)))
+            rows = (await db.execute(
+                select(event.id, event.owner_id, event.type, event.ts, event.data).where(condition).order_by(event.id)
+            )).all()
+            if now - self._pruned_at >= EVENTS_PRUNE_INTERVAL:
+                # Siempre queda la última fila: su id marca la versión actual
+                await db.execute(delete(event).where(
+                    event.ts < now - EVENTS_RETENTION_SECONDS, event.id < await self._max_id(db)
+                ))
+                await db.commit()
+                self._pruned_at = now
+        for row in rows:
+            if row.id > self._last_id:
+                if row.id - self._last_id - 1 <= EVENTS_MAX_GAP:
+                    for missing in range(self._last_id + 1, row.id):
+                        self._gaps[missing] = now
+                self._last_id = row.id
+            else:
+                self._gaps.pop(row.id, None)
+            channel = self._channels.get(row.owner_id)
+            if channel is None:
+                continue
+            for subscription in list(channel.subscribers):
+                subscription.push(self._event(row))
+                self.delivered += 1
+        self.polls += 1
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("Error leyendo eventos")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": sum(len(c.subscribers) for c in self._channels.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "polls": self.polls,
+        }
+
+
+broker: Broker = InMemoryBroker()
+
+
+def set_broker(new_broker: Broker) -> None:
+    global broker
+    broker = new_broker
+
+
+async def publish(user_id: int, event_type: str, data: dict) -> None:
+    await broker.publish(user_id, event_type, data)
+
+
+async def stream(user_id: int, since: Optional[int] = None, keepalive: float = 15.0) -> AsyncIterator[Optional[dict]]:
+    """
+    Eventos para un cliente: primero los perdidos desde ``since`` y luego los
+    nuevos. Produce None cada ``keepalive`` segundos sin actividad.
+    """
+    subscription = broker.subscribe(user_id)
+    try:
+        # Los perdidos pueden llegar también por la suscripción: no se repiten.
+        # No se descarta por versión menor: con DatabaseBroker un evento de otro
+        # worker puede llegar después de uno con versión mayor
+        replayed = set()
+        if since is not None:
+            for event in await broker.events_since(user_id, since):
+                replayed.add(event["version"])
+                yield event
+        while True:
+            event = await subscription.next(timeout=keepalive)
+            if event is not None and event["version"] in replayed:
+                continue
+            yield event
+    finally:
+        subscription.close()
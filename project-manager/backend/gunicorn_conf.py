@@ -0,0 +1,36 @@
+"""
+Perfil de despliegue con varios workers de uvicorn
+Ejecutar: python migrations.py && gunicorn main:app -c gunicorn_conf.py
+
+Cada worker abre su propio pool: el número máximo de conexiones a Postgres es
+WEB_CONCURRENCY * (DB_POOL_SIZE + DB_MAX_OVERFLOW). Si se supera el
+max_connections del servidor, conviene poner PgBouncer delante y usar
+DB_PGBOUNCER=true para que cada worker no mantenga conexiones propias.
+
+Con PRELOAD_APP=true el maestro importa la app una vez y los workers la
+heredan con fork, así que arrancan más rápido y comparten memoria. Es seguro
+porque importar main no abre conexiones ni arranca hilos: cada worker lo hace
+en su lifespan (ver main.create_app).
+
+Los workers no comparten memoria: workers se exporta como API_WORKERS y, con
+más de uno, main.create_app usa la lista de revocación de sesiones y el feed
+de eventos en la base de datos (SESSION_STORE / EVENT_BROKER=database) y se
+niega a arrancar con los de memoria. Hacen falta las migraciones
+0011_revocations y 0012_events.
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# Los workers lo heredan: main.Settings elige con él los almacenes compartidos
+os.environ["API_WORKERS"] = str(workers)
+worker_class = "uvicorn.workers.UvicornWorker"
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+# Reciclar workers periódicamente para acotar la memoria
+max_requests = int(os.getenv("MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+preload_app = os.getenv("PRELOAD_APP", "false").lower() in ("1", "true", "yes", "on")
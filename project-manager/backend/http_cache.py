@@ -0,0 +1,153 @@
+"""
+Caché HTTP de los endpoints de lectura: ETags débiles, 304 y caché opcional
+de las respuestas ya serializadas.
+
+El ETag se deriva de un número de versión barato de consultar: users.change_seq
+para los listados del usuario y el change_seq de la fila para una tarea o un
+proyecto concretos (ver "SINCRONIZACIÓN" en crud.py). Si coincide con
+If-None-Match se responde 304 sin cargar ni serializar nada. La versión se
+lee siempre del primario (``fresh_version``): con la réplica retrasada, un
+cliente que acaba de escribir recibiría un 304 con el ETag anterior.
+
+Con HTTP_RESPONSE_CACHE_USERS > 0 además se guardan en memoria los bytes JSON
+de las últimas respuestas de cada usuario; las escrituras las invalidan y,
+como cada entrada va ligada a su ETag, una entrada de otra versión (p. ej.
+escrita por otro worker) nunca se sirve.
+"""
+
+import os
+from typing import Awaitable, Callable, Optional, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import database
+import models
+import serialization
+from cache import CacheBackend, MemoryCache
+
+HTTP_RESPONSE_CACHE_USERS = int(os.getenv("HTTP_RESPONSE_CACHE_USERS", "0"))
+HTTP_RESPONSE_CACHE_VARIANTS = int(os.getenv("HTTP_RESPONSE_CACHE_VARIANTS", "32"))
+HTTP_RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("HTTP_RESPONSE_CACHE_TTL_SECONDS", "300"))
+
+# El navegador puede guardar la respuesta pero debe revalidarla siempre
+CACHE_CONTROL = "private, no-cache"
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Comparación débil de If-None-Match (RFC 9110)"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def make_etag(*parts) -> str:
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+async def fresh_version(db: AsyncSession, statement) -> Optional[int]:
+    """
+    Ejecutar la consulta de versión ``statement`` en el primario. Si ``db`` va
+    a la réplica y esta todavía no tiene esa versión, ``db`` pasa al primario
+    para no servir datos antiguos con el ETag nuevo.
+    """
+    if not database.is_replica(db):
+        return await db.scalar(statement)
+    async with database.AsyncSessionLocal() as primary:
+        version = await primary.scalar(statement)
+    if version is not None and (await db.scalar(statement) or 0) < version:
+        await database.use_primary(db)
+    return version
+
+
+async def user_version(db: AsyncSession, user_id: int) -> int:
+    """Versión de todos los datos del usuario (cambia con cada escritura)"""
+    return await fresh_version(db, select(models.User.change_seq).where(models.User.id == user_id)) or 0
+
+
+class ResponseCache:
+    """Respuestas serializadas por usuario: user_id -> {variante: (etag, body, headers)}"""
+
+    def __init__(self, backend: Optional[CacheBackend], max_variants: int = HTTP_RESPONSE_CACHE_VARIANTS):
+        self.backend = backend
+        self.max_variants = max_variants
+
+    def get(self, user_id: int, variant: str, etag: str) -> Optional[Tuple[bytes, dict]]:
+        if self.backend is None:
+            return None
+        entries = self.backend.get(user_id)
+        entry = entries.get(variant) if entries else None
+        if entry is None or entry[0] != etag:
+            return None
+        return entry[1], entry[2]
+
+    def set(self, user_id: int, variant: str, etag: str, body: bytes, headers: dict) -> None:
+        if self.backend is None:
+            return
+        entries = self.backend.get(user_id)
+        if entries is None:
+            entries = {}
+            self.backend.set(user_id, entries)
+        entries.pop(variant, None)
+        while len(entries) >= self.max_variants:
+            # Se descarta la variante más antigua
+            entries.pop(next(iter(entries)))
+        entries[variant] = (etag, body, headers)
+
+    def invalidate(self, user_id: int) -> None:
+        if self.backend is not None:
+            self.backend.delete(user_id)
+
+    def stats(self) -> dict:
+        return self.backend.stats() if self.backend is not None else {}
+
+
+response_cache = ResponseCache(
+    MemoryCache(maxsize=HTTP_RESPONSE_CACHE_USERS, ttl=HTTP_RESPONSE_CACHE_TTL_SECONDS)
+    if HTTP_RESPONSE_CACHE_USERS > 0 else None
+)
+
+
+def invalidate(user_id: int) -> None:
+    """Llamar después de cada escritura que cambie tareas o proyectos del usuario"""
+    response_cache.invalidate(user_id)
+
+
+async def conditional_json(
+    request: Request,
+    user_id: int,
+    etag: str,
+    load: Callable[[], Awaitable[Tuple[object, dict]]],
+) -> Response:
+    """
+    Responder 304 si el cliente ya tiene ``etag``; si no, servir el JSON de la
+    caché o construirlo con ``load()``, que devuelve (contenido, cabeceras extra).
+    """
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+
+    variant = request.url.path + "?" + request.url.query
+    cached = response_cache.get(user_id, variant, etag)
+    if cached is not None:
+        body, extra_headers = cached
+    else:
+        content, extra_headers = await load()
+        body = serialization.dumps(content)
+        response_cache.set(user_id, variant, etag, body, extra_headers)
+
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, **extra_headers}
+    return Response(content=body, media_type="application/json", headers=headers)
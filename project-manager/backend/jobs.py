@@ -0,0 +1,287 @@
+"""
+Trabajos en segundo plano con una cola persistente (tabla jobs).
+
+Los endpoints que pueden tardar mucho encolan un trabajo con ``enqueue`` y
+responden 202 con su id; el cliente sigue el progreso con GET /jobs/{id}.
+Cada proceso de la API arranca JOB_WORKERS workers que reclaman trabajos con
+``SELECT ... FOR UPDATE SKIP LOCKED``: varios procesos pueden compartir la
+cola sin que dos workers cojan el mismo trabajo. Un trabajo cuyo worker deja
+de dar señales durante JOB_LOCK_TIMEOUT segundos (el proceso murió) vuelve a
+estar disponible.
+
+Los handlers se registran con ``@handler(kind)``. Por defecto son corrutinas
+que se ejecutan en el event loop con su propia sesión de base de datos y
+pueden informar del progreso. Los marcados ``blocking=True`` son funciones
+síncronas que se ejecutan en un pool de hilos o de procesos según
+JOB_EXECUTOR (thread o process). Si un handler falla, el trabajo se reintenta
+hasta ``max_attempts`` veces con espera exponencial; por eso los handlers
+deben poder repetirse sin efectos duplicados.
+
+Mientras un handler se ejecuta (también los bloqueantes, que no reciben
+JobContext) el worker renueva el lock cada JOB_HEARTBEAT_INTERVAL segundos.
+Todas las escrituras sobre el trabajo comprueban que sigue siendo el mismo
+intento (``attempts``): si otro worker lo ha reclamado, el antiguo no pisa
+su estado ni su resultado.
+"""
+
+import asyncio
+import os
+import socket
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import database
+import models
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # 0: este proceso no ejecuta trabajos
+JOB_EXECUTOR = os.getenv("JOB_EXECUTOR", "thread")  # thread o process, para handlers bloqueantes
+JOB_EXECUTOR_WORKERS = int(os.getenv("JOB_EXECUTOR_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+JOB_LOCK_TIMEOUT = float(os.getenv("JOB_LOCK_TIMEOUT", "300"))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", str(JOB_LOCK_TIMEOUT / 3)))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "600"))
+# Las operaciones que afectan a más filas que esto se envían a la cola
+JOB_THRESHOLD_ROWS = int(os.getenv("JOB_THRESHOLD_ROWS", "1000"))
+# Filas por transacción dentro de un trabajo
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "1000"))
+
+_handlers: Dict[str, tuple] = {}  # kind -> (función, bloqueante)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _claimed(job_id: int, attempt: int):
+    """Condición de que el trabajo sigue en el intento que tiene este worker"""
+    return and_(models.Job.id == job_id, models.Job.attempts == attempt, models.Job.status == "running")
+
+
+def handler(kind: str, blocking: bool = False):
+    """
+    Registrar el handler de un tipo de trabajo.
+
+    Corrutina: ``async def f(ctx: JobContext, db: AsyncSession, payload: dict) -> Optional[dict]``.
+    Bloqueante: ``def f(payload: dict) -> Optional[dict]`` (con JOB_EXECUTOR=process
+    tiene que ser una función de módulo para poder enviarla a otro proceso).
+    """
+    def register(func: Callable) -> Callable:
+        _handlers[kind] = (func, blocking)
+        return func
+    return register
+
+
+async def enqueue(
+    db: AsyncSession, owner_id: int, kind: str, payload: Optional[dict] = None, max_attempts: int = JOB_MAX_ATTEMPTS
+) -> models.Job:
+    """Añadir un trabajo en la sesión del llamador; queda visible para los workers al hacer commit"""
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = models.Job(
+        owner_id=owner_id, kind=kind, payload=payload or {}, status="queued",
+        progress=0, attempts=0, max_attempts=max_attempts, run_after=_now(),
+    )
+    db.add(job)
+    await db.flush()
+    return job
+
+
+class JobContext:
+    def __init__(self, job: models.Job):
+        self.job_id = job.id
+        self.owner_id = job.owner_id
+        self.attempt = job.attempts
+
+    async def report(self, progress: int) -> None:
+        """Guardar el progreso (0-100); también renueva el lock del trabajo"""
+        async with database.AsyncSessionLocal() as db:
+            await db.execute(
+                update(models.Job)
+                .where(_claimed(self.job_id, self.attempt))
+                .values(progress=max(0, min(100, int(progress))), locked_at=_now())
+            )
+            await db.commit()
+
+
+def _create_executor() -> Executor:
+    if JOB_EXECUTOR == "process":
+        return ProcessPoolExecutor(max_workers=JOB_EXECUTOR_WORKERS)
+    if JOB_EXECUTOR == "thread":
+        return ThreadPoolExecutor(max_workers=JOB_EXECUTOR_WORKERS, thread_name_prefix="job")
+    raise ValueError(f"Unsupported JOB_EXECUTOR: {JOB_EXECUTOR}")
+
+
+class WorkerPool:
+    def __init__(self, workers: int = JOB_WORKERS, poll_interval: float = JOB_POLL_INTERVAL):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._executor: Optional[Executor] = None
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+
+    async def start(self) -> None:
+        if self._tasks or self.workers <= 0:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run_worker()) for _ in range(self.workers)]
+        logger.info("Workers de trabajos arrancados", extra={"workers": self.workers, "worker_id": self.worker_id})
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        # Un trabajo interrumpido queda en running y se reintenta al vencer su lock
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def wake(self) -> None:
+        """Avisar de que hay un trabajo nuevo sin esperar al siguiente sondeo"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run_worker(self) -> None:
+        while True:
+            # Un error de base de datos al reclamar o al guardar el estado no
+            # debe matar al worker: se registra y se vuelve a intentar
+            try:
+                job = await self._claim()
+                if job is not None:
+                    await self._execute(job)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error en el worker de trabajos", extra={"worker_id": self.worker_id})
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self) -> Optional[models.Job]:
+        now = _now()
+        job = models.Job
+        claimable = (
+            select(job.id)
+            .where(or_(
+                and_(job.status == "queued", job.run_after <= now),
+                and_(job.status == "running", job.locked_at < now - timedelta(seconds=JOB_LOCK_TIMEOUT)),
+            ))
+            .order_by(job.run_after, job.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        async with database.AsyncSessionLocal() as db:
+            claimed = await db.scalar(
+                update(job)
+                .where(job.id == claimable)
+                .values(status="running", locked_at=now, attempts=job.attempts + 1)
+                .returning(job)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            return claimed
+
+    async def _execute(self, job: models.Job) -> None:
+        registered = _handlers.get(job.kind)
+        if job.attempts > job.max_attempts:
+            # Reclamado otra vez tras vencer el lock en su último intento
+            if await self._finish(job, status="failed", error="Worker lost", finished_at=_now()):
+                self.failed += 1
+            return
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            if registered is None:
+                raise LookupError(f"No handler for job kind {job.kind}")
+            func, blocking = registered
+            if blocking:
+                if self._executor is None:
+                    self._executor = _create_executor()
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._executor, func, dict(job.payload or {}))
+            else:
+                async with database.AsyncSessionLocal() as db:
+                    result = await func(JobContext(job), db, dict(job.payload or {}))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self._failed(job, e)
+            return
+        finally:
+            heartbeat.cancel()
+        if await self._finish(job, status="succeeded", progress=100, result=result, error=None, finished_at=_now()):
+            self.completed += 1
+            logger.info("Trabajo terminado", extra={"job_id": job.id, "kind": job.kind, "attempt": job.attempts})
+
+    async def _heartbeat(self, job: models.Job) -> None:
+        """Renovar el lock mientras el handler sigue ejecutándose"""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                async with database.AsyncSessionLocal() as db:
+                    await db.execute(update(models.Job).where(_claimed(job.id, job.attempts)).values(locked_at=_now()))
+                    await db.commit()
+            except Exception:
+                logger.warning("No se pudo renovar el lock del trabajo", exc_info=True, extra={"job_id": job.id})
+
+    async def _failed(self, job: models.Job, error: Exception) -> None:
+        detail = f"{error.__class__.__name__}: {error}"
+        if job.attempts < job.max_attempts and job.kind in _handlers:
+            delay = min(JOB_RETRY_BASE_SECONDS * 2 ** (job.attempts - 1), JOB_RETRY_MAX_SECONDS)
+            if not await self._finish(
+                job, status="queued", error=detail, locked_at=None, run_after=_now() + timedelta(seconds=delay)
+            ):
+                return
+            self.retried += 1
+            logger.warning(
+                "Trabajo fallido, se reintentará",
+                exc_info=error, extra={"job_id": job.id, "kind": job.kind, "attempt": job.attempts, "retry_in": delay},
+            )
+        else:
+            if not await self._finish(job, status="failed", error=detail, finished_at=_now()):
+                return
+            self.failed += 1
+            logger.error(
+                "Trabajo fallido definitivamente",
+                exc_info=error, extra={"job_id": job.id, "kind": job.kind, "attempt": job.attempts},
+            )
+
+    async def _finish(self, job: models.Job, **values) -> bool:
+        """Guardar el estado del intento; False si otro worker ya lo ha reclamado"""
+        async with database.AsyncSessionLocal() as db:
+            result = await db.execute(update(models.Job).where(_claimed(job.id, job.attempts)).values(**values))
+            await db.commit()
+        if result.rowcount == 0:
+            logger.warning(
+                "Trabajo reclamado por otro worker: se descarta este intento",
+                extra={"job_id": job.id, "kind": job.kind, "attempt": job.attempts},
+            )
+            return False
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._tasks),
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+
+pool = WorkerPool()
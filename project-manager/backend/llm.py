@@ -0,0 +1,152 @@
+"""
+Acceso al modelo de lenguaje del chat.
+
+El backend es intercambiable: Gemini en producción y un stub local para
+tests y benchmarks (LLM_BACKEND=stub). Las llamadas pasan por un límite de
+concurrencia y por una caché de respuestas indexada por el prompt.
+"""
+
+import asyncio
+import hashlib
+import os
+from typing import AsyncIterator, Optional
+
+from cache import MemoryCache
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-pro")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "600"))
+LLM_CACHE_MAX_SIZE = int(os.getenv("LLM_CACHE_MAX_SIZE", "1000"))
+
+
+class LLMBackend:
+    """Interfaz de un proveedor de LLM"""
+
+    name = "unknown"
+
+    async def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        # Por defecto, una sola pieza con la respuesta completa
+        yield await self.generate(prompt)
+
+
+class GeminiBackend(LLMBackend):
+    def __init__(self, api_key: str, model_name: str = GEMINI_MODEL):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.name = model_name
+        # Una única instancia del modelo reutilizada entre peticiones
+        self.model = genai.GenerativeModel(model_name)
+
+    async def generate(self, prompt: str) -> str:
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+class StubBackend(LLMBackend):
+    """Backend local determinista, sin red"""
+
+    name = "stub"
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+
+    async def generate(self, prompt: str) -> str:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        message = prompt.rsplit("user:", 1)[-1].split("\n")[0].strip()
+        return f"[stub] {message}"
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        text = await self.generate(prompt)
+        for word in text.split(" "):
+            yield word + " "
+
+
+def create_backend(name: str = LLM_BACKEND) -> Optional[LLMBackend]:
+    if name == "stub":
+        return StubBackend(delay=float(os.getenv("LLM_STUB_DELAY", "0")))
+    if name == "gemini":
+        if not GEMINI_API_KEY:
+            logger.warning("GEMINI_API_KEY no encontrada. El chat con IA no funcionará.")
+            return None
+        backend = GeminiBackend(GEMINI_API_KEY)
+        logger.info("Gemini API configurada correctamente", extra={"model": GEMINI_MODEL})
+        return backend
+    raise ValueError(f"Unknown LLM backend: {name}")
+
+
+_backend: Optional[LLMBackend] = None
+_backend_loaded = False
+_semaphore: Optional[asyncio.Semaphore] = None
+
+response_cache = MemoryCache(maxsize=LLM_CACHE_MAX_SIZE, ttl=LLM_CACHE_TTL_SECONDS)
+
+
+def get_backend() -> Optional[LLMBackend]:
+    """Backend configurado, creado en la primera petición de chat"""
+    global _backend, _backend_loaded
+    if not _backend_loaded:
+        _backend = create_backend()
+        _backend_loaded = True
+    return _backend
+
+
+def set_backend(backend: Optional[LLMBackend]) -> None:
+    """Sustituir el backend (p. ej. por StubBackend en tests)"""
+    global _backend, _backend_loaded
+    _backend = backend
+    _backend_loaded = True
+    response_cache.clear()
+
+
+def _limiter() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _semaphore
+
+
+def _cache_key(backend: LLMBackend, prompt: str) -> str:
+    return backend.name + ":" + hashlib.sha256(prompt.encode()).hexdigest()
+
+
+async def complete(backend: LLMBackend, prompt: str) -> str:
+    """Respuesta completa, desde la caché si el prompt ya se respondió"""
+    key = _cache_key(backend, prompt)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+    async with _limiter():
+        text = await backend.generate(prompt)
+    response_cache.set(key, text)
+    return text
+
+
+async def stream(backend: LLMBackend, prompt: str) -> AsyncIterator[str]:
+    """Piezas de la respuesta según llegan; la respuesta completa se cachea al final"""
+    key = _cache_key(backend, prompt)
+    cached = response_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    async with _limiter():
+        async for part in backend.stream(prompt):
+            parts.append(part)
+            yield part
+    response_cache.set(key, "".join(parts))
@@ -0,0 +1,90 @@
+"""
+Logging estructurado y no bloqueante.
+
+Los módulos piden su logger con ``get_logger(__name__)`` y pasan los datos de
+contexto en ``extra``. Los registros van a una cola en memoria
+(``QueueHandler``) y un hilo aparte (``QueueListener``) los formatea y
+escribe en stderr, así que loguear desde el event loop nunca espera a la E/S.
+
+LOG_FORMAT=json (por defecto) emite una línea JSON por registro con todos los
+campos de ``extra``; LOG_FORMAT=text da un formato legible para desarrollo.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+
+# Atributos propios de LogRecord: el resto vienen de ``extra``
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = {k: v for k, v in record.__dict__.items() if k not in _RESERVED and not k.startswith("_")}
+        if fields:
+            text += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return text
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # El QueueHandler estándar formatea el mensaje en el hilo que loguea y
+        # descarta los args; aquí solo se resuelve la excepción a texto y el
+        # formateo completo se deja al hilo del listener
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener = None
+
+
+def setup_logging() -> None:
+    """Instalar la cola en el logger raíz (idempotente)"""
+    global _listener
+    if _listener is not None:
+        return
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JSONFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.addHandler(_QueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
@@ -0,0 +1,332 @@
+"""
+Instrumentación de peticiones y consultas SQL.
+
+- ``MetricsMiddleware`` mide la latencia de cada petición por método y ruta
+  (la plantilla, "/tasks/{task_id}", no la URL concreta) en histogramas.
+- ``instrument_engine`` engancha eventos de SQLAlchemy al motor: cuenta las
+  consultas y su tiempo por petición, avisa cuando una misma sentencia se
+  repite muchas veces en una petición (patrón N+1) y registra las consultas
+  lentas con sus parámetros y el plan de EXPLAIN.
+- ``render`` produce el formato de texto de Prometheus para GET /metrics,
+  incluidas las estadísticas que los demás módulos registran con
+  ``register_stats`` (cachés, pools, broker...).
+
+Las métricas son por proceso: con varios workers cada uno expone las suyas y
+Prometheus las agrega por instancia.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event
+
+from cache import MemoryCache
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() in ("1", "true", "yes", "on")
+SLOW_QUERY_LOG_PARAMS = os.getenv("SLOW_QUERY_LOG_PARAMS", "true").lower() in ("1", "true", "yes", "on")
+# Cada sentencia lenta se explica como mucho una vez en este intervalo
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+# Veces que una misma sentencia puede repetirse en una petición antes de avisar
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# ==================== MÉTRICAS ====================
+
+LabelValues = Tuple[str, ...]
+
+
+class CounterMetric:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def collect(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield f"{self.name}{_labels(self.labels, label_values)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # etiquetas -> [cuentas por bucket..., +Inf], suma
+        self._series: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def totals(self, *label_values: str) -> Tuple[int, float]:
+        """(observaciones, suma) de una serie"""
+        with self._lock:
+            series = self._series.get(label_values)
+            return (sum(series[0]), series[1]) if series is not None else (0, 0.0)
+
+    def collect(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for label_values, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                yield f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + (le,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Iterable) -> str:
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+http_requests = CounterMetric("http_requests_total", "Peticiones HTTP atendidas", ("method", "route", "status"))
+http_latency = Histogram("http_request_duration_seconds", "Latencia de las peticiones HTTP", ("method", "route"))
+request_queries = Histogram(
+    "http_request_db_queries", "Consultas SQL por petición", ("route",), buckets=QUERY_COUNT_BUCKETS
+)
+request_db_time = Histogram("http_request_db_seconds", "Tiempo en consultas SQL por petición", ("route",))
+query_latency = Histogram("db_query_duration_seconds", "Duración de cada consulta SQL")
+slow_queries = CounterMetric("db_slow_queries_total", "Consultas por encima de SLOW_QUERY_MS")
+n_plus_one = CounterMetric("db_n_plus_one_total", "Peticiones con una sentencia repetida N+1", ("route",))
+
+_METRICS = [http_requests, http_latency, request_queries, request_db_time, query_latency, slow_queries, n_plus_one]
+
+# Estadísticas de otros módulos: (prefijo, función, etiquetas fijas, etiqueta para dicts anidados)
+_stats_sources = []
+
+
+def register_stats(prefix: str, source: Callable[[], dict], group_label: Optional[str] = None, **labels: str) -> None:
+    """
+    Exponer como gauges los valores numéricos de ``source()``. Si ``source``
+    devuelve un dict de dicts (p. ej. un pool por motor), la clave exterior va
+    en la etiqueta ``group_label``.
+    """
+    _stats_sources.append((prefix, source, group_label, labels))
+
+
+def _collect_stats() -> Iterable[str]:
+    series: Dict[str, list] = {}
+    for prefix, source, group_label, labels in _stats_sources:
+        try:
+            stats = source() or {}
+        except Exception:
+            logger.exception("Error leyendo estadísticas", extra={"source": prefix})
+            continue
+        groups = stats.items() if group_label else [(None, stats)]
+        for group, values in groups:
+            if not isinstance(values, dict):
+                continue
+            extra = dict(labels, **({group_label: group} if group_label else {}))
+            for key, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    series.setdefault(f"{prefix}_{key}", []).append((extra, value))
+    for name, samples in series.items():
+        yield f"# TYPE {name} gauge"
+        for extra, value in samples:
+            yield f"{name}{_labels(tuple(extra), extra.values())} {_number(value)}"
+
+
+def render() -> str:
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.collect())
+    lines.extend(_collect_stats())
+    return "\n".join(lines) + "\n"
+
+# ==================== CONSULTAS POR PETICIÓN ====================
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = Counter()
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+# Las consultas de EXPLAIN no se cuentan ni se vuelven a explicar
+_explaining: ContextVar[bool] = ContextVar("explaining", default=False)
+_explained = MemoryCache(maxsize=1024, ttl=SLOW_QUERY_EXPLAIN_INTERVAL)
+
+
+def _truncate(value, limit: int = 1000) -> str:
+    text = repr(value)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def instrument_engine(async_engine) -> None:
+    """Enganchar los eventos de consulta al motor asíncrono"""
+    sync_engine = async_engine.sync_engine
+    dialect = sync_engine.dialect.name
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+        if _explaining.get():
+            return
+        query_latency.observe(elapsed)
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+            stats.statements[statement] += 1
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            slow_queries.inc()
+            _report_slow_query(async_engine, dialect, statement, parameters, elapsed, executemany)
+
+
+def _report_slow_query(async_engine, dialect, statement, parameters, elapsed, executemany) -> None:
+    fields = {
+        "duration_ms": round(elapsed * 1000, 2),
+        "statement": statement,
+        "params": _truncate(parameters) if SLOW_QUERY_LOG_PARAMS else None,
+    }
+    explain_prefix = {"postgresql": "EXPLAIN ", "sqlite": "EXPLAIN QUERY PLAN "}.get(dialect)
+    can_explain = (
+        SLOW_QUERY_EXPLAIN
+        and explain_prefix is not None
+        and not executemany
+        and statement.lstrip()[:6].upper() in ("SELECT", "WITH")
+        and _explained.get(statement) is None
+    )
+    if not can_explain:
+        logger.warning("Consulta lenta", extra=fields)
+        return
+    _explained.set(statement, True)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        logger.warning("Consulta lenta", extra=fields)
+        return
+    # El plan se pide en otra conexión y fuera de la petición: si EXPLAIN
+    # fallara no debe abortar la transacción en curso ni retrasar la respuesta
+    loop.create_task(_explain_and_log(async_engine, explain_prefix + statement, parameters, fields))
+
+
+async def _explain_and_log(async_engine, explain_sql: str, parameters, fields: dict) -> None:
+    _explaining.set(True)
+    try:
+        async with async_engine.connect() as conn:
+            result = await conn.exec_driver_sql(explain_sql, parameters)
+            fields["plan"] = "\n".join(" ".join(str(col) for col in row) for row in result)
+    except Exception as e:
+        fields["plan_error"] = str(e)
+    logger.warning("Consulta lenta", extra=fields)
+
+# ==================== MIDDLEWARE ====================
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._routes = None  # endpoint -> plantilla de la ruta
+
+    def _route_template(self, scope) -> str:
+        route = scope.get("route")
+        if route is not None and getattr(route, "path", None):
+            return route.path
+        if self._routes is None:
+            self._routes = {}
+            for route in getattr(scope.get("app"), "routes", []):
+                endpoint = getattr(route, "endpoint", None) or getattr(route, "app", None)
+                if endpoint is not None:
+                    self._routes.setdefault(endpoint, route.path)
+        # Sin ruta (404) se agrupa todo para no crear una serie por URL
+        return self._routes.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            route = self._route_template(scope)
+            method = scope["method"]
+            http_requests.inc(method, route, str(status_code))
+            http_latency.observe(elapsed, method, route)
+            request_queries.observe(stats.queries, route)
+            request_db_time.observe(stats.db_seconds, route)
+            repeated = [(stmt, n) for stmt, n in stats.statements.items() if n >= N_PLUS_ONE_THRESHOLD]
+            if repeated:
+                n_plus_one.inc(route)
+                statement, times = max(repeated, key=lambda item: item[1])
+                logger.warning(
+                    "Posible N+1: sentencia repetida en una petición",
+                    extra={"method": method, "route": route, "times": times, "statement": statement[:500]},
+                )
+            logger.debug(
+                "Petición atendida",
+                extra={
+                    "method": method,
+                    "route": route,
+                    "status": status_code,
+                    "duration_ms": round(elapsed * 1000, 2),
+                    "queries": stats.queries,
+                    "db_ms": round(stats.db_seconds * 1000, 2),
+                },
+            )
@@ -0,0 +1,648 @@
+"""
+Migraciones versionadas del esquema
+Ejecutar: python migrations.py           (aplica las revisiones pendientes)
+          python migrations.py status    (lista las revisiones y su estado)
+
+Las revisiones aplicadas se guardan en schema_migrations. Cada revisión es una
+lista de pasos idempotentes; al terminar un paso se marca en
+migration_checkpoints, y los rellenos de datos guardan allí la última clave
+procesada después de cada lote, así que una migración interrumpida continúa
+donde se quedó al relanzar el script.
+
+Para no bloquear la tabla mientras la aplicación sigue escribiendo:
+- los rellenos (Backfill) recorren la tabla por clave primaria en lotes de
+  MIGRATION_BATCH_SIZE filas, cada uno en su propia transacción y con una
+  pausa de MIGRATION_BATCH_SLEEP segundos entre lotes;
+- los índices se crean con CREATE INDEX CONCURRENTLY en Postgres;
+- las sentencias DDL llevan un lock_timeout corto (MIGRATION_LOCK_TIMEOUT):
+  si no consiguen el lock fallan en vez de dejar en cola a las consultas.
+
+Una base de datos vacía se crea directamente desde models.py y se marcan todas
+las revisiones como aplicadas. La aplicación ya no crea tablas al arrancar:
+este script se ejecuta antes de desplegar.
+"""
+
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+from sqlalchemy import (
+    BigInteger, Boolean, Column, DateTime, Integer, MetaData, String, Table,
+    create_engine, func, insert, inspect, select, text,
+)
+from sqlalchemy.engine import Connection, Engine
+
+from database import DATABASE_URL
+import models
+import search  # Registra el DDL de búsqueda para create_all / Table.create
+
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "1000"))
+MIGRATION_BATCH_SLEEP = float(os.getenv("MIGRATION_BATCH_SLEEP", "0.05"))
+MIGRATION_LOCK_TIMEOUT = os.getenv("MIGRATION_LOCK_TIMEOUT", "5s")
+
+# ==================== TABLAS DE CONTROL ====================
+
+control_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations", control_metadata,
+    Column("revision", String, primary_key=True),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+migration_checkpoints = Table(
+    "migration_checkpoints", control_metadata,
+    Column("revision", String, primary_key=True),
+    Column("step", Integer, primary_key=True),
+    Column("last_key", BigInteger, nullable=True),  # Último id procesado de un relleno
+    Column("done", Boolean, nullable=False, default=False),
+    Column("updated_at", DateTime(timezone=True), server_default=func.now(), onupdate=func.now()),
+)
+
+
+class Context:
+    """Estado del paso en curso: conexión a la base de datos y checkpoint"""
+
+    def __init__(self, engine: Engine, revision: str, step: int):
+        self.engine = engine
+        self.revision = revision
+        self.step = step
+
+    @property
+    def dialect(self) -> str:
+        return self.engine.dialect.name
+
+    def _checkpoint_row(self, conn: Connection):
+        return conn.execute(
+            migration_checkpoints.select().where(
+                migration_checkpoints.c.revision == self.revision,
+                migration_checkpoints.c.step == self.step,
+            )
+        ).first()
+
+    def checkpoint(self, conn: Connection):
+        row = self._checkpoint_row(conn)
+        return row.last_key if row is not None else None
+
+    def save_checkpoint(self, conn: Connection, last_key: Optional[int] = None, done: bool = False) -> None:
+        """Guardar el progreso dentro de la transacción del lote"""
+        values = {"last_key": last_key, "done": done}
+        if self._checkpoint_row(conn) is None:
+            conn.execute(insert(migration_checkpoints).values(revision=self.revision, step=self.step, **values))
+        else:
+            conn.execute(
+                migration_checkpoints.update()
+                .where(
+                    migration_checkpoints.c.revision == self.revision,
+                    migration_checkpoints.c.step == self.step,
+                )
+                .values(**values)
+            )
+
+    def is_done(self) -> bool:
+        with self.engine.connect() as conn:
+            row = self._checkpoint_row(conn)
+        return row is not None and row.done
+
+    def begin(self):
+        """Transacción con lock_timeout corto para DDL"""
+        conn = self.engine.connect()
+        if self.dialect == "postgresql":
+            conn.execute(text(f"SET lock_timeout = '{MIGRATION_LOCK_TIMEOUT}'"))
+        return conn
+
+
+# ==================== PASOS ====================
+
+class Step:
+    def describe(self) -> str:
+        return self.__class__.__name__
+
+    def run(self, ctx: Context) -> None:
+        raise NotImplementedError
+
+
+class SQL(Step):
+    """Sentencias en una transacción; con ``dialect`` solo se ejecutan en esa base de datos"""
+
+    def __init__(self, *statements: str, dialect: Optional[str] = None):
+        self.statements = statements
+        self.dialect = dialect
+
+    def describe(self) -> str:
+        return " ".join(self.statements[0].split())[:70]
+
+    def run(self, ctx: Context) -> None:
+        if self.dialect and ctx.dialect != self.dialect:
+            return
+        with ctx.begin() as conn:
+            for statement in self.statements:
+                conn.exec_driver_sql(statement)
+            conn.commit()
+
+
+class CreateTables(Step):
+    """Crear tablas de models.py que no existan (con el DDL enganchado a after_create)"""
+
+    def __init__(self, *models_):
+        self.tables = [model.__table__ for model in models_]
+
+    def describe(self) -> str:
+        return "Crear " + ", ".join(table.name for table in self.tables)
+
+    def run(self, ctx: Context) -> None:
+        with ctx.begin() as conn:
+            for table in self.tables:
+                table.create(bind=conn, checkfirst=True)
+            conn.commit()
+
+
+class SetNotNull(Step):
+    """
+    NOT NULL sin bloquear la tabla durante el escaneo: en Postgres se valida
+    antes un CHECK NOT VALID (solo necesita un lock ligero) y SET NOT NULL lo
+    aprovecha en vez de recorrer la tabla con un lock exclusivo.
+    """
+
+    def __init__(self, table: str, column: str):
+        self.table = table
+        self.column = column
+
+    def describe(self) -> str:
+        return f"{self.table}.{self.column} NOT NULL"
+
+    def run(self, ctx: Context) -> None:
+        with ctx.engine.connect() as conn:
+            columns = {c["name"]: c for c in inspect(conn).get_columns(self.table)}
+        if not columns[self.column]["nullable"] or ctx.dialect != "postgresql":
+            return
+        constraint = f"{self.table}_{self.column}_not_null"
+        with ctx.begin() as conn:
+            conn.exec_driver_sql(f"ALTER TABLE {self.table} DROP CONSTRAINT IF EXISTS {constraint}")
+            conn.exec_driver_sql(
+                f"ALTER TABLE {self.table} ADD CONSTRAINT {constraint} CHECK ({self.column} IS NOT NULL) NOT VALID"
+            )
+            conn.commit()
+        with ctx.begin() as conn:
+            conn.exec_driver_sql(f"ALTER TABLE {self.table} VALIDATE CONSTRAINT {constraint}")
+            conn.commit()
+        with ctx.begin() as conn:
+            conn.exec_driver_sql(f"ALTER TABLE {self.table} ALTER COLUMN {self.column} SET NOT NULL")
+            conn.exec_driver_sql(f"ALTER TABLE {self.table} DROP CONSTRAINT {constraint}")
+            conn.commit()
+
+
+class CascadeForeignKey(Step):
+    """
+    Pasar una FK a ON DELETE CASCADE. En Postgres la nueva restricción se crea
+    NOT VALID (sin recorrer la tabla) y se valida después con un lock que no
+    bloquea las escrituras. SQLite no permite cambiar una FK sin reconstruir
+    la tabla: las bases de datos de desarrollo creadas antes hay que recrearlas.
+    """
+
+    def __init__(self, table: str, column: str, referred: str):
+        self.table = table
+        self.column = column
+        self.referred = referred
+
+    def describe(self) -> str:
+        return f"{self.table}.{self.column} ON DELETE CASCADE"
+
+    def run(self, ctx: Context) -> None:
+        if ctx.dialect != "postgresql":
+            return
+        with ctx.engine.connect() as conn:
+            foreign_keys = inspect(conn).get_foreign_keys(self.table)
+        current = next((fk for fk in foreign_keys if fk["constrained_columns"] == [self.column]), None)
+        name = f"{self.table}_{self.column}_fkey"
+        if current is not None and (current.get("options") or {}).get("ondelete", "").upper() == "CASCADE":
+            # Ya cambiada (quizá en un intento anterior): solo falta validarla
+            name = current["name"]
+        else:
+            with ctx.begin() as conn:
+                if current is not None:
+                    conn.exec_driver_sql(f"ALTER TABLE {self.table} DROP CONSTRAINT {current['name']}")
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {self.table} ADD CONSTRAINT {name} FOREIGN KEY ({self.column}) "
+                    f"REFERENCES {self.referred} (id) ON DELETE CASCADE NOT VALID"
+                )
+                conn.commit()
+        with ctx.begin() as conn:
+            conn.exec_driver_sql(f"ALTER TABLE {self.table} VALIDATE CONSTRAINT {name}")
+            conn.commit()
+
+
+_CREATE_INDEX_RE = re.compile(
+    r"^\s*CREATE\s+(UNIQUE\s+)?INDEX\s+IF\s+NOT\s+EXISTS\s+(\w+)\s+ON\s+(\w+)\s+(.*)$", re.IGNORECASE | re.DOTALL
+)
+
+
+class ConcurrentIndex(Step):
+    """
+    Índice creado sin bloquear escrituras (CONCURRENTLY en Postgres). Si una
+    ejecución anterior se interrumpió y dejó el índice inválido, se borra y se
+    vuelve a crear; si ya hay otro índice sobre las mismas columnas no se crea.
+    """
+
+    def __init__(self, name: str, table: str, definition: str, unique: bool = False, dialect: Optional[str] = None):
+        self.name = name
+        self.table = table
+        self.definition = definition  # "(col1, col2)" o "USING GIN (col)"
+        self.unique = unique
+        self.dialect = dialect
+
+    @classmethod
+    def from_model(cls, index) -> "ConcurrentIndex":
+        columns = ", ".join(column.name for column in index.columns)
+        return cls(index.name, index.table.name, f"({columns})", unique=bool(index.unique))
+
+    @classmethod
+    def from_sql(cls, statement: str, dialect: Optional[str] = None) -> "ConcurrentIndex":
+        match = _CREATE_INDEX_RE.match(statement)
+        if not match:
+            raise ValueError(f"Not a CREATE INDEX IF NOT EXISTS statement: {statement}")
+        unique, name, table, definition = match.groups()
+        return cls(name, table, definition.strip(), unique=bool(unique), dialect=dialect)
+
+    def describe(self) -> str:
+        return f"Índice {self.name}"
+
+    def _equivalent_exists(self, ctx: Context) -> bool:
+        match = re.match(r"^\(([\w\s,]+)\)$", self.definition)
+        if not match:
+            return False
+        columns = [column.strip() for column in match.group(1).split(",")]
+        with ctx.engine.connect() as conn:
+            indexes = inspect(conn).get_indexes(self.table)
+        return any(
+            index["name"] != self.name and index["column_names"] == columns and bool(index["unique"]) == self.unique
+            for index in indexes
+        )
+
+    def run(self, ctx: Context) -> None:
+        if self.dialect and ctx.dialect != self.dialect:
+            return
+        if self._equivalent_exists(ctx):
+            return
+        unique = "UNIQUE " if self.unique else ""
+        if ctx.dialect != "postgresql":
+            with ctx.engine.connect() as conn:
+                conn.exec_driver_sql(
+                    f"CREATE {unique}INDEX IF NOT EXISTS {self.name} ON {self.table} {self.definition}"
+                )
+                conn.commit()
+            return
+
+        # CONCURRENTLY no puede ir dentro de una transacción
+        with ctx.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            valid = conn.execute(text("""
+                SELECT i.indisvalid
+                FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = :name
+            """), {"name": self.name}).scalar()
+            if valid is False:
+                conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {self.name}")
+            conn.exec_driver_sql(
+                f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {self.name} ON {self.table} {self.definition}"
+            )
+
+
+class Backfill(Step):
+    """
+    Relleno de datos por lotes ordenados por clave primaria.
+
+    Cada lote cubre las filas con ``last < key <= upto``, donde ``upto`` es la
+    clave de la fila número ``batch_size`` a partir de ``last``. El lote se
+    procesa con ``sql`` (sentencia con los parámetros :last y :upto), con
+    ``set_sql``/``where`` (UPDATE de la tabla) o con ``handler(conn, last, upto)``.
+    """
+
+    def __init__(
+        self,
+        table: str,
+        set_sql: Optional[str] = None,
+        where: str = "TRUE",
+        sql: Optional[str] = None,
+        handler: Optional[Callable[[Connection, int, int], None]] = None,
+        key: str = "id",
+        batch_size: Optional[int] = None,
+        description: Optional[str] = None,
+        when: Optional[Callable[[Connection], bool]] = None,
+        dialect: Optional[str] = None,
+    ):
+        if set_sql is not None:
+            sql = f"UPDATE {table} SET {set_sql} WHERE {key} > :last AND {key} <= :upto AND ({where})"
+        if sql is None and handler is None:
+            raise ValueError("Backfill needs set_sql, sql or handler")
+        self.table = table
+        self.sql = sql
+        self.handler = handler
+        self.key = key
+        self.batch_size = batch_size
+        self.description = description
+        self.when = when
+        self.dialect = dialect
+
+    def describe(self) -> str:
+        return self.description or f"Rellenar {self.table}"
+
+    def run(self, ctx: Context) -> None:
+        if self.dialect and ctx.dialect != self.dialect:
+            return
+        batch_size = self.batch_size or MIGRATION_BATCH_SIZE
+        with ctx.engine.connect() as conn:
+            if self.when is not None and not self.when(conn):
+                return
+            last = ctx.checkpoint(conn) or 0
+        processed = 0
+        while True:
+            with ctx.begin() as conn:
+                upto = conn.execute(text(
+                    f"SELECT max({self.key}) FROM ("
+                    f"SELECT {self.key} FROM {self.table} WHERE {self.key} > :last "
+                    f"ORDER BY {self.key} LIMIT :limit) batch"
+                ), {"last": last, "limit": batch_size}).scalar()
+                if upto is None:
+                    break
+                if self.handler is not None:
+                    self.handler(conn, last, upto)
+                else:
+                    conn.execute(text(self.sql), {"last": last, "upto": upto})
+                ctx.save_checkpoint(conn, last_key=upto)
+                conn.commit()
+            processed += 1
+            last = upto
+            if processed % 10 == 0:
+                print(f"      ... {self.table}: hasta {self.key}={last}")
+            if MIGRATION_BATCH_SLEEP:
+                time.sleep(MIGRATION_BATCH_SLEEP)
+
+
+class Migration:
+    def __init__(self, revision: str, description: str, steps: List[Step]):
+        self.revision = revision
+        self.description = description
+        self.steps = steps
+
+
+# ==================== REVISIONES ====================
+
+def _convert_task_notes(conn: Connection, last: int, upto: int) -> None:
+    """Pasar los blobs JSON de notes/critical_points de un lote de tareas a filas"""
+
+    def parse_items(blob):
+        if not blob or not blob.strip():
+            return []
+        try:
+            items = json.loads(blob)
+        except ValueError:
+            # Texto libre: una sola nota
+            return [{"text": blob}]
+        if not isinstance(items, list):
+            items = [items]
+        return [item if isinstance(item, dict) else {"text": str(item)} for item in items]
+
+    def parse_timestamp(value):
+        try:
+            parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return datetime.now(timezone.utc)
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+    rows = conn.execute(text("""
+        SELECT id, notes, critical_points FROM tasks
+        WHERE id > :last AND id <= :upto AND (notes IS NOT NULL OR critical_points IS NOT NULL)
+    """), {"last": last, "upto": upto}).all()
+    notes, points = [], []
+    for task_id, notes_blob, points_blob in rows:
+        for item in parse_items(notes_blob):
+            if str(item.get("text") or "").strip():
+                notes.append({
+                    "task_id": task_id,
+                    "text": str(item["text"]),
+                    "created_at": parse_timestamp(item.get("timestamp")),
+                })
+        for item in parse_items(points_blob):
+            if str(item.get("text") or "").strip():
+                points.append({"task_id": task_id, "text": str(item["text"]), "resolved": bool(item.get("resolved"))})
+    if notes:
+        conn.execute(insert(models.TaskNote.__table__), notes)
+    if points:
+        conn.execute(insert(models.TaskCriticalPoint.__table__), points)
+
+
+def _has_column(table: str, column: str) -> Callable[[Connection], bool]:
+    return lambda conn: column in {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def _task_indexes(*names: str) -> List[Step]:
+    indexes = {index.name: index for index in models.Task.__table__.indexes}
+    return [ConcurrentIndex.from_model(indexes[name]) for name in names]
+
+
+def _postgres_search_steps(statements: List[str]) -> List[Step]:
+    """DDL de search.py separando los índices para crearlos de forma concurrente"""
+    steps = []
+    for statement in statements:
+        if _CREATE_INDEX_RE.match(statement):
+            steps.append(ConcurrentIndex.from_sql(statement, dialect="postgresql"))
+        else:
+            steps.append(SQL(statement, dialect="postgresql"))
+    return steps
+
+
+MIGRATIONS = [
+    Migration("0001_add_username", "Campo username en users", [
+        SQL("ALTER TABLE users ADD COLUMN IF NOT EXISTS username VARCHAR", dialect="postgresql"),
+        Backfill(
+            "users", set_sql="username = SPLIT_PART(email, '@', 1) || '_' || id", where="username IS NULL",
+            dialect="postgresql",
+        ),
+        SetNotNull("users", "username"),
+        ConcurrentIndex("idx_users_username", "users", "(username)", unique=True),
+    ]),
+    Migration("0002_task_indexes", "Índices compuestos del listado de GET /tasks", _task_indexes(
+        "ix_tasks_owner_created_id",
+        "ix_tasks_owner_due_id",
+        "ix_tasks_owner_status",
+        "ix_tasks_owner_priority",
+        "ix_tasks_owner_category",
+        "ix_tasks_owner_project",
+        "ix_tasks_project",
+    )),
+    Migration("0003_attachments", "Tabla attachments", [
+        CreateTables(models.Attachment),
+    ]),
+    Migration("0004_project_counters", "Contadores de tareas por proyecto", [
+        CreateTables(models.ProjectTaskCounter),
+        Backfill("projects", description="Calcular contadores", sql="""
+            INSERT INTO project_task_counters (project_id, task_count, completed_count, progress_sum)
+            SELECT p.id,
+                   COUNT(t.id),
+                   COUNT(t.id) FILTER (WHERE t.completed),
+                   COALESCE(SUM(t.progress), 0)
+            FROM projects p
+            LEFT JOIN tasks t ON t.project_id = p.id
+            WHERE p.id > :last AND p.id <= :upto
+            GROUP BY p.id
+            ON CONFLICT (project_id) DO UPDATE
+            SET task_count = EXCLUDED.task_count,
+                completed_count = EXCLUDED.completed_count,
+                progress_sum = EXCLUDED.progress_sum
+        """, dialect="postgresql"),
+        # Sin FILTER ni ON CONFLICT, que SQLite solo admite en versiones recientes
+        Backfill("projects", description="Calcular contadores", sql="""
+            INSERT OR REPLACE INTO project_task_counters (project_id, task_count, completed_count, progress_sum)
+            SELECT p.id,
+                   COUNT(t.id),
+                   COALESCE(SUM(CASE WHEN t.completed THEN 1 ELSE 0 END), 0),
+                   COALESCE(SUM(t.progress), 0)
+            FROM projects p
+            LEFT JOIN tasks t ON t.project_id = p.id
+            WHERE p.id > :last AND p.id <= :upto
+            GROUP BY p.id
+        """, dialect="sqlite"),
+    ]),
+    Migration("0005_search", "Búsqueda de texto completo", [
+        *_postgres_search_steps(search.POSTGRES_DDL),
+        SQL(
+            *search.SQLITE_PROJECTS_DDL,
+            *search.SQLITE_TASKS_DDL,
+            "INSERT INTO projects_fts(projects_fts) VALUES ('rebuild')",
+            "INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')",
+            dialect="sqlite",
+        ),
+    ]),
+    Migration("0006_change_seq", "Números de cambio y tombstones para GET /sync", [
+        # Con un DEFAULT constante Postgres añade la columna sin reescribir la tabla
+        SQL(
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS change_seq BIGINT NOT NULL DEFAULT 0",
+            "ALTER TABLE projects ADD COLUMN IF NOT EXISTS change_seq BIGINT NOT NULL DEFAULT 0",
+            "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS change_seq BIGINT NOT NULL DEFAULT 0",
+            dialect="postgresql",
+        ),
+        # Las filas existentes quedan en el cambio 1 para que un since=0 las incluya
+        Backfill("projects", set_sql="change_seq = 1", where="change_seq = 0"),
+        Backfill("tasks", set_sql="change_seq = 1", where="change_seq = 0"),
+        Backfill("users", set_sql="change_seq = 1", where="change_seq = 0"),
+        *_task_indexes("ix_tasks_owner_change_seq"),
+        ConcurrentIndex.from_model(
+            next(i for i in models.Project.__table__.indexes if i.name == "ix_projects_owner_change_seq")
+        ),
+        CreateTables(models.DeletedRecord),
+    ]),
+    Migration("0007_task_notes", "Notas y puntos críticos como filas", [
+        CreateTables(models.TaskNote, models.TaskCriticalPoint),
+        Backfill(
+            "tasks", handler=_convert_task_notes, description="Convertir notas y puntos críticos",
+            when=_has_column("tasks", "notes"),
+        ),
+        # search_vector se generaba también a partir de notes: CASCADE la borra
+        # y se vuelve a crear sin ella
+        SQL(
+            "ALTER TABLE tasks DROP COLUMN IF EXISTS notes CASCADE, DROP COLUMN IF EXISTS critical_points",
+            dialect="postgresql",
+        ),
+        *_postgres_search_steps([s for s in search.POSTGRES_DDL if "tasks" in s]),
+    ]),
+    Migration("0008_cascade_deletes", "Borrados en cascada en la base de datos", [
+        CascadeForeignKey("projects", "owner_id", "users"),
+        CascadeForeignKey("tasks", "owner_id", "users"),
+        CascadeForeignKey("tasks", "project_id", "projects"),
+        CascadeForeignKey("attachments", "owner_id", "users"),
+    ]),
+    Migration("0009_jobs", "Cola de trabajos en segundo plano", [
+        CreateTables(models.Job),
+    ]),
+    Migration("0010_archived_tasks", "Archivo de tareas completadas", [
+        # El DDL de búsqueda de archived_tasks va enganchado a su creación
+        CreateTables(models.ArchivedTask),
+        *_task_indexes("ix_tasks_completed_at"),
+    ]),
+    Migration("0011_revocations", "Lista de revocación de sesiones compartida entre workers", [
+        CreateTables(models.Revocation),
+    ]),
+    Migration("0012_events", "Feed de cambios compartido entre workers", [
+        CreateTables(models.Event),
+    ]),
+]
+
+
+# ==================== EJECUCIÓN ====================
+
+def _applied(engine: Engine) -> set:
+    with engine.connect() as conn:
+        return set(conn.execute(select(schema_migrations.c.revision)).scalars())
+
+
+def _mark_applied(conn: Connection, revisions: List[str]) -> None:
+    conn.execute(insert(schema_migrations), [{"revision": revision} for revision in revisions])
+
+
+def _create_fresh(engine: Engine) -> bool:
+    """Base de datos vacía: crear el esquema actual y marcar todas las revisiones"""
+    with engine.connect() as conn:
+        if inspect(conn).has_table("users"):
+            return False
+        print("📝 Base de datos vacía: creando el esquema completo...")
+        models.Base.metadata.create_all(bind=conn)
+        _mark_applied(conn, [migration.revision for migration in MIGRATIONS])
+        conn.commit()
+    return True
+
+
+def upgrade(engine: Optional[Engine] = None) -> None:
+    engine = engine or create_engine(DATABASE_URL)
+    control_metadata.create_all(bind=engine)
+    if _create_fresh(engine):
+        print("✅ Esquema creado")
+        return
+
+    applied = _applied(engine)
+    pending = [migration for migration in MIGRATIONS if migration.revision not in applied]
+    if not pending:
+        print("✅ No hay migraciones pendientes")
+        return
+
+    for migration in pending:
+        print(f"📝 {migration.revision}: {migration.description}")
+        for number, step in enumerate(migration.steps):
+            ctx = Context(engine, migration.revision, number)
+            if ctx.is_done():
+                print(f"   ⏭️  {step.describe()} (ya aplicado)")
+                continue
+            print(f"   ▶️  {step.describe()}")
+            step.run(ctx)
+            with engine.connect() as conn:
+                ctx.save_checkpoint(conn, last_key=ctx.checkpoint(conn), done=True)
+                conn.commit()
+        with engine.connect() as conn:
+            _mark_applied(conn, [migration.revision])
+            conn.execute(migration_checkpoints.delete().where(migration_checkpoints.c.revision == migration.revision))
+            conn.commit()
+    print("✅ Migraciones aplicadas")
+
+
+def status(engine: Optional[Engine] = None) -> None:
+    engine = engine or create_engine(DATABASE_URL)
+    control_metadata.create_all(bind=engine)
+    applied = _applied(engine)
+    for migration in MIGRATIONS:
+        mark = "✅" if migration.revision in applied else "⏳"
+        print(f"{mark} {migration.revision}: {migration.description}")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    try:
+        if command == "status":
+            status()
+        else:
+            upgrade()
+    except Exception as e:
+        print(f"❌ Error durante la migración: {e}")
+        sys.exit(1)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, Float, ForeignKey, Text, Index, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -11,10 +11,12 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    change_seq = Column(BigInteger, nullable=False, default=0, server_default="0")  # Último número de cambio emitido
     
     # Relationships
-    projects = relationship("Project", back_populates="owner", cascade="all, delete-orphan")
-    tasks = relationship("Task", back_populates="owner", cascade="all, delete-orphan")
+    # Los hijos se borran con ON DELETE CASCADE en la base de datos, sin cargarlos
+    projects = relationship("Project", back_populates="owner", cascade="all, delete-orphan", passive_deletes=True)
+    tasks = relationship("Task", back_populates="owner", cascade="all, delete-orphan", passive_deletes=True)
 
 class Project(Base):
     __tablename__ = "projects"
@@ -23,13 +25,21 @@ class Project(Base):
     name = Column(String, nullable=False)
     description = Column(Text, nullable=True)
     status = Column(String, default="activo")  # activo, completado, archivado
-    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    change_seq = Column(BigInteger, nullable=False, default=0, server_default="0")  # Para GET /sync
     
     # Relationships
     owner = relationship("User", back_populates="projects")
-    tasks = relationship("Task", back_populates="project", cascade="all, delete-orphan")
+    tasks = relationship(
+        "Task", back_populates="project", cascade="all, delete-orphan", passive_deletes=True, order_by="Task.id"
+    )
+    counters = relationship("ProjectTaskCounter", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
+    
+    __table_args__ = (
+        Index("ix_projects_owner_change_seq", "owner_id", "change_seq"),
+    )
 
 class Task(Base):
     __tablename__ = "tasks"
@@ -43,16 +53,191 @@ class Task(Base):
     due_date = Column(DateTime(timezone=True), nullable=True)
     completed = Column(Boolean, default=False)
     completed_at = Column(DateTime(timezone=True), nullable=True)
-    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    project_id = Column(Integer, ForeignKey("projects.id"), nullable=True)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Campos adicionales para la vista de detalle
-    notes = Column(Text, nullable=True)  # JSON string de notas
     progress = Column(Integer, default=0)  # Progreso 0-100
-    critical_points = Column(Text, nullable=True)  # JSON string de puntos críticos
+    change_seq = Column(BigInteger, nullable=False, default=0, server_default="0")  # Para GET /sync
     
     # Relationships
     owner = relationship("User", back_populates="tasks")
-    project = relationship("Project", back_populates="tasks")
\ No newline at end of file
+    project = relationship("Project", back_populates="tasks")
+    attachments = relationship("Attachment", back_populates="task", cascade="all, delete-orphan", passive_deletes=True)
+    # Solo se cargan en el detalle (selectinload); "raise" evita que un listado los arrastre
+    notes = relationship(
+        "TaskNote", back_populates="task", cascade="all, delete-orphan", passive_deletes=True,
+        lazy="raise", order_by="TaskNote.id",
+    )
+    critical_points = relationship(
+        "TaskCriticalPoint", back_populates="task", cascade="all, delete-orphan", passive_deletes=True,
+        lazy="raise", order_by="TaskCriticalPoint.id",
+    )
+    
+    # Índices compuestos para el listado paginado y filtrado de GET /tasks
+    __table_args__ = (
+        Index("ix_tasks_owner_created_id", "owner_id", "created_at", "id"),
+        Index("ix_tasks_owner_due_id", "owner_id", "due_date", "id"),
+        Index("ix_tasks_owner_status", "owner_id", "status"),
+        Index("ix_tasks_owner_priority", "owner_id", "priority"),
+        Index("ix_tasks_owner_category", "owner_id", "category"),
+        Index("ix_tasks_owner_project", "owner_id", "project_id"),
+        Index("ix_tasks_project", "project_id"),
+        Index("ix_tasks_owner_change_seq", "owner_id", "change_seq"),
+        Index("ix_tasks_completed_at", "completed_at"),  # Para el archivador
+    )
+
+class ArchivedTask(Base):
+    """
+    Tareas completadas hace más de TASK_ARCHIVE_AFTER_DAYS días, fuera de la
+    tabla caliente (ver archive.py). Conservan su id y el resto de columnas de
+    tasks; las notas y puntos críticos se guardan en la propia fila.
+    """
+    __tablename__ = "archived_tasks"
+    
+    id = Column(Integer, primary_key=True)  # El mismo que tenía en tasks
+    title = Column(String, nullable=False)
+    description = Column(Text, nullable=True)
+    priority = Column(String, nullable=True)
+    status = Column(String, nullable=True)
+    category = Column(String, nullable=True)
+    due_date = Column(DateTime(timezone=True), nullable=True)
+    completed = Column(Boolean, nullable=False, default=True)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=True)
+    progress = Column(Integer, nullable=True)
+    change_seq = Column(BigInteger, nullable=False, default=0)
+    notes = Column(JSON, nullable=True)  # [{"id", "text", "created_at", "updated_at"}]
+    critical_points = Column(JSON, nullable=True)  # Igual, con "resolved"
+    notes_text = Column(Text, nullable=True)  # Texto de las notas, para la búsqueda
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_archived_tasks_owner_created_id", "owner_id", "created_at", "id"),
+        Index("ix_archived_tasks_project", "project_id"),
+    )
+
+class Attachment(Base):
+    __tablename__ = "attachments"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    task_id = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=True, index=True)
+    filename = Column(String, nullable=False)  # Nombre original
+    content_type = Column(String, nullable=True)
+    size = Column(BigInteger, nullable=False)
+    sha256 = Column(String(64), nullable=False, index=True)
+    storage_key = Column(String, nullable=False)  # <sha[:2]>/<sha256><ext> dentro de UPLOAD_DIR
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    task = relationship("Task", back_populates="attachments")
+
+class TaskNote(Base):
+    __tablename__ = "task_notes"
+    
+    id = Column(Integer, primary_key=True)
+    task_id = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False, index=True)
+    text = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    # Relationships
+    task = relationship("Task", back_populates="notes")
+
+class TaskCriticalPoint(Base):
+    __tablename__ = "task_critical_points"
+    
+    id = Column(Integer, primary_key=True)
+    task_id = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False, index=True)
+    text = Column(Text, nullable=False)
+    resolved = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    # Relationships
+    task = relationship("Task", back_populates="critical_points")
+
+class ProjectTaskCounter(Base):
+    """Contadores de tareas por proyecto, mantenidos en cada escritura de tareas"""
+    __tablename__ = "project_task_counters"
+    
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True)
+    task_count = Column(Integer, nullable=False, default=0)
+    completed_count = Column(Integer, nullable=False, default=0)
+    progress_sum = Column(BigInteger, nullable=False, default=0)
+
+class DeletedRecord(Base):
+    """Tombstones: registros borrados, para que GET /sync pueda informar de ellos"""
+    __tablename__ = "deleted_records"
+    
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    entity = Column(String, nullable=False)  # task, project
+    entity_id = Column(Integer, nullable=False)
+    change_seq = Column(BigInteger, nullable=False)
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_deleted_records_owner_change_seq", "owner_id", "change_seq"),
+    )
+
+class Job(Base):
+    """Operaciones largas que se ejecutan fuera de la petición (ver jobs.py)"""
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    kind = Column(String, nullable=False)  # tasks.mark_all_completed, projects.delete...
+    payload = Column(JSON, nullable=False, default=dict)
+    status = Column(String, nullable=False, default="queued")  # queued, running, succeeded, failed
+    progress = Column(Integer, nullable=False, default=0)  # 0-100
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime(timezone=True), nullable=False)  # No antes de (reintentos con espera)
+    locked_at = Column(DateTime(timezone=True), nullable=True)  # Último latido del worker que la ejecuta
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
+class Revocation(Base):
+    """Refresh tokens canjeados y sesiones cerradas, compartidos entre workers (ver sessions.py)"""
+    __tablename__ = "revocations"
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)  # token, session
+    key = Column(String, nullable=False)  # jti o sid
+    expires_at = Column(BigInteger, nullable=False)  # Epoch: a partir de aquí se puede purgar
+    revoked_at = Column(Float, nullable=False)  # Epoch: los workers releen las recientes
+    
+    __table_args__ = (
+        Index("ix_revocations_kind_key", "kind", "key", unique=True),
+        Index("ix_revocations_kind_revoked_at", "kind", "revoked_at"),
+        Index("ix_revocations_expires_at", "expires_at"),
+    )
+
+class Event(Base):
+    """Feed de cambios compartido entre workers; el id es la versión (ver events.py)"""
+    __tablename__ = "events"
+    
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    type = Column(String, nullable=False)  # task.created, project.deleted...
+    ts = Column(Float, nullable=False)  # Epoch
+    data = Column(JSON, nullable=False, default=dict)
+    
+    __table_args__ = (
+        Index("ix_events_owner_id", "owner_id", "id"),
+        Index("ix_events_ts", "ts"),
+    )
@@ -0,0 +1,58 @@
+"""
+Paginación por cursor (keyset) para los listados.
+
+El cursor es opaco para el cliente: codifica el criterio de orden, el valor
+de la columna de orden y el id de la última fila devuelta, de modo que la
+siguiente página se obtiene con un WHERE sobre el índice en lugar de OFFSET.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_, tuple_
+
+
+def encode_cursor(sort: str, value, last_id: int) -> str:
+    """Codificar la posición de la última fila devuelta"""
+    if isinstance(value, datetime):
+        payload = {"s": sort, "t": "dt", "v": value.isoformat(), "id": last_id}
+    else:
+        payload = {"s": sort, "t": "raw", "v": value, "id": last_id}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str):
+    """Decodificar un cursor; lanza ValueError si es inválido o de otro orden"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = payload["v"]
+        if payload["t"] == "dt" and value is not None:
+            value = datetime.fromisoformat(value)
+        last_id = int(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if payload.get("s") != sort:
+        raise ValueError("Cursor does not match the requested sort")
+    return value, last_id
+
+
+def keyset_filter(column, id_column, value, last_id: int, descending: bool = False, nullable: bool = False):
+    """
+    Condición WHERE para continuar después de (value, last_id).
+
+    Las columnas nullable se ordenan con NULLS LAST en ambos sentidos.
+    """
+    if not nullable:
+        if descending:
+            return tuple_(column, id_column) < tuple_(value, last_id)
+        return tuple_(column, id_column) > tuple_(value, last_id)
+
+    after_id = id_column < last_id if descending else id_column > last_id
+    if value is None:
+        # Ya estamos en la cola de NULLs: solo queda avanzar por id
+        return and_(column.is_(None), after_id)
+    after_value = column < value if descending else column > value
+    return or_(after_value, and_(column == value, after_id), column.is_(None))
@@ -0,0 +1,135 @@
+"""
+Hash de contraseñas fuera del event loop y del threadpool general.
+
+bcrypt y argon2 liberan el GIL, así que basta un ThreadPoolExecutor propio
+de PASSWORD_HASH_WORKERS hilos: una ráfaga de logins puede ocuparlo entero sin
+quitar hilos a los endpoints síncronos ni a run_in_threadpool. Como mucho
+PASSWORD_HASH_MAX_PENDING operaciones esperan turno; a partir de ahí se
+responde 503 en vez de acumular peticiones.
+
+El esquema y su coste son configurables. Los hashes con otro esquema o con un
+coste menor que el actual se rehacen al hacer login (``verify_and_update``),
+así que cambiar PASSWORD_HASH_SCHEME o BCRYPT_ROUNDS migra las cuentas poco a
+poco sin forzar a nadie a cambiar la contraseña.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+PASSWORD_HASH_SCHEME = os.getenv("PASSWORD_HASH_SCHEME", "bcrypt")  # bcrypt o argon2
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Parámetros recomendados por OWASP para argon2id (19 MiB, 2 iteraciones)
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "19456"))  # KiB
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "2"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "1"))
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(os.cpu_count() or 1, 4))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+SUPPORTED_SCHEMES = ("argon2", "bcrypt")
+
+
+class HashingOverloaded(Exception):
+    """Demasiadas operaciones de hash en cola"""
+
+
+def _create_context(preferred: str) -> CryptContext:
+    if preferred not in SUPPORTED_SCHEMES:
+        raise ValueError(f"Unsupported PASSWORD_HASH_SCHEME: {preferred}")
+    if preferred == "argon2":
+        from passlib.hash import argon2
+        if not argon2.has_backend():
+            # argon2-cffi es opcional: sin él se sigue con bcrypt
+            preferred = "bcrypt"
+    schemes = [preferred] + [scheme for scheme in SUPPORTED_SCHEMES if scheme != preferred]
+    return CryptContext(
+        schemes=schemes,
+        deprecated="auto",  # Todo lo que no sea el esquema preferido se rehace
+        bcrypt__default_rounds=BCRYPT_ROUNDS,
+        bcrypt__min_rounds=BCRYPT_ROUNDS,
+        argon2__type="id",
+        argon2__memory_cost=ARGON2_MEMORY_COST,
+        argon2__time_cost=ARGON2_TIME_COST,
+        argon2__parallelism=ARGON2_PARALLELISM,
+    )
+
+
+pwd_context = _create_context(PASSWORD_HASH_SCHEME)
+
+
+class HashingPool:
+    """Ejecutor acotado con métricas de cola"""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self.pending = 0  # En cola o ejecutándose
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.run_seconds_total = 0.0
+
+    def _timed(self, submitted_at: float, func, *args):
+        started_at = time.monotonic()
+        wait = started_at - submitted_at
+        with self._lock:
+            self.running += 1
+            self.wait_seconds_total += wait
+            self.wait_seconds_max = max(self.wait_seconds_max, wait)
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.run_seconds_total += time.monotonic() - started_at
+
+    async def run(self, func, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HashingOverloaded()
+            self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._timed, time.monotonic(), func, *args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "scheme": pwd_context.default_scheme(),
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "running": self.running,
+                "queued": self.pending - self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+                "avg_hash_seconds": round(self.run_seconds_total / self.completed, 6) if self.completed else 0.0,
+            }
+
+
+pool = HashingPool()
+
+
+async def hash_password(password: str) -> str:
+    return await pool.run(pwd_context.hash, password)
+
+
+async def verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """(válida, nuevo hash o None): el nuevo hash viene si hay que rehacerlo"""
+    return await pool.run(pwd_context.verify_and_update, password, hashed_password)
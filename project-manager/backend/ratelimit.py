@@ -0,0 +1,51 @@
+"""
+Limitador de frecuencia por clave (usuario, IP...) con token bucket en memoria
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class RateLimiter:
+    """
+    Permite ``rate`` eventos cada ``per`` segundos por clave, con ráfagas de
+    hasta ``burst``. Las claves menos usadas se descartan al pasar de ``max_keys``.
+    """
+
+    def __init__(self, rate: float, per: float = 60.0, burst: Optional[int] = None, max_keys: int = 100000):
+        self.rate = rate
+        self.per = per
+        self.burst = burst if burst is not None else max(int(rate), 1)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+
+    def acquire(self, key) -> float:
+        """Consumir un token; devuelve 0 si se permite o los segundos a esperar"""
+        now = time.monotonic()
+        refill_per_second = self.rate / self.per
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - updated_at) * refill_per_second)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0.0
+                self.allowed += 1
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / refill_per_second
+                self.rejected += 1
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def reset(self, key) -> None:
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"keys": len(self._buckets), "allowed": self.allowed, "rejected": self.rejected}
@@ -0,0 +1,73 @@
+"""
+Rutas de autenticación: registro, login, renovación de tokens y logout
+"""
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import auth
+import models
+import schemas
+from database import get_db
+
+# ==================== AUTENTICACIÓN ====================
+
+router = APIRouter(tags=["auth"])
+
+@router.post("/register", response_model=schemas.User)
+async def register(user: schemas.UserCreate, request: Request, db: AsyncSession = Depends(get_db)):
+    auth.check_login_rate(request)
+    db_user = await auth.get_user_by_email(db, email=user.email)
+    if db_user:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    
+    db_user = await auth.get_user_by_username(db, username=user.username)
+    if db_user:
+        raise HTTPException(status_code=400, detail="Username already taken")
+    
+    hashed_password = await auth.get_password_hash(user.password)
+    db_user = models.User(
+        username=user.username,
+        email=user.email,
+        hashed_password=hashed_password
+    )
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+@router.post("/login", response_model=schemas.Token)
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    auth.check_login_rate(request, form_data.username)
+    user = await auth.authenticate_user(db, form_data.username, form_data.password)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return auth.issue_tokens(user.email, user.id)
+
+@router.post("/token/refresh", response_model=schemas.Token)
+async def refresh_token(payload: schemas.RefreshRequest):
+    """Renovar el access token sin volver a pedir la contraseña (rota el refresh token)"""
+    return await auth.rotate_refresh_token(payload.refresh_token)
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(payload: Optional[schemas.LogoutRequest] = None, token: str = Depends(auth.oauth2_scheme)):
+    """Cerrar la sesión: dejan de valer su access token y su refresh token"""
+    sid = auth.decode_access_token(token).get("sid")
+    if sid:
+        await auth.revoke_session(sid)
+    if payload and payload.refresh_token:
+        refresh_sid = auth.refresh_token_session(payload.refresh_token)
+        if refresh_sid and refresh_sid != sid:
+            await auth.revoke_session(refresh_sid)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@router.get("/users/me", response_model=schemas.User)
+def get_current_user_info(current_user: models.User = Depends(auth.get_current_user)):
+    return current_user
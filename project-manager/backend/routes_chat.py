@@ -0,0 +1,127 @@
+"""
+Rutas del chat con IA: POST /api/chat y /api/chat/stream.
+
+El cliente del modelo (Gemini o stub) no se importa con este módulo: se crea
+en la primera petición de chat (ver llm.py).
+"""
+
+import json
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import auth
+import chat_context
+import llm
+import metrics
+import models
+import ratelimit
+from database import get_db
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+# ==================== CONFIGURAR IA ====================
+# El backend (Gemini o stub) se crea en la primera petición de chat: ver llm.py
+CHAT_RATE_LIMIT_PER_MINUTE = float(os.getenv("CHAT_RATE_LIMIT_PER_MINUTE", "20"))
+chat_rate_limiter = ratelimit.RateLimiter(rate=CHAT_RATE_LIMIT_PER_MINUTE, per=60.0)
+metrics.register_stats("rate_limiter", chat_rate_limiter.stats, limiter="chat")
+
+# ==================== MODELOS PARA CHAT ====================
+class ChatRequest(BaseModel):
+    message: str
+    conversation_history: Optional[List[dict]] = []
+
+class ChatResponse(BaseModel):
+    response: str
+    model_used: str
+
+# ==================== CHAT CON IA (GEMINI) ====================
+
+router = APIRouter(tags=["chat"])
+
+async def _build_chat_prompt(chat_request: ChatRequest, current_user, db: AsyncSession) -> str:
+    """Prompt con el resumen de tareas del usuario y el historial que quepa en el presupuesto"""
+    summary = await chat_context.summaries.get(db, current_user.id)
+    return chat_context.build_prompt(
+        current_user.username,
+        summary.render(),
+        chat_request.conversation_history or [],
+        chat_request.message,
+    )
+
+def _get_chat_backend(current_user) -> llm.LLMBackend:
+    """Backend disponible para el usuario, aplicando su límite de peticiones"""
+    backend = llm.get_backend()
+    if backend is None:
+        raise HTTPException(
+            status_code=503,
+            detail="El servicio de IA no está disponible. Contacta al administrador."
+        )
+    retry_after = chat_rate_limiter.acquire(current_user.id)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Demasiados mensajes. Espera un momento antes de volver a intentarlo.",
+            headers={"Retry-After": str(int(retry_after) + 1)},
+        )
+    return backend
+
+@router.post("/api/chat", response_model=ChatResponse)
+async def chat_endpoint(
+    chat_request: ChatRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """
+    Endpoint de chat con IA usando Gemini.
+    Requiere autenticación.
+    """
+    backend = _get_chat_backend(current_user)
+    prompt = await _build_chat_prompt(chat_request, current_user, db)
+    try:
+        response_text = await llm.complete(backend, prompt)
+    except Exception as e:
+        logger.exception("Error en chat", extra={"user_id": current_user.id, "backend": backend.name})
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error al procesar tu mensaje: {str(e)}"
+        )
+    
+    return ChatResponse(
+        response=response_text,
+        model_used=backend.name
+    )
+
+@router.post("/api/chat/stream")
+async def chat_stream_endpoint(
+    chat_request: ChatRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """
+    Chat con IA en streaming (Server-Sent Events).
+    Envía eventos "data: {"delta": ...}" y termina con "event: done".
+    """
+    backend = _get_chat_backend(current_user)
+    prompt = await _build_chat_prompt(chat_request, current_user, db)
+    
+    async def event_stream():
+        try:
+            async for part in llm.stream(backend, prompt):
+                yield f"data: {json.dumps({'delta': part})}\n\n"
+        except Exception as e:
+            logger.exception("Error en chat", extra={"user_id": current_user.id, "backend": backend.name})
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+            return
+        yield f"event: done\ndata: {json.dumps({'model_used': backend.name})}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
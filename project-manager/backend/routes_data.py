@@ -0,0 +1,125 @@
+"""
+Rutas sobre todos los datos del usuario: sincronización offline,
+exportación/importación, estadísticas y búsqueda
+"""
+
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Response, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import auth
+import chat_context
+import crud
+import events
+import http_cache
+import schemas
+import search
+import stats
+import transfer
+from database import get_db
+
+router = APIRouter(tags=["data"])
+
+# ==================== SINCRONIZACIÓN ====================
+
+@router.get("/sync", response_model=schemas.SyncResponse)
+async def sync_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=crud.MAX_SYNC_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    """
+    Cambios desde ``since`` para clientes offline (since=0: todo).
+
+    Las filas van en forma compacta (listas en el orden de task_columns /
+    project_columns). El cliente guarda ``seq`` y lo envía como ``since`` en la
+    siguiente llamada; mientras ``has_more`` sea true hay más páginas.
+    """
+    return await crud.changes_since(db, current_user_id, since, limit)
+
+# ==================== EXPORTAR / IMPORTAR ====================
+
+@router.get("/export")
+async def export_data(
+    format: str = Query("ndjson", description="ndjson o csv"),
+    entity: Optional[str] = Query(None, description="projects o tasks (obligatorio en CSV; NDJSON: ambos)"),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    """Copia de los proyectos y tareas del usuario, enviada por lotes según se lee"""
+    try:
+        entities = transfer.parse_entities(entity, format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filename = f"export-{'-'.join(entities)}-{datetime.utcnow():%Y%m%d}.{format}"
+    return StreamingResponse(
+        transfer.export_stream(current_user_id, format, entities),
+        media_type=transfer.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.post("/import", response_model=schemas.ImportResult)
+async def import_data(
+    file: UploadFile = File(...),
+    format: Optional[str] = Form(None, description="ndjson o csv (por defecto, según la extensión)"),
+    entity: Optional[str] = Form(None, description="projects o tasks (por defecto, según el fichero)"),
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    """
+    Importar un fichero de /export (u otro con las mismas columnas). Las filas
+    inválidas se devuelven en ``errors`` con su número de línea; el resto se carga.
+    """
+    format = format or ("csv" if (file.filename or "").lower().endswith(".csv") else "ndjson")
+    try:
+        transfer.parse_entities(entity or "tasks", format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result = await transfer.import_file(db, current_user_id, file.file, format, entity)
+    if result["projects_created"] or result["tasks_created"]:
+        chat_context.summaries.invalidate(current_user_id)
+        http_cache.invalidate(current_user_id)
+        await events.publish(current_user_id, "data.imported", {
+            "projects_created": result["projects_created"], "tasks_created": result["tasks_created"]
+        })
+    return result
+
+# ==================== ESTADÍSTICAS ====================
+
+@router.get("/stats", response_model=schemas.Stats)
+async def get_stats(
+    days: int = Query(30, ge=1, le=366, description="Días de histórico para el throughput"),
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    """Resumen del usuario y de cada proyecto calculado en la base de datos"""
+    return await stats.user_stats(db, current_user_id, days)
+
+# ==================== BÚSQUEDA ====================
+
+@router.get("/search", response_model=List[schemas.SearchResult])
+async def search_endpoint(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    kind: Optional[str] = Query(None, description="task o project"),
+    limit: int = Query(20, ge=1, le=search.MAX_SEARCH_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    """
+    Buscar en tareas y proyectos ordenando por relevancia.
+    Si hay más resultados, el cursor de la siguiente página va en X-Next-Cursor.
+    """
+    try:
+        results, next_cursor = await search.search(
+            db, current_user_id, q, kind=kind, limit=limit, cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return results
@@ -0,0 +1,89 @@
+"""
+Rutas del feed de cambios en tiempo real: polling, SSE y WebSocket (ver events.py)
+"""
+
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+
+import auth
+import database
+import events
+import schemas
+
+# ==================== CAMBIOS EN TIEMPO REAL ====================
+
+router = APIRouter(tags=["events"])
+
+@router.get("/events", response_model=schemas.EventBatch)
+async def get_events(
+    since: int = Query(..., ge=0),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    """
+    Eventos posteriores a la versión ``since`` para aplicar como deltas.
+    410 si ya no están en el buffer: el cliente debe recargar los listados.
+    """
+    # La versión se lee antes: lo que se publique entre medias se vuelve a pedir después
+    version = await events.broker.current_version(current_user_id)
+    try:
+        missed = await events.broker.events_since(current_user_id, since)
+    except events.ResyncRequired:
+        raise HTTPException(status_code=410, detail="Resync required")
+    if missed:
+        version = max(version, missed[-1]["version"])
+    return {"version": version, "events": missed}
+
+def _sse(event: Optional[dict]) -> str:
+    if event is None:
+        return ": ping\n\n"
+    return f"id: {event['version']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+@router.get("/events/stream")
+async def stream_events(
+    request: Request,
+    since: Optional[int] = Query(None, ge=0),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    """Feed de cambios por Server-Sent Events (reanuda con Last-Event-ID)"""
+    last_event_id = request.headers.get("last-event-id")
+    if since is None and last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    
+    async def event_stream():
+        try:
+            async for event in events.stream(current_user_id, since):
+                yield _sse(event)
+        except events.ResyncRequired:
+            yield "event: resync\ndata: {}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.websocket("/ws")
+async def events_websocket(websocket: WebSocket, token: str = Query(...), since: Optional[int] = Query(None, ge=0)):
+    """Feed de cambios por WebSocket; el token va en la query porque el navegador no envía cabeceras"""
+    try:
+        payload = auth.decode_access_token(token)
+        user_id = payload.get("uid")
+        if user_id is None:
+            async with database.AsyncSessionLocal() as db:
+                user_id = (await auth.get_current_user(token, db)).id
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    try:
+        async for event in events.stream(int(user_id), since):
+            await websocket.send_json(event if event is not None else {"type": "ping"})
+    except events.ResyncRequired:
+        await websocket.send_json({"type": "resync"})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
@@ -0,0 +1,197 @@
+"""
+Rutas de archivos adjuntos: subida directa, subidas por bloques reanudables
+y descargas. ``limit_upload_size`` es un middleware HTTP que create_app
+instala junto con este router.
+"""
+
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, UploadFile, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import archive
+import auth
+import downloads
+import models
+import schemas
+import storage
+from database import get_db
+from routes_tasks import find_owned_task, get_owned_task
+
+# ==================== ARCHIVOS ADJUNTOS ====================
+
+router = APIRouter(tags=["files"])
+
+async def limit_upload_size(request: Request, call_next):
+    """Rechazar subidas demasiado grandes antes de leer el cuerpo"""
+    if request.method == "POST" and request.url.path == "/upload":
+        content_length = request.headers.get("content-length")
+        # Margen para las cabeceras del multipart
+        if content_length and content_length.isdigit() and int(content_length) > storage.MAX_UPLOAD_SIZE + 64 * 1024:
+            return JSONResponse(status_code=413, content={"detail": "File too large"})
+    return await call_next(request)
+
+async def _create_attachment(db: AsyncSession, owner_id: int, stored: storage.StoredFile,
+                             filename: str, content_type: Optional[str], task_id: Optional[int]):
+    attachment = models.Attachment(
+        owner_id=owner_id,
+        task_id=task_id,
+        filename=filename,
+        content_type=content_type,
+        size=stored.size,
+        sha256=stored.sha256,
+        storage_key=stored.storage_key,
+    )
+    db.add(attachment)
+    await db.commit()
+    await db.refresh(attachment)
+    return attachment
+
+@router.post("/upload", response_model=schemas.Attachment, status_code=status.HTTP_201_CREATED)
+async def upload_file(
+    file: UploadFile = File(...),
+    task_id: Optional[int] = Form(None),
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    """Subir un archivo (opcionalmente asociado a una tarea)"""
+    if task_id is not None:
+        await get_owned_task(db, task_id, current_user_id, restore=True)
+    try:
+        stored = await storage.save_stream(storage.iter_upload_file(file), file.filename)
+    except storage.UploadTooLarge:
+        raise HTTPException(status_code=413, detail="File too large")
+    return await _create_attachment(
+        db, current_user_id, stored, file.filename or stored.sha256, file.content_type, task_id
+    )
+
+@router.get("/tasks/{task_id}/attachments", response_model=List[schemas.Attachment])
+async def get_task_attachments(
+    task_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    if await find_owned_task(db, task_id, current_user_id) is None:
+        # Las tareas con adjuntos no se archivan
+        if await archive.is_archived(db, current_user_id, task_id):
+            return []
+        raise HTTPException(status_code=404, detail="Task not found")
+    return (await db.scalars(select(models.Attachment).where(
+        models.Attachment.task_id == task_id
+    ).order_by(models.Attachment.id))).all()
+
+@router.get("/attachments/{attachment_id}")
+async def download_attachment(
+    attachment_id: int,
+    request: Request,
+    thumb: Optional[int] = Query(None, description="Lado máximo de la miniatura (128, 256 o 512)"),
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    """Descargar un adjunto (o su miniatura) con soporte de caché y Range"""
+    attachment = await db.scalar(select(models.Attachment).where(
+        models.Attachment.id == attachment_id,
+        models.Attachment.owner_id == current_user_id
+    ))
+    if not attachment:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    
+    key = attachment.storage_key
+    etag = f'"{attachment.sha256}"'
+    filename = attachment.filename
+    content_type = attachment.content_type
+    if thumb is not None:
+        if thumb not in downloads.THUMBNAIL_SIZES:
+            raise HTTPException(status_code=400, detail=f"thumb must be one of {downloads.THUMBNAIL_SIZES}")
+        thumbnail = await downloads.ensure_thumbnail(key, attachment.sha256, thumb)
+        if thumbnail is None:
+            raise HTTPException(status_code=415, detail="Thumbnail not available for this file")
+        key = thumbnail
+        etag = f'"{attachment.sha256}-{thumb}"'
+        filename = f"{os.path.splitext(filename)[0]}-{thumb}.png"
+        content_type = "image/png"
+    
+    path = storage.storage_path(key)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Attachment content missing")
+    return downloads.file_response(request, path, key, etag, filename, content_type)
+
+def _upload_session_response(meta: dict, attachment=None):
+    return {
+        **meta,
+        "chunk_size": storage.CHUNK_SIZE,
+        "complete": attachment is not None,
+        "attachment": attachment,
+    }
+
+async def _get_upload_session(upload_id: str, owner_id: int) -> dict:
+    meta = await storage.load_session(upload_id)
+    if meta is None or meta["owner_id"] != owner_id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return meta
+
+@router.post("/uploads", response_model=schemas.UploadSession, status_code=status.HTTP_201_CREATED)
+async def create_upload_session(
+    upload: schemas.UploadSessionCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    """Iniciar una subida por bloques reanudable"""
+    if upload.task_id is not None:
+        await get_owned_task(db, upload.task_id, current_user_id, restore=True)
+    try:
+        meta = await storage.create_session(
+            current_user_id, upload.filename, upload.size, upload.content_type, upload.task_id
+        )
+    except storage.UploadTooLarge:
+        raise HTTPException(status_code=413, detail="File too large")
+    return _upload_session_response(meta)
+
+@router.get("/uploads/{upload_id}", response_model=schemas.UploadSession)
+async def get_upload_session(
+    upload_id: str,
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    """Consultar el offset para reanudar una subida interrumpida"""
+    return _upload_session_response(await _get_upload_session(upload_id, current_user_id))
+
+@router.put("/uploads/{upload_id}", response_model=schemas.UploadSession)
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    """Enviar un bloque en crudo a partir de ``offset``; el último bloque crea el adjunto"""
+    meta = await _get_upload_session(upload_id, current_user_id)
+    try:
+        await storage.append_chunk(meta, offset, request.stream())
+    except storage.UploadOffsetMismatch as e:
+        raise HTTPException(status_code=409, detail=f"Expected offset {e.offset}")
+    except storage.UploadBusy:
+        raise HTTPException(status_code=409, detail="Another chunk is being uploaded")
+    except storage.UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except storage.UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Chunk exceeds declared size")
+    
+    if meta["offset"] < meta["size"]:
+        return _upload_session_response(meta)
+    
+    try:
+        stored = await storage.finalize_session(meta)
+    except storage.UploadBusy:
+        raise HTTPException(status_code=409, detail="Upload is being finalized")
+    except storage.UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if meta["task_id"] is not None:
+        # La tarea puede haberse archivado mientras duraba la subida
+        await get_owned_task(db, meta["task_id"], current_user_id, restore=True)
+    attachment = await _create_attachment(
+        db, current_user_id, stored, meta["filename"], meta["content_type"], meta["task_id"]
+    )
+    return _upload_session_response(meta, attachment)
@@ -0,0 +1,45 @@
+"""
+Seguimiento de trabajos en segundo plano (GET /jobs/{id}) y la respuesta 202
+de los endpoints que encolan uno (ver jobs.py)
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import auth
+import jobs
+import models
+import schemas
+from database import get_db
+
+# ==================== TRABAJOS EN SEGUNDO PLANO ====================
+
+router = APIRouter(tags=["jobs"])
+
+async def enqueue_job(db: AsyncSession, user_id: int, kind: str, payload: dict, detail: str) -> JSONResponse:
+    """Encolar un trabajo y responder 202 con su id"""
+    job = await jobs.enqueue(db, user_id, kind, payload)
+    await db.commit()
+    jobs.pool.wake()
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=schemas.JobAccepted(job_id=job.id, status=job.status, detail=detail).model_dump(),
+        headers={"Location": f"/jobs/{job.id}"},
+    )
+
+@router.get("/jobs/{job_id}", response_model=schemas.Job)
+async def get_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    """Estado y progreso (0-100) de un trabajo; ``result`` cuando termina"""
+    job = await db.scalar(select(models.Job).where(
+        models.Job.id == job_id,
+        models.Job.owner_id == current_user_id
+    ))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -0,0 +1,54 @@
+"""
+Rutas de monitorización: /metrics (Prometheus) y resúmenes en JSON.
+Al importarse registra las estadísticas de los módulos compartidos.
+"""
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+import archive
+import auth
+import database
+import events
+import http_cache
+import jobs
+import llm
+import metrics
+import passwords
+import sessions
+
+# ==================== MONITORIZACIÓN ====================
+
+router = APIRouter(tags=["monitoring"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Métricas de este worker en formato de texto de Prometheus"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+metrics.register_stats("db_pool", database.pool_stats, group_label="pool")
+metrics.register_stats("cache", lambda: auth.user_cache.stats(), cache="users")
+metrics.register_stats("cache", llm.response_cache.stats, cache="llm")
+metrics.register_stats("cache", http_cache.response_cache.stats, cache="http")
+metrics.register_stats("events_broker", lambda: events.broker.stats())
+metrics.register_stats("password_hashing", passwords.pool.stats)
+metrics.register_stats("rate_limiter", auth.login_ip_limiter.stats, limiter="login_ip")
+metrics.register_stats("rate_limiter", auth.login_account_limiter.stats, limiter="login_account")
+metrics.register_stats("sessions", lambda: sessions.store.stats())
+metrics.register_stats("jobs", jobs.pool.stats)
+metrics.register_stats("task_archiver", archive.archiver.stats)
+
+@router.get("/metrics/db-pool")
+def get_db_pool_metrics():
+    """Conexiones en uso, overflow y tiempos de espera de los pools"""
+    return database.pool_stats()
+
+@router.get("/metrics/password-hashing")
+def get_password_hashing_metrics():
+    """Cola del pool de hash de contraseñas y límites de login"""
+    return {
+        **passwords.pool.stats(),
+        "login_ip_limiter": auth.login_ip_limiter.stats(),
+        "login_account_limiter": auth.login_account_limiter.stats(),
+        "sessions": sessions.store.stats(),
+    }
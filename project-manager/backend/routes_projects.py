@@ -0,0 +1,188 @@
+"""
+Rutas de proyectos. Registra también el handler del borrado en segundo plano
+de proyectos con muchas tareas.
+"""
+
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import and_, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import auth
+import chat_context
+import crud
+import events
+import http_cache
+import jobs
+import models
+import routes_jobs
+import schemas
+from database import get_db
+from routes_tasks import changed_fields
+
+# ==================== PROYECTOS ====================
+
+router = APIRouter(tags=["projects"])
+
+@router.get("/projects", response_model=List[schemas.ProjectWithSummary])
+async def get_projects(
+    request: Request,
+    include: Optional[str] = Query(None, description="task_summary: contadores de tareas de cada proyecto"),
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    try:
+        includes = crud.parse_project_include(include, allowed=("task_summary",))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def load():
+        return await crud.list_projects(db, current_user_id, includes), {}
+
+    version = await http_cache.user_version(db, current_user_id)
+    etag = http_cache.make_etag("projects", current_user_id, version, *sorted(includes))
+    return await http_cache.conditional_json(request, current_user_id, etag, load)
+
+@router.post("/projects", response_model=schemas.Project, status_code=status.HTTP_201_CREATED)
+async def create_project(
+    project: schemas.ProjectCreate,
+    current_user_id: int = Depends(auth.get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    db_project = models.Project(
+        **project.dict(),
+        owner_id=current_user_id,
+        change_seq=await crud.next_change_seq(db, current_user_id)
+    )
+    db_project.counters = models.ProjectTaskCounter(task_count=0, completed_count=0, progress_sum=0)
+    db.add(db_project)
+    await db.commit()
+    await db.refresh(db_project)
+    chat_context.summaries.project_saved(current_user_id, db_project)
+    http_cache.invalidate(current_user_id)
+    await events.publish(current_user_id, "project.created", schemas.Project.model_validate(db_project))
+    return db_project
+
+@router.get("/projects/{project_id}", response_model=schemas.ProjectWithTasks)
+async def get_project(
+    project_id: int,
+    request: Request,
+    include: Optional[str] = Query(None, description="tasks y/o task_summary, separados por comas"),
+    current_user_id: int = Depends(auth.get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        includes = crud.parse_project_include(include)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    version = await http_cache.fresh_version(db, select(models.Project.change_seq).where(
+        models.Project.id == project_id,
+        models.Project.owner_id == current_user_id
+    ))
+    if version is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if includes:
+        # Las tareas cambian sin tocar el change_seq del proyecto
+        version = await http_cache.user_version(db, current_user_id)
+
+    async def load():
+        return await crud.get_project(db, current_user_id, project_id, includes), {}
+
+    etag = http_cache.make_etag("project", project_id, version, *sorted(includes))
+    return await http_cache.conditional_json(request, current_user_id, etag, load)
+
+@router.put("/projects/{project_id}", response_model=schemas.Project)
+async def update_project(
+    project_id: int,
+    project_update: schemas.ProjectUpdate,
+    current_user_id: int = Depends(auth.get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    project = await db.scalar(select(models.Project).where(
+        models.Project.id == project_id,
+        models.Project.owner_id == current_user_id
+    ))
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    update_data = project_update.dict(exclude_unset=True)
+    for key, value in update_data.items():
+        setattr(project, key, value)
+    project.change_seq = await crud.next_change_seq(db, current_user_id)
+    
+    await db.commit()
+    await db.refresh(project)
+    chat_context.summaries.project_saved(current_user_id, project)
+    http_cache.invalidate(current_user_id)
+    await events.publish(current_user_id, "project.updated", changed_fields(project, update_data))
+    return project
+
+@router.delete("/projects/{project_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_project(
+    project_id: int,
+    current_user_id: int = Depends(auth.get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    project = await db.scalar(select(models.Project).where(
+        models.Project.id == project_id,
+        models.Project.owner_id == current_user_id
+    ))
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    task_count = await db.scalar(select(func.count()).select_from(models.Task).where(
+        models.Task.project_id == project_id,
+        models.Task.owner_id == current_user_id
+    ))
+    if task_count > jobs.JOB_THRESHOLD_ROWS:
+        return await routes_jobs.enqueue_job(
+            db, current_user_id, "projects.delete", {"project_id": project_id},
+            f"El proyecto y sus {task_count} tareas se borrarán en segundo plano",
+        )
+    await _delete_project(db, current_user_id, project)
+    return None
+
+async def _delete_project(db: AsyncSession, user_id: int, project: models.Project) -> None:
+    await crud.record_project_deletion(db, user_id, project.id)
+    # Tareas, contadores y adjuntos se borran con ON DELETE CASCADE en la base de datos
+    await db.delete(project)
+    await db.commit()
+    # Borrar un proyecto borra sus tareas: se reconstruye el resumen
+    chat_context.summaries.invalidate(user_id)
+    http_cache.invalidate(user_id)
+    await events.publish(user_id, "project.deleted", {"id": project.id, "tasks_deleted": True})
+
+@jobs.handler("projects.delete")
+async def delete_project_job(ctx: jobs.JobContext, db: AsyncSession, payload: dict):
+    """Borra las tareas por lotes (transacciones cortas) y después el proyecto"""
+    project_id = payload["project_id"]
+    project = await db.scalar(select(models.Project).where(
+        models.Project.id == project_id,
+        models.Project.owner_id == ctx.owner_id
+    ))
+    if not project:
+        # Ya borrado (p. ej. en un intento anterior)
+        return {"deleted": False}
+    # Solo las tareas del usuario (bulk_delete_tasks filtra por owner_id); las de
+    # otros usuarios que apunten al proyecto las borra la cascada de _delete_project
+    in_project = and_(models.Task.project_id == project_id, models.Task.owner_id == ctx.owner_id)
+    total = await db.scalar(select(func.count()).select_from(models.Task).where(in_project))
+    deleted = 0
+    while True:
+        ids = (await db.scalars(
+            select(models.Task.id).where(in_project).order_by(models.Task.id).limit(jobs.JOB_BATCH_SIZE)
+        )).all()
+        if not ids:
+            break
+        task_ids = await crud.bulk_delete_tasks(db, ctx.owner_id, ids=list(ids))
+        await db.commit()
+        if not task_ids:
+            break  # Nada borrable en este lote: no volver a pedir las mismas filas
+        deleted += len(task_ids)
+        chat_context.summaries.invalidate(ctx.owner_id)
+        http_cache.invalidate(ctx.owner_id)
+        await events.publish(ctx.owner_id, "task.bulk_deleted", {"ids": task_ids})
+        await ctx.report(99 * deleted // max(total, deleted))
+    await _delete_project(db, ctx.owner_id, project)
+    return {"deleted": True, "tasks_deleted": deleted}
@@ -0,0 +1,498 @@
+"""
+Rutas de tareas: CRUD, operaciones masivas, notas y puntos críticos.
+Registra también los handlers de trabajos en segundo plano de tareas.
+"""
+
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+import archive
+import auth
+import chat_context
+import crud
+import events
+import http_cache
+import jobs
+import models
+import routes_jobs
+import schemas
+from database import get_db
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+# ==================== TAREAS ====================
+
+router = APIRouter(tags=["tasks"])
+
+def changed_fields(obj, update_data: dict) -> dict:
+    """Payload de un evento de actualización: id y solo los campos modificados"""
+    changed = {key: getattr(obj, key) for key in update_data}
+    return {"id": obj.id, **changed, "updated_at": obj.updated_at}
+
+async def find_owned_task(db: AsyncSession, task_id: int, owner_id: int) -> Optional[models.Task]:
+    return await db.scalar(select(models.Task).where(
+        models.Task.id == task_id,
+        models.Task.owner_id == owner_id
+    ))
+
+async def get_owned_task(db: AsyncSession, task_id: int, owner_id: int, restore: bool = False):
+    """Tarea del usuario o 404. Con restore=True una tarea archivada vuelve antes a tasks"""
+    task = await find_owned_task(db, task_id, owner_id)
+    if not task and restore and await archive.restore_task(db, owner_id, task_id):
+        # El resumen del chat no contaba la tarea archivada: los hooks
+        # task_updated/task_deleted lo descuadrarían, así que se reconstruye
+        chat_context.summaries.invalidate(owner_id)
+        task = await find_owned_task(db, task_id, owner_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return task
+
+@router.get("/tasks", response_model=List[schemas.Task])
+async def get_tasks(
+    request: Request,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    priority: Optional[str] = None,
+    category: Optional[str] = None,
+    project_id: Optional[int] = None,
+    completed: Optional[bool] = None,
+    due_from: Optional[datetime] = None,
+    due_to: Optional[datetime] = None,
+    sort: str = "created_at",
+    limit: Optional[int] = Query(None, ge=1, le=crud.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_db), 
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    """
+    Listar tareas con filtros, orden (?sort=-due_date) y paginación por cursor.
+    Si hay más resultados, el cursor de la siguiente página va en X-Next-Cursor.
+    Con ?fields=id,title,status solo se cargan esas columnas.
+    """
+    async def load():
+        try:
+            tasks, next_cursor = await crud.list_tasks(
+                db,
+                current_user_id,
+                sort=sort,
+                limit=limit,
+                cursor=cursor,
+                fields=fields,
+                status=status_filter,
+                priority=priority,
+                category=category,
+                project_id=project_id,
+                completed=completed,
+                due_from=due_from,
+                due_to=due_to,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return tasks, ({"X-Next-Cursor": next_cursor} if next_cursor else {})
+
+    version = await http_cache.user_version(db, current_user_id)
+    etag = http_cache.make_etag("tasks", current_user_id, version)
+    return await http_cache.conditional_json(request, current_user_id, etag, load)
+
+@router.get("/tasks/completed", response_model=List[schemas.Task])
+async def get_completed_tasks(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    """Tareas completadas, incluidas las archivadas (ver archive.py)"""
+    async def load():
+        return await crud.list_completed_tasks(db, current_user_id), {}
+
+    version = await http_cache.user_version(db, current_user_id)
+    etag = http_cache.make_etag("tasks", current_user_id, version)
+    return await http_cache.conditional_json(request, current_user_id, etag, load)
+
+@router.post("/tasks", response_model=schemas.Task, status_code=status.HTTP_201_CREATED)
+async def create_task(
+    task: schemas.TaskCreate, 
+    db: AsyncSession = Depends(get_db), 
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    if await crud.missing_projects(db, current_user_id, [task.project_id]):
+        raise HTTPException(status_code=404, detail="Project not found")
+    db_task = models.Task(
+        **task.dict(exclude_unset=True),
+        owner_id=current_user_id,
+        created_at=datetime.utcnow(),
+        change_seq=await crud.next_change_seq(db, current_user_id)
+    )
+    db.add(db_task)
+    await crud.adjust_project_counters(db, None, crud.counter_snapshot(db_task))
+    await db.commit()
+    await db.refresh(db_task)
+    chat_context.summaries.task_created(current_user_id, db_task)
+    http_cache.invalidate(current_user_id)
+    await events.publish(current_user_id, "task.created", schemas.Task.model_validate(db_task))
+    return db_task
+
+@router.get("/tasks/{task_id}", response_model=schemas.TaskDetail)
+async def get_task(
+    task_id: int, 
+    request: Request,
+    db: AsyncSession = Depends(get_db), 
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    version = await http_cache.fresh_version(db, select(models.Task.change_seq).where(
+        models.Task.id == task_id, 
+        models.Task.owner_id == current_user.id
+    ))
+    archived = version is None
+    if archived:
+        version = await http_cache.fresh_version(db, select(models.ArchivedTask.change_seq).where(
+            models.ArchivedTask.id == task_id,
+            models.ArchivedTask.owner_id == current_user.id
+        ))
+    if version is None:
+        logger.debug("Tarea no encontrada o de otro usuario", extra={"task_id": task_id, "user_id": current_user.id})
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    async def load():
+        if archived:
+            task = await archive.get_archived_task(db, current_user.id, task_id)
+            return schemas.TaskDetail.model_validate(task), {}
+        task = await db.scalar(
+            select(models.Task)
+            .where(models.Task.id == task_id)
+            .options(selectinload(models.Task.notes), selectinload(models.Task.critical_points))
+        )
+        return schemas.TaskDetail.model_validate(task), {}
+
+    etag = http_cache.make_etag("task", task_id, version)
+    return await http_cache.conditional_json(request, current_user.id, etag, load)
+
+@router.put("/tasks/{task_id}", response_model=schemas.Task)
+async def update_task(
+    task_id: int, 
+    task_update: schemas.TaskUpdate, 
+    db: AsyncSession = Depends(get_db), 
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    task = await get_owned_task(db, task_id, current_user_id, restore=True)
+    
+    update_data = crud.completion_changes(task_update.dict(exclude_unset=True))
+    if await crud.missing_projects(db, current_user_id, [update_data.get("project_id")]):
+        raise HTTPException(status_code=404, detail="Project not found")
+    before = chat_context.task_snapshot(task)
+    counters_before = crud.counter_snapshot(task)
+    
+    for key, value in update_data.items():
+        setattr(task, key, value)
+    task.change_seq = await crud.next_change_seq(db, current_user_id)
+    
+    await crud.adjust_project_counters(db, counters_before, crud.counter_snapshot(task))
+    await db.commit()
+    await db.refresh(task)
+    chat_context.summaries.task_updated(current_user_id, before, task)
+    http_cache.invalidate(current_user_id)
+    await events.publish(current_user_id, "task.updated", changed_fields(task, update_data))
+    return task
+
+@router.delete("/tasks/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_task(
+    task_id: int,
+    current_user_id: int = Depends(auth.get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    task = await get_owned_task(db, task_id, current_user_id, restore=True)
+    
+    before = chat_context.task_snapshot(task)
+    await crud.adjust_project_counters(db, crud.counter_snapshot(task), None)
+    await crud.record_deletions(db, current_user_id, "task", [task_id])
+    await db.delete(task)
+    await db.commit()
+    chat_context.summaries.task_deleted(current_user_id, before)
+    http_cache.invalidate(current_user_id)
+    await events.publish(current_user_id, "task.deleted", {"id": task_id})
+    return None
+
+@router.post("/tasks/mark_all_completed", status_code=200)
+async def mark_all_tasks_completed(
+    db: AsyncSession = Depends(get_db), 
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    """Con más de JOB_THRESHOLD_ROWS tareas pendientes responde 202 y lo hace un trabajo"""
+    pending = await db.scalar(select(func.count()).select_from(models.Task).where(
+        models.Task.owner_id == current_user_id,
+        models.Task.completed == False
+    ))
+    if pending > jobs.JOB_THRESHOLD_ROWS:
+        return await routes_jobs.enqueue_job(
+            db, current_user_id, "tasks.mark_all_completed", {},
+            f"{pending} tareas se marcarán como completadas en segundo plano",
+        )
+    task_ids = await _mark_tasks_completed(db, current_user_id)
+    return {"detail": f"{len(task_ids)} tareas marcadas como completadas"}
+
+async def _mark_tasks_completed(db: AsyncSession, user_id: int, ids: Optional[List[int]] = None) -> List[int]:
+    task_ids = await crud.bulk_update_tasks(
+        db, user_id, {"completed": True}, ids=ids, filters=None if ids is not None else {"completed": False}
+    )
+    await db.commit()
+    chat_context.summaries.invalidate(user_id)
+    http_cache.invalidate(user_id)
+    await events.publish(user_id, "task.bulk_updated", {"ids": task_ids, "changes": {"completed": True}})
+    return task_ids
+
+@jobs.handler("tasks.mark_all_completed")
+async def mark_all_tasks_completed_job(ctx: jobs.JobContext, db: AsyncSession, payload: dict):
+    """Por lotes de JOB_BATCH_SIZE, cada uno en su transacción"""
+    conditions = models.Task.owner_id == ctx.owner_id, models.Task.completed == False
+    total = await db.scalar(select(func.count()).select_from(models.Task).where(*conditions))
+    updated = 0
+    while True:
+        ids = (await db.scalars(
+            select(models.Task.id).where(*conditions).order_by(models.Task.id).limit(jobs.JOB_BATCH_SIZE)
+        )).all()
+        if not ids:
+            return {"updated": updated}
+        updated += len(await _mark_tasks_completed(db, ctx.owner_id, list(ids)))
+        await ctx.report(100 * updated // max(total, updated))
+
+# ==================== TAREAS: OPERACIONES MASIVAS ====================
+
+def _bulk_selection(selection: schemas.TaskBulkSelection):
+    filters = selection.filter.dict(exclude_none=True) if selection.filter else None
+    return selection.ids, filters
+
+@router.post("/tasks/bulk", response_model=List[schemas.Task], status_code=status.HTTP_201_CREATED)
+async def bulk_create_tasks(
+    payload: schemas.TaskBulkCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    tasks = [task.dict(exclude_unset=True) for task in payload.tasks]
+    if await crud.missing_projects(db, current_user_id, (task.get("project_id") for task in tasks)):
+        raise HTTPException(status_code=404, detail="Project not found")
+    try:
+        created = await crud.bulk_create_tasks(db, current_user_id, tasks)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await db.commit()
+    chat_context.summaries.invalidate(current_user_id)
+    http_cache.invalidate(current_user_id)
+    await events.publish(
+        current_user_id, "task.bulk_created", {"tasks": [schemas.Task.model_validate(t) for t in created]}
+    )
+    return created
+
+@router.patch("/tasks/bulk", response_model=schemas.BulkResult)
+async def bulk_update_tasks(
+    payload: schemas.TaskBulkUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    changes = payload.changes.dict(exclude_unset=True)
+    if await crud.missing_projects(db, current_user_id, [changes.get("project_id")]):
+        raise HTTPException(status_code=404, detail="Project not found")
+    ids, filters = _bulk_selection(payload)
+    try:
+        task_ids = await crud.bulk_update_tasks(db, current_user_id, changes, ids=ids, filters=filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await db.commit()
+    chat_context.summaries.invalidate(current_user_id)
+    http_cache.invalidate(current_user_id)
+    await events.publish(current_user_id, "task.bulk_updated", {"ids": task_ids, "changes": changes})
+    return {"count": len(task_ids), "ids": task_ids}
+
+@router.post("/tasks/bulk/delete", response_model=schemas.BulkResult)
+async def bulk_delete_tasks(
+    payload: schemas.TaskBulkSelection,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    ids, filters = _bulk_selection(payload)
+    try:
+        task_ids = await crud.bulk_delete_tasks(db, current_user_id, ids=ids, filters=filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await db.commit()
+    chat_context.summaries.invalidate(current_user_id)
+    http_cache.invalidate(current_user_id)
+    await events.publish(current_user_id, "task.bulk_deleted", {"ids": task_ids})
+    return {"count": len(task_ids), "ids": task_ids}
+
+@router.post("/tasks/bulk/move", response_model=schemas.BulkResult)
+async def bulk_move_tasks(
+    payload: schemas.TaskBulkMove,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    """Mover tareas a un proyecto (project_id null las saca de su proyecto)"""
+    if await crud.missing_projects(db, current_user_id, [payload.project_id]):
+        raise HTTPException(status_code=404, detail="Project not found")
+    ids, filters = _bulk_selection(payload)
+    try:
+        task_ids = await crud.bulk_update_tasks(
+            db, current_user_id, {"project_id": payload.project_id}, ids=ids, filters=filters
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await db.commit()
+    chat_context.summaries.invalidate(current_user_id)
+    http_cache.invalidate(current_user_id)
+    await events.publish(
+        current_user_id, "task.bulk_updated", {"ids": task_ids, "changes": {"project_id": payload.project_id}}
+    )
+    return {"count": len(task_ids), "ids": task_ids}
+
+# ==================== TAREAS: NOTAS Y PUNTOS CRÍTICOS ====================
+# Cada nota o punto crítico es una fila propia, así que añadir o editar uno no
+# reescribe los demás. Cualquier cambio cuenta como cambio de la tarea (ETag
+# del detalle y GET /sync). Las de una tarea archivada se leen de su fila en
+# archived_tasks; escribir en ellas devuelve la tarea a tasks.
+
+async def _touch_task(db: AsyncSession, task_id: int, owner_id: int):
+    task = await get_owned_task(db, task_id, owner_id, restore=True)
+    task.change_seq = await crud.next_change_seq(db, owner_id)
+    return task
+
+async def _get_task_item(db: AsyncSession, model, task_id: int, item_id: int, detail: str):
+    item = await db.scalar(select(model).where(model.id == item_id, model.task_id == task_id))
+    if not item:
+        raise HTTPException(status_code=404, detail=detail)
+    return item
+
+async def _archived_task_items(db: AsyncSession, task_id: int, owner_id: int, key: str) -> list:
+    task = await archive.get_archived_task(db, owner_id, task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return task[key]
+
+async def _task_item_changed(db: AsyncSession, owner_id: int, event_type: str, data: dict):
+    await db.commit()
+    http_cache.invalidate(owner_id)
+    await events.publish(owner_id, event_type, data)
+
+@router.get("/tasks/{task_id}/notes", response_model=List[schemas.TaskNote])
+async def get_task_notes(
+    task_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    if await find_owned_task(db, task_id, current_user_id) is None:
+        return await _archived_task_items(db, task_id, current_user_id, "notes")
+    return (await db.scalars(
+        select(models.TaskNote).where(models.TaskNote.task_id == task_id).order_by(models.TaskNote.id)
+    )).all()
+
+@router.post("/tasks/{task_id}/notes", response_model=schemas.TaskNote, status_code=status.HTTP_201_CREATED)
+async def create_task_note(
+    task_id: int,
+    note: schemas.TaskNoteCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    await _touch_task(db, task_id, current_user_id)
+    db_note = models.TaskNote(task_id=task_id, text=note.text)
+    db.add(db_note)
+    await db.flush()
+    await db.refresh(db_note)
+    result = schemas.TaskNote.model_validate(db_note)
+    await _task_item_changed(db, current_user_id, "task.note_created", result)
+    return result
+
+@router.patch("/tasks/{task_id}/notes/{note_id}", response_model=schemas.TaskNote)
+async def update_task_note(
+    task_id: int,
+    note_id: int,
+    note_update: schemas.TaskNoteUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    await _touch_task(db, task_id, current_user_id)
+    note = await _get_task_item(db, models.TaskNote, task_id, note_id, "Note not found")
+    note.text = note_update.text
+    await db.flush()
+    await db.refresh(note)
+    result = schemas.TaskNote.model_validate(note)
+    await _task_item_changed(db, current_user_id, "task.note_updated", result)
+    return result
+
+@router.delete("/tasks/{task_id}/notes/{note_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_task_note(
+    task_id: int,
+    note_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    await _touch_task(db, task_id, current_user_id)
+    note = await _get_task_item(db, models.TaskNote, task_id, note_id, "Note not found")
+    await db.delete(note)
+    await _task_item_changed(db, current_user_id, "task.note_deleted", {"id": note_id, "task_id": task_id})
+    return None
+
+@router.get("/tasks/{task_id}/critical-points", response_model=List[schemas.TaskCriticalPoint])
+async def get_task_critical_points(
+    task_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    if await find_owned_task(db, task_id, current_user_id) is None:
+        return await _archived_task_items(db, task_id, current_user_id, "critical_points")
+    return (await db.scalars(
+        select(models.TaskCriticalPoint)
+        .where(models.TaskCriticalPoint.task_id == task_id)
+        .order_by(models.TaskCriticalPoint.id)
+    )).all()
+
+@router.post("/tasks/{task_id}/critical-points", response_model=schemas.TaskCriticalPoint, status_code=status.HTTP_201_CREATED)
+async def create_task_critical_point(
+    task_id: int,
+    point: schemas.TaskCriticalPointCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    await _touch_task(db, task_id, current_user_id)
+    db_point = models.TaskCriticalPoint(task_id=task_id, **point.dict())
+    db.add(db_point)
+    await db.flush()
+    await db.refresh(db_point)
+    result = schemas.TaskCriticalPoint.model_validate(db_point)
+    await _task_item_changed(db, current_user_id, "task.critical_point_created", result)
+    return result
+
+@router.patch("/tasks/{task_id}/critical-points/{point_id}", response_model=schemas.TaskCriticalPoint)
+async def update_task_critical_point(
+    task_id: int,
+    point_id: int,
+    point_update: schemas.TaskCriticalPointUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    await _touch_task(db, task_id, current_user_id)
+    point = await _get_task_item(db, models.TaskCriticalPoint, task_id, point_id, "Critical point not found")
+    for key, value in point_update.dict(exclude_unset=True).items():
+        setattr(point, key, value)
+    await db.flush()
+    await db.refresh(point)
+    result = schemas.TaskCriticalPoint.model_validate(point)
+    await _task_item_changed(db, current_user_id, "task.critical_point_updated", result)
+    return result
+
+@router.delete("/tasks/{task_id}/critical-points/{point_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_task_critical_point(
+    task_id: int,
+    point_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id)
+):
+    await _touch_task(db, task_id, current_user_id)
+    point = await _get_task_item(db, models.TaskCriticalPoint, task_id, point_id, "Critical point not found")
+    await db.delete(point)
+    await _task_item_changed(
+        db, current_user_id, "task.critical_point_deleted", {"id": point_id, "task_id": task_id}
+    )
+    return None
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
-from datetime import datetime
+from typing import Dict, List, Optional
+from datetime import date, datetime
 
 # User Schemas
 class UserBase(BaseModel):
@@ -23,6 +23,14 @@ class User(UserBase):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None  # Segundos de validez del access token
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
 
 class TokenData(BaseModel):
     email: Optional[str] = None
@@ -50,6 +58,15 @@ class Project(ProjectBase):
     class Config:
         from_attributes = True
 
+class ProjectTaskSummary(BaseModel):
+    task_count: int
+    completed_count: int
+    completion_rate: float
+    average_progress: float
+
+class ProjectWithSummary(Project):
+    task_summary: Optional[ProjectTaskSummary] = None  # Solo con ?include=task_summary
+
 # Task Schemas
 class TaskBase(BaseModel):
     title: str
@@ -59,9 +76,7 @@ class TaskBase(BaseModel):
     category: Optional[str] = None
     due_date: Optional[datetime] = None
     project_id: Optional[int] = None
-    notes: Optional[str] = None  # ✅ AGREGADO
     progress: Optional[int] = 0  # ✅ AGREGADO
-    critical_points: Optional[str] = None  # ✅ AGREGADO
 
 class TaskCreate(TaskBase):
     pass
@@ -75,9 +90,7 @@ class TaskUpdate(BaseModel):
     due_date: Optional[datetime] = None
     completed: Optional[bool] = None
     project_id: Optional[int] = None
-    notes: Optional[str] = None  # ✅ AGREGADO
     progress: Optional[int] = None  # ✅ AGREGADO
-    critical_points: Optional[str] = None  # ✅ AGREGADO
 
 class Task(TaskBase):
     id: int
@@ -88,4 +101,203 @@ class Task(TaskBase):
     updated_at: Optional[datetime] = None
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class ProjectWithTasks(ProjectWithSummary):
+    tasks: Optional[List[Task]] = None  # Solo con ?include=tasks
+
+# Notes / Critical Points Schemas
+class TaskNoteCreate(BaseModel):
+    text: str
+
+class TaskNoteUpdate(BaseModel):
+    text: str
+
+class TaskNote(TaskNoteCreate):
+    id: int
+    task_id: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+class TaskCriticalPointCreate(BaseModel):
+    text: str
+    resolved: bool = False
+
+class TaskCriticalPointUpdate(BaseModel):
+    text: Optional[str] = None
+    resolved: Optional[bool] = None
+
+class TaskCriticalPoint(TaskCriticalPointCreate):
+    id: int
+    task_id: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+class TaskDetail(Task):
+    """GET /tasks/{id}: la tarea con sus notas y puntos críticos (los listados no los incluyen)"""
+    notes: List[TaskNote] = []
+    critical_points: List[TaskCriticalPoint] = []
+
+# Bulk Task Schemas
+class TaskFilter(BaseModel):
+    status: Optional[str] = None
+    priority: Optional[str] = None
+    category: Optional[str] = None
+    project_id: Optional[int] = None
+    completed: Optional[bool] = None
+    due_from: Optional[datetime] = None
+    due_to: Optional[datetime] = None
+
+class TaskBulkCreate(BaseModel):
+    tasks: List[TaskCreate]
+
+class TaskBulkSelection(BaseModel):
+    """Tareas afectadas: por lista de ids, por filtro o por ambos"""
+    ids: Optional[List[int]] = None
+    filter: Optional[TaskFilter] = None
+
+class TaskBulkUpdate(TaskBulkSelection):
+    changes: TaskUpdate
+
+class TaskBulkMove(TaskBulkSelection):
+    project_id: Optional[int] = None
+
+class BulkResult(BaseModel):
+    count: int
+    ids: List[int]
+
+# Export / Import Schemas
+class TaskImport(TaskCreate):
+    """Fila de tarea de un fichero de importación (admite el estado de una exportación)"""
+    completed: bool = False
+    completed_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+
+class ProjectImport(ProjectCreate):
+    id: Optional[int] = None  # Id en el fichero: las tareas lo referencian con project_id
+    created_at: Optional[datetime] = None
+
+class ImportRowError(BaseModel):
+    line: int
+    detail: str
+
+class ImportResult(BaseModel):
+    projects_created: int
+    tasks_created: int
+    error_count: int
+    errors: List[ImportRowError]  # Las primeras MAX_IMPORT_ERRORS
+
+# Job Schemas
+class Job(BaseModel):
+    id: int
+    kind: str
+    status: str
+    progress: int
+    attempts: int
+    max_attempts: int
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+class JobAccepted(BaseModel):
+    """Respuesta 202 de una operación enviada a la cola (consultar GET /jobs/{job_id})"""
+    job_id: int
+    status: str
+    detail: str
+
+# Attachment Schemas
+class Attachment(BaseModel):
+    id: int
+    task_id: Optional[int] = None
+    filename: str
+    content_type: Optional[str] = None
+    size: int
+    sha256: str
+    storage_key: str
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int
+    content_type: Optional[str] = None
+    task_id: Optional[int] = None
+
+class UploadSession(BaseModel):
+    upload_id: str
+    filename: str
+    size: int
+    offset: int
+    chunk_size: int
+    complete: bool = False
+    attachment: Optional[Attachment] = None
+
+# Stats Schemas
+class ThroughputPoint(BaseModel):
+    date: date
+    completed: int
+
+class ProjectStats(BaseModel):
+    project_id: int
+    name: str
+    status: Optional[str] = None
+    task_count: int
+    completed_count: int
+    completion_rate: float
+    average_progress: float
+    overdue_count: int
+
+class Stats(BaseModel):
+    total: int
+    completed: int
+    overdue: int
+    average_progress: float
+    by_status: Dict[str, int]
+    by_priority: Dict[str, int]
+    by_category: Dict[str, int]
+    throughput_daily: List[ThroughputPoint]
+    throughput_weekly: List[ThroughputPoint]
+    projects: List[ProjectStats]
+
+# Search Schemas
+class SearchResult(BaseModel):
+    kind: str  # task, project
+    id: int
+    title: str
+    headline: Optional[str] = None  # Fragmento con los términos entre <mark></mark>
+    rank: float
+
+# Event Schemas
+class Event(BaseModel):
+    version: int
+    type: str  # task.created, task.updated, task.deleted, task.bulk_*, project.*
+    ts: float
+    data: dict
+
+class EventBatch(BaseModel):
+    version: int
+    events: List[Event]
+
+# Sync Schemas
+class SyncResponse(BaseModel):
+    seq: int
+    has_more: bool
+    task_columns: List[str]
+    tasks: List[list]
+    project_columns: List[str]
+    projects: List[list]
+    deleted_tasks: List[int]
+    deleted_projects: List[int]
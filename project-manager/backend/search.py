@@ -0,0 +1,303 @@
+"""
+Búsqueda de texto completo sobre tareas y proyectos.
+
+En Postgres se usa una columna tsvector generada con índice GIN y, si no hay
+coincidencias, un fallback por trigramas (pg_trgm) para prefijos y errores
+tipográficos; las notas de las tareas (task_notes) también se indexan. En
+SQLite (tests) se usan tablas virtuales FTS5 mantenidas por triggers, sin las
+notas. Las tareas archivadas (archived_tasks, ver archive.py) se buscan igual
+que las de tasks, con el texto de sus notas en notes_text. El DDL se engancha
+a la creación de las tablas; para bases ya existentes están las revisiones de
+migrations.py.
+"""
+
+import os
+import re
+from typing import List, Optional
+
+from sqlalchemy import DDL, event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+import pagination
+
+SEARCH_TS_CONFIG = os.getenv("SEARCH_TS_CONFIG", "simple")
+MAX_SEARCH_PAGE_SIZE = 100
+SEARCH_KINDS = ("project", "task")
+
+# ==================== DDL ====================
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"""
+    ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_TS_CONFIG}'::regconfig, coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_TS_CONFIG}'::regconfig, coalesce(category, '')), 'B') ||
+        setweight(to_tsvector('{SEARCH_TS_CONFIG}'::regconfig, coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    f"""
+    ALTER TABLE projects ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_TS_CONFIG}'::regconfig, coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_TS_CONFIG}'::regconfig, coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_tasks_search_vector ON tasks USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_projects_search_vector ON projects USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_tasks_title_trgm ON tasks USING GIN (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_projects_name_trgm ON projects USING GIN (name gin_trgm_ops)",
+]
+
+# Las notas de una tarea cuentan como texto de la tarea con el peso más bajo
+POSTGRES_NOTES_DDL = [
+    f"""
+    ALTER TABLE task_notes ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_TS_CONFIG}'::regconfig, coalesce(text, '')), 'D')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_task_notes_search_vector ON task_notes USING GIN (search_vector)",
+]
+
+POSTGRES_ARCHIVE_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"""
+    ALTER TABLE archived_tasks ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_TS_CONFIG}'::regconfig, coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_TS_CONFIG}'::regconfig, coalesce(category, '')), 'B') ||
+        setweight(to_tsvector('{SEARCH_TS_CONFIG}'::regconfig, coalesce(description, '')), 'C') ||
+        setweight(to_tsvector('{SEARCH_TS_CONFIG}'::regconfig, coalesce(notes_text, '')), 'D')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_archived_tasks_search_vector ON archived_tasks USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_archived_tasks_title_trgm ON archived_tasks USING GIN (title gin_trgm_ops)",
+]
+
+
+def _sqlite_fts_ddl(table: str, columns: List[str]) -> List[str]:
+    cols = ", ".join(columns)
+    new_values = ", ".join(f"new.{c}" for c in columns)
+    old_values = ", ".join(f"old.{c}" for c in columns)
+    fts = f"{table}_fts"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', "
+        f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END",
+    ]
+
+
+SQLITE_TASKS_DDL = _sqlite_fts_ddl("tasks", ["title", "description", "category"])
+SQLITE_PROJECTS_DDL = _sqlite_fts_ddl("projects", ["name", "description"])
+SQLITE_ARCHIVED_TASKS_DDL = _sqlite_fts_ddl("archived_tasks", ["title", "description", "category", "notes_text"])
+
+
+def _register_ddl(table, postgres: List[str], sqlite: List[str]) -> None:
+    for statement in postgres:
+        event.listen(table, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+    for statement in sqlite:
+        event.listen(table, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
+
+_register_ddl(models.Project.__table__, [], SQLITE_PROJECTS_DDL)
+# Las sentencias de Postgres tocan ambas tablas: se lanzan al crear tasks,
+# que depende de projects y por tanto se crea después
+_register_ddl(models.Task.__table__, POSTGRES_DDL, SQLITE_TASKS_DDL)
+_register_ddl(models.TaskNote.__table__, POSTGRES_NOTES_DDL, [])
+_register_ddl(models.ArchivedTask.__table__, POSTGRES_ARCHIVE_DDL, SQLITE_ARCHIVED_TASKS_DDL)
+
+# ==================== CONSULTAS ====================
+
+_KEYSET_SQL = " AND (rank < :cursor_rank OR (rank = :cursor_rank AND (kind > :cursor_kind OR (kind = :cursor_kind AND id > :cursor_id))))"
+_ORDER_SQL = " ORDER BY rank DESC, kind, id LIMIT :limit"
+_HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=5"
+
+_POSTGRES_FTS_PARTS = {
+    "project": "SELECT 'project' AS kind, p.id AS id, ts_rank(p.search_vector, q.query) AS rank "
+               "FROM projects p, q WHERE p.owner_id = :owner_id AND p.search_vector @@ q.query",
+    "task": "SELECT 'task' AS kind, id, max(rank) AS rank FROM ("
+            "SELECT t.id AS id, ts_rank(t.search_vector, q.query) AS rank "
+            "FROM tasks t, q WHERE t.owner_id = :owner_id AND t.search_vector @@ q.query "
+            "UNION ALL "
+            "SELECT n.task_id AS id, ts_rank(n.search_vector, q.query) AS rank "
+            "FROM task_notes n JOIN tasks t ON t.id = n.task_id, q "
+            "WHERE t.owner_id = :owner_id AND n.search_vector @@ q.query "
+            "UNION ALL "
+            "SELECT a.id AS id, ts_rank(a.search_vector, q.query) AS rank "
+            "FROM archived_tasks a, q WHERE a.owner_id = :owner_id AND a.search_vector @@ q.query"
+            ") task_hits GROUP BY id",
+}
+
+_POSTGRES_TRGM_PARTS = {
+    "project": "SELECT 'project' AS kind, id, similarity(name, :q) AS rank FROM projects "
+               "WHERE owner_id = :owner_id AND (name % :q OR name ILIKE :prefix ESCAPE '\\')",
+    "task": "SELECT 'task' AS kind, id, similarity(title, :q) AS rank FROM tasks "
+            "WHERE owner_id = :owner_id AND (title % :q OR title ILIKE :prefix ESCAPE '\\') "
+            "UNION ALL "
+            "SELECT 'task' AS kind, id, similarity(title, :q) AS rank FROM archived_tasks "
+            "WHERE owner_id = :owner_id AND (title % :q OR title ILIKE :prefix ESCAPE '\\')",
+}
+
+_SQLITE_PARTS = {
+    "project": "SELECT 'project' AS kind, p.id AS id, -bm25(projects_fts) AS rank, "
+               "highlight(projects_fts, 0, '<mark>', '</mark>') AS title, "
+               "snippet(projects_fts, -1, '<mark>', '</mark>', '…', 12) AS headline "
+               "FROM projects_fts JOIN projects p ON p.id = projects_fts.rowid "
+               "WHERE projects_fts MATCH :q AND p.owner_id = :owner_id",
+    "task": "SELECT 'task' AS kind, t.id AS id, -bm25(tasks_fts) AS rank, "
+            "highlight(tasks_fts, 0, '<mark>', '</mark>') AS title, "
+            "snippet(tasks_fts, -1, '<mark>', '</mark>', '…', 12) AS headline "
+            "FROM tasks_fts JOIN tasks t ON t.id = tasks_fts.rowid "
+            "WHERE tasks_fts MATCH :q AND t.owner_id = :owner_id "
+            "UNION ALL "
+            "SELECT 'task' AS kind, a.id AS id, -bm25(archived_tasks_fts) AS rank, "
+            "highlight(archived_tasks_fts, 0, '<mark>', '</mark>') AS title, "
+            "snippet(archived_tasks_fts, -1, '<mark>', '</mark>', '…', 12) AS headline "
+            "FROM archived_tasks_fts JOIN archived_tasks a ON a.id = archived_tasks_fts.rowid "
+            "WHERE archived_tasks_fts MATCH :q AND a.owner_id = :owner_id",
+}
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts5_query(q: str) -> str:
+    """Convertir texto libre en una consulta FTS5 segura: todos los términos, por prefijo"""
+    terms = re.findall(r"\w+", q, flags=re.UNICODE)
+    return " AND ".join(f'"{term}"*' for term in terms)
+
+
+def _highlight(title: str, q: str) -> str:
+    terms = [re.escape(term) for term in re.findall(r"\w+", q, flags=re.UNICODE)]
+    if not terms:
+        return title
+    return re.sub("(" + "|".join(terms) + ")", r"<mark>\1</mark>", title, flags=re.IGNORECASE)
+
+
+async def _run(db: AsyncSession, sql: str, params: dict, cursor_value) -> list:
+    if cursor_value is not None:
+        (params["cursor_rank"], params["cursor_kind"]), params["cursor_id"] = cursor_value
+    return (await db.execute(text(sql), params)).mappings().all()
+
+
+async def _search_postgres(db, owner_id, q, kinds, limit, mode, cursor_value) -> list:
+    params = {"owner_id": owner_id, "q": q, "limit": limit, "cfg": SEARCH_TS_CONFIG}
+    keyset = _KEYSET_SQL if cursor_value is not None else ""
+    if mode == "fts":
+        hits = " UNION ALL ".join(_POSTGRES_FTS_PARTS[k] for k in kinds)
+        sql = (
+            "WITH q AS (SELECT websearch_to_tsquery(CAST(:cfg AS regconfig), :q) AS query), "
+            f"hits AS ({hits}), "
+            f"page AS (SELECT * FROM hits WHERE TRUE{keyset}{_ORDER_SQL}) "
+            "SELECT page.kind, page.id, page.rank, COALESCE(p.name, t.title, a.title) AS title, "
+            "ts_headline(CAST(:cfg AS regconfig), CASE WHEN page.kind = 'project' "
+            "THEN coalesce(p.name, '') || ' ' || coalesce(p.description, '') "
+            "ELSE coalesce(t.title, a.title, '') || ' ' || coalesce(t.description, a.description, '') END, "
+            f"q.query, '{_HEADLINE_OPTIONS}') AS headline "
+            "FROM page CROSS JOIN q "
+            "LEFT JOIN projects p ON page.kind = 'project' AND p.id = page.id "
+            "LEFT JOIN tasks t ON page.kind = 'task' AND t.id = page.id "
+            "LEFT JOIN archived_tasks a ON page.kind = 'task' AND a.id = page.id "
+            "ORDER BY page.rank DESC, page.kind, page.id"
+        )
+        return await _run(db, sql, params, cursor_value)
+
+    params["prefix"] = _escape_like(q) + "%"
+    hits = " UNION ALL ".join(_POSTGRES_TRGM_PARTS[k] for k in kinds)
+    sql = (
+        f"WITH hits AS ({hits}), "
+        f"page AS (SELECT * FROM hits WHERE TRUE{keyset}{_ORDER_SQL}) "
+        "SELECT page.kind, page.id, page.rank, COALESCE(p.name, t.title, a.title) AS title "
+        "FROM page "
+        "LEFT JOIN projects p ON page.kind = 'project' AND p.id = page.id "
+        "LEFT JOIN tasks t ON page.kind = 'task' AND t.id = page.id "
+        "LEFT JOIN archived_tasks a ON page.kind = 'task' AND a.id = page.id "
+        "ORDER BY page.rank DESC, page.kind, page.id"
+    )
+    rows = await _run(db, sql, params, cursor_value)
+    return [{**row, "headline": _highlight(row["title"] or "", q)} for row in rows]
+
+
+async def _search_sqlite(db, owner_id, q, kinds, limit, cursor_value) -> list:
+    match = _fts5_query(q)
+    if not match:
+        return []
+    params = {"owner_id": owner_id, "q": match, "limit": limit}
+    keyset = _KEYSET_SQL if cursor_value is not None else ""
+    hits = " UNION ALL ".join(_SQLITE_PARTS[k] for k in kinds)
+    sql = f"WITH hits AS ({hits}) SELECT * FROM hits WHERE 1 = 1{keyset}{_ORDER_SQL}"
+    return await _run(db, sql, params, cursor_value)
+
+
+async def search(
+    db: AsyncSession,
+    owner_id: int,
+    q: str,
+    kind: Optional[str] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+):
+    """
+    Buscar en tareas y proyectos del usuario ordenando por relevancia.
+
+    Devuelve (resultados, next_cursor). En Postgres, si la búsqueda de texto
+    completo no encuentra nada en la primera página se pasa a trigramas; el
+    modo queda guardado en el cursor para las páginas siguientes.
+    """
+    q = q.strip()
+    if not q:
+        raise ValueError("Empty query")
+    if kind is not None and kind not in SEARCH_KINDS:
+        raise ValueError(f"Invalid kind: {kind}")
+    kinds = [kind] if kind else list(SEARCH_KINDS)
+    limit = min(limit, MAX_SEARCH_PAGE_SIZE)
+    dialect = db.get_bind().dialect.name
+
+    mode = "fts"
+    cursor_value = None
+    if cursor:
+        for candidate in ("fts", "trgm"):
+            try:
+                cursor_value = pagination.decode_cursor(cursor, f"search:{candidate}")
+            except ValueError:
+                continue
+            mode = candidate
+            break
+        else:
+            raise ValueError("Invalid cursor")
+
+    if dialect == "postgresql":
+        rows = await _search_postgres(db, owner_id, q, kinds, limit + 1, mode, cursor_value)
+        if not rows and mode == "fts" and cursor is None:
+            mode = "trgm"
+            rows = await _search_postgres(db, owner_id, q, kinds, limit + 1, mode, None)
+    elif dialect == "sqlite":
+        rows = await _search_sqlite(db, owner_id, q, kinds, limit + 1, cursor_value)
+    else:
+        raise ValueError(f"Search is not supported on {dialect}")
+
+    results = [
+        {
+            "kind": row["kind"],
+            "id": row["id"],
+            "title": row["title"],
+            "headline": row["headline"],
+            "rank": float(row["rank"]),
+        }
+        for row in rows
+    ]
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        last = results[-1]
+        next_cursor = pagination.encode_cursor(f"search:{mode}", [last["rank"], last["kind"]], last["id"])
+    return results, next_cursor
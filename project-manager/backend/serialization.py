@@ -0,0 +1,55 @@
+"""
+Serialización JSON rápida.
+
+Con orjson instalado las respuestas se codifican directamente a bytes (sabe
+serializar datetime, date y UUID sin pasar por jsonable_encoder); si no, se
+usa json de la librería estándar con el mismo formato que JSONResponse.
+Los listados grandes se construyen como dicts a partir de las tuplas de la
+consulta, sin crear objetos ORM ni modelos pydantic por fila.
+"""
+
+import json
+from typing import Any, Iterable, List, Sequence
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson es opcional
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    # Tipos que orjson no conoce (modelos pydantic, Decimal...)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    return jsonable_encoder(obj)
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def loads(data):
+    """Lanza ValueError si no es JSON válido"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """Clase de respuesta por defecto de la app"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def rows_to_dicts(columns: Sequence[str], rows: Iterable[Sequence]) -> List[dict]:
+    """Filas de una consulta por columnas -> lista de dicts listos para serializar"""
+    return [dict(zip(columns, row)) for row in rows]
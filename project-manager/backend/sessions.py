@@ -0,0 +1,225 @@
+"""
+Sesiones: refresh tokens con rotación y lista de revocación.
+
+/login emite un access token corto y un refresh token largo, ambos con el id
+de sesión ("sid"). Renovar con POST /token/refresh solo comprueba la firma
+del refresh token y la lista de revocación, sin hash de contraseña ni BD.
+Cada refresh token sirve una sola vez: al usarlo se revoca su "jti" y se
+emite otro. Si alguien presenta uno ya usado (lo ha copiado un tercero) se
+revoca la sesión entera. /logout revoca la sesión y, como el access token
+lleva el mismo "sid", deja de aceptarse también sin esperar a que caduque.
+
+La lista guarda solo claves de 16 bytes con su caducidad y se purga sola:
+una revocación solo hace falta recordarla mientras el token revocado siga
+siendo válido. ``MemorySessionStore`` vale para un único proceso. Con varios
+workers (main.Settings.workers > 1) se usa ``DatabaseSessionStore``: los
+refresh tokens canjeados se registran en la tabla revocations, cuya clave
+única hace atómica la detección de reutilización entre procesos, y cada
+worker copia en memoria las sesiones revocadas cada SESSION_SYNC_INTERVAL
+segundos, así que comprobar un access token sigue sin tocar la BD. Un
+/logout tarda como mucho ese intervalo en aplicarse en los demás workers.
+Se puede sustituir por otra implementación con ``set_session_store``.
+"""
+
+import asyncio
+import heapq
+import os
+import secrets
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+
+import database
+import models
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+SESSION_SYNC_INTERVAL = float(os.getenv("SESSION_SYNC_INTERVAL", "1"))
+# Margen al releer revocaciones recientes (transacciones que confirman tarde)
+SESSION_SYNC_OVERLAP = 60.0
+SESSION_PURGE_INTERVAL = 3600.0
+
+
+def new_id() -> str:
+    return secrets.token_hex(16)
+
+
+class SessionStore:
+    """
+    Interfaz de la lista de revocación. ``is_session_revoked`` se llama en
+    cada petición autenticada desde el event loop: no debe hacer E/S.
+    """
+
+    async def revoke_token(self, jti: str, expires_at: float) -> bool:
+        """Revocar un refresh token; devuelve False si ya estaba revocado"""
+        raise NotImplementedError
+
+    async def revoke_session(self, sid: str, expires_at: float) -> None:
+        raise NotImplementedError
+
+    def is_session_revoked(self, sid: str) -> bool:
+        raise NotImplementedError
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self):
+        self._tokens = {}  # jti (bytes) -> caducidad
+        self._sessions = {}  # sid (bytes) -> caducidad
+        self._expiry = []  # heap de (caducidad, tabla, clave) para purgar
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(value: str) -> bytes:
+        try:
+            return bytes.fromhex(value)
+        except ValueError:
+            return value.encode()
+
+    def _purge(self, now: float) -> None:
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, table, key = heapq.heappop(self._expiry)
+            entries = self._tokens if table == "t" else self._sessions
+            if entries.get(key) == expires_at:
+                del entries[key]
+
+    def _add(self, table: str, key: bytes, expires_at: float) -> None:
+        entries = self._tokens if table == "t" else self._sessions
+        entries[key] = expires_at
+        heapq.heappush(self._expiry, (expires_at, table, key))
+
+    async def revoke_token(self, jti: str, expires_at: float) -> bool:
+        key = self._key(jti)
+        with self._lock:
+            self._purge(time.time())
+            if key in self._tokens:
+                return False
+            self._add("t", key, expires_at)
+            return True
+
+    def _remember_session(self, sid: str, expires_at: float) -> None:
+        key = self._key(sid)
+        with self._lock:
+            self._purge(time.time())
+            if self._sessions.get(key, 0) < expires_at:
+                self._add("s", key, expires_at)
+
+    async def revoke_session(self, sid: str, expires_at: float) -> None:
+        self._remember_session(sid, expires_at)
+
+    def is_session_revoked(self, sid: str) -> bool:
+        expires_at = self._sessions.get(self._key(sid))
+        return expires_at is not None and expires_at > time.time()
+
+    def stats(self) -> dict:
+        return {"revoked_tokens": len(self._tokens), "revoked_sessions": len(self._sessions)}
+
+
+class DatabaseSessionStore(MemorySessionStore):
+    """Lista de revocación compartida entre workers (tabla revocations)"""
+
+    def __init__(self, sync_interval: float = SESSION_SYNC_INTERVAL):
+        super().__init__()
+        self.sync_interval = sync_interval
+        self._task: Optional[asyncio.Task] = None
+        self._synced_at: Optional[float] = None
+        self._purged_at = 0.0
+        self.syncs = 0
+
+    async def revoke_token(self, jti: str, expires_at: float) -> bool:
+        try:
+            async with database.AsyncSessionLocal() as db:
+                db.add(models.Revocation(kind="token", key=jti, expires_at=int(expires_at), revoked_at=time.time()))
+                await db.commit()
+        except IntegrityError:
+            # Otro worker (o esta misma petición repetida) ya lo canjeó
+            return False
+        return True
+
+    async def revoke_session(self, sid: str, expires_at: float) -> None:
+        revocation = models.Revocation
+        async with database.AsyncSessionLocal() as db:
+            try:
+                db.add(revocation(kind="session", key=sid, expires_at=int(expires_at), revoked_at=time.time()))
+                await db.commit()
+            except IntegrityError:
+                await db.rollback()
+                # Ya revocada: solo se alarga, y revoked_at hace que los demás la relean
+                await db.execute(
+                    update(revocation)
+                    .where(revocation.kind == "session", revocation.key == sid, revocation.expires_at < int(expires_at))
+                    .values(expires_at=int(expires_at), revoked_at=time.time())
+                )
+                await db.commit()
+        self._remember_session(sid, expires_at)
+
+    async def sync(self) -> None:
+        """Copiar a memoria las sesiones revocadas (todas la primera vez, luego las recientes)"""
+        revocation = models.Revocation
+        started = time.time()
+        query = select(revocation.key, revocation.expires_at).where(
+            revocation.kind == "session", revocation.expires_at > started
+        )
+        if self._synced_at is not None:
+            query = query.where(revocation.revoked_at >= self._synced_at - SESSION_SYNC_OVERLAP)
+        async with database.AsyncSessionLocal() as db:
+            rows = (await db.execute(query)).all()
+            if started - self._purged_at >= SESSION_PURGE_INTERVAL:
+                await db.execute(delete(revocation).where(revocation.expires_at <= started))
+                await db.commit()
+                self._purged_at = started
+        for sid, expires_at in rows:
+            self._remember_session(sid, expires_at)
+        self._synced_at = started
+        self.syncs += 1
+
+    async def start(self) -> None:
+        if self._task is None:
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Error cargando las sesiones revocadas")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Error sincronizando las sesiones revocadas")
+
+    def stats(self) -> dict:
+        return {"revoked_sessions": len(self._sessions), "syncs": self.syncs}
+
+
+store: SessionStore = MemorySessionStore()
+
+
+def set_session_store(new_store: SessionStore) -> None:
+    global store
+    store = new_store
+
+
+def session_expiry(now: Optional[float] = None) -> float:
+    """Hasta cuándo hay que recordar una sesión revocada (vida máxima de su refresh token)"""
+    return (now or time.time()) + REFRESH_TOKEN_EXPIRE_DAYS * 86400
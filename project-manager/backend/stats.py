@@ -0,0 +1,141 @@
+"""
+Estadísticas del panel calculadas con agregaciones en la base de datos.
+Los totales, desgloses y throughput incluyen las tareas archivadas
+(archived_tasks); las vencidas solo pueden estar en tasks. El throughput
+semanal solo incluye semanas completas (de lunes a domingo): empieza en el
+lunes de la semana en la que cae el inicio del histórico y no incluye la
+semana en curso.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List
+
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+
+TASK_TABLES = (models.Task, models.ArchivedTask)
+
+
+async def _count_by(db: AsyncSession, name: str, user_id: int) -> Dict[str, int]:
+    counts = defaultdict(int)
+    for model in TASK_TABLES:
+        column = getattr(model, name)
+        rows = await db.execute(
+            select(column, func.count())
+            .where(model.owner_id == user_id)
+            .group_by(column)
+        )
+        for key, count in rows:
+            counts[str(key) if key is not None else "none"] += count
+    return dict(counts)
+
+
+def _week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def _weekly(by_day: Dict[date, int], today: date) -> List[dict]:
+    """Semanas completas a partir de los recuentos por día (desde un lunes)"""
+    current_week = _week_start(today)
+    weeks = defaultdict(int)
+    for day, count in by_day.items():
+        week_start = _week_start(day)
+        if week_start < current_week:
+            weeks[week_start] += count
+    return [{"date": week, "completed": count} for week, count in sorted(weeks.items())]
+
+
+async def user_stats(db: AsyncSession, user_id: int, days: int = 30) -> dict:
+    """Totales, desgloses, throughput y métricas por proyecto de un usuario"""
+    now = datetime.now(timezone.utc)
+    task = models.Task
+    is_overdue = (task.completed == False) & (task.due_date < now)
+
+    total = completed = progress_sum = progress_count = 0
+    for model in TASK_TABLES:
+        row = (await db.execute(
+            select(
+                func.count(),
+                func.coalesce(func.sum(case((model.completed == True, 1), else_=0)), 0),
+                func.coalesce(func.sum(model.progress), 0),
+                func.count(model.progress),
+            ).where(model.owner_id == user_id)
+        )).one()
+        total, completed = total + row[0], completed + row[1]
+        progress_sum, progress_count = progress_sum + row[2], progress_count + row[3]
+    overdue = await db.scalar(select(func.count()).where(task.owner_id == user_id, is_overdue))
+
+    since = now - timedelta(days=days)
+    # El semanal empieza en el lunes anterior a ``since`` para que la primera
+    # semana no quede recortada; el diario sigue contando solo desde ``since``
+    weeks_since = datetime.combine(_week_start(since.date()), time.min, tzinfo=timezone.utc)
+    by_day, by_week_day = defaultdict(int), defaultdict(int)
+    for model in TASK_TABLES:
+        completed_day = func.date(model.completed_at)
+        daily_rows = await db.execute(
+            select(
+                completed_day,
+                func.count(),
+                func.coalesce(func.sum(case((model.completed_at >= since, 1), else_=0)), 0),
+            )
+            .where(model.owner_id == user_id, model.completed == True, model.completed_at >= weeks_since)
+            .group_by(completed_day)
+        )
+        for day, count, recent in daily_rows:
+            day = day if isinstance(day, date) else date.fromisoformat(str(day))
+            by_week_day[day] += count
+            if recent:
+                by_day[day] += recent
+    daily = [{"date": day, "completed": count} for day, count in sorted(by_day.items())]
+
+    # Proyectos: contadores precalculados + vencidas agrupadas por proyecto
+    overdue_rows = await db.execute(
+        select(task.project_id, func.count())
+        .where(task.owner_id == user_id, task.project_id.isnot(None), is_overdue)
+        .group_by(task.project_id)
+    )
+    overdue_by_project = dict(overdue_rows.all())
+    counter = models.ProjectTaskCounter
+    project_rows = await db.execute(
+        select(
+            models.Project.id,
+            models.Project.name,
+            models.Project.status,
+            func.coalesce(counter.task_count, 0),
+            func.coalesce(counter.completed_count, 0),
+            func.coalesce(counter.progress_sum, 0),
+        )
+        .outerjoin(counter, counter.project_id == models.Project.id)
+        .where(models.Project.owner_id == user_id)
+        .order_by(models.Project.id)
+    )
+    projects = [
+        {
+            "project_id": project_id,
+            "name": name,
+            "status": status,
+            "task_count": task_count,
+            "completed_count": completed_count,
+            "completion_rate": completed_count / task_count if task_count else 0.0,
+            "average_progress": progress_sum / task_count if task_count else 0.0,
+            "overdue_count": overdue_by_project.get(project_id, 0),
+        }
+        for project_id, name, status, task_count, completed_count, progress_sum in project_rows
+    ]
+
+    return {
+        "total": total,
+        "completed": completed,
+        "overdue": overdue or 0,
+        "average_progress": float(progress_sum / progress_count) if progress_count else 0.0,
+        "by_status": await _count_by(db, "status", user_id),
+        "by_priority": await _count_by(db, "priority", user_id),
+        "by_category": await _count_by(db, "category", user_id),
+        "throughput_daily": daily,
+        "throughput_weekly": _weekly(by_week_day, now.date()),
+        "projects": projects,
+    }
@@ -0,0 +1,310 @@
+"""
+Almacenamiento de adjuntos direccionado por contenido.
+
+Cada archivo se guarda una sola vez como uploads/<sha[:2]>/<sha256><ext>;
+subir el mismo contenido otra vez solo crea una fila nueva en attachments.
+La escritura a disco se hace por bloques fuera del event loop.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: solo se serializa dentro del proceso
+    fcntl = None
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+PARTIAL_DIR = os.path.join(UPLOAD_DIR, ".partial")
+CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE_MB", "25")) * 1024 * 1024
+MAX_RESUMABLE_UPLOAD_SIZE = int(os.getenv("MAX_RESUMABLE_UPLOAD_SIZE_MB", "2048")) * 1024 * 1024
+# Las subidas sin bloques nuevos en este tiempo se borran (cleanup_partial_uploads)
+UPLOAD_SESSION_TTL_HOURS = float(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+
+_EXTENSION_RE = re.compile(r"^\.[A-Za-z0-9]{1,10}$")
+_UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadNotFound(Exception):
+    pass
+
+
+class UploadBusy(Exception):
+    """Otra petición está escribiendo en la misma subida"""
+
+
+class UploadOffsetMismatch(Exception):
+    def __init__(self, offset: int):
+        super().__init__(f"Expected offset {offset}")
+        self.offset = offset
+
+
+@dataclass
+class StoredFile:
+    storage_key: str
+    sha256: str
+    size: int
+
+
+def storage_key(sha256: str, filename: Optional[str]) -> str:
+    """Ruta relativa de un contenido; se conserva la extensión para el Content-Type"""
+    ext = os.path.splitext(filename or "")[1].lower()
+    if not _EXTENSION_RE.match(ext):
+        ext = ""
+    return f"{sha256[:2]}/{sha256}{ext}"
+
+
+def storage_path(key: str) -> str:
+    return os.path.join(UPLOAD_DIR, key)
+
+
+def _commit_blob(tmp_path: str, key: str) -> None:
+    final_path = storage_path(key)
+    if os.path.exists(final_path):
+        # Contenido ya almacenado: se descarta la copia
+        os.remove(tmp_path)
+        return
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.replace(tmp_path, final_path)
+
+
+def _write_and_hash(fh, hasher, chunk: bytes) -> None:
+    hasher.update(chunk)
+    fh.write(chunk)
+
+
+def _open_temp() -> tuple:
+    os.makedirs(PARTIAL_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=PARTIAL_DIR, suffix=".tmp")
+    return os.fdopen(fd, "wb"), tmp_path
+
+
+async def iter_upload_file(file: UploadFile) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def save_stream(chunks: AsyncIterator[bytes], filename: Optional[str], max_size: int = MAX_UPLOAD_SIZE) -> StoredFile:
+    """Guardar un flujo de bytes calculando su sha256 mientras se escribe"""
+    fh, tmp_path = await run_in_threadpool(_open_temp)
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_size:
+                raise UploadTooLarge()
+            await run_in_threadpool(_write_and_hash, fh, hasher, chunk)
+    except BaseException:
+        await run_in_threadpool(fh.close)
+        await run_in_threadpool(os.remove, tmp_path)
+        raise
+    await run_in_threadpool(fh.close)
+
+    sha256 = hasher.hexdigest()
+    key = storage_key(sha256, filename)
+    await run_in_threadpool(_commit_blob, tmp_path, key)
+    return StoredFile(storage_key=key, sha256=sha256, size=size)
+
+
+# ==================== SUBIDAS REANUDABLES ====================
+# El estado vive en disco (uploads/.partial/<id>.json + <id>.part), así que
+# una subida se puede continuar aunque el proceso se haya reiniciado. Cada
+# bloque se escribe con un lock exclusivo sobre el .part (flock, válido entre
+# workers) y el offset se comprueba con el tamaño real bajo ese lock: dos
+# peticiones con el mismo offset no pueden duplicar bytes.
+
+_appending = set()  # Sin fcntl: subidas con un bloque en curso en este proceso
+_appending_lock = threading.Lock()
+
+def _session_paths(upload_id: str) -> tuple:
+    return (
+        os.path.join(PARTIAL_DIR, f"{upload_id}.json"),
+        os.path.join(PARTIAL_DIR, f"{upload_id}.part"),
+    )
+
+
+def _create_session(meta: dict) -> None:
+    os.makedirs(PARTIAL_DIR, exist_ok=True)
+    meta_path, part_path = _session_paths(meta["upload_id"])
+    open(part_path, "wb").close()
+    with open(meta_path, "w") as fh:
+        json.dump(meta, fh)
+
+
+def _load_session(upload_id: str) -> Optional[dict]:
+    if not _UPLOAD_ID_RE.match(upload_id):
+        return None
+    meta_path, part_path = _session_paths(upload_id)
+    try:
+        with open(meta_path) as fh:
+            meta = json.load(fh)
+        meta["offset"] = os.path.getsize(part_path)
+    except (OSError, ValueError):
+        return None
+    return meta
+
+
+async def create_session(owner_id: int, filename: str, size: int, content_type: Optional[str], task_id: Optional[int]) -> dict:
+    if size > MAX_RESUMABLE_UPLOAD_SIZE:
+        raise UploadTooLarge()
+    meta = {
+        "upload_id": uuid.uuid4().hex,
+        "owner_id": owner_id,
+        "filename": filename,
+        "size": size,
+        "content_type": content_type,
+        "task_id": task_id,
+    }
+    await run_in_threadpool(_create_session, meta)
+    meta["offset"] = 0
+    return meta
+
+
+async def load_session(upload_id: str) -> Optional[dict]:
+    return await run_in_threadpool(_load_session, upload_id)
+
+
+def _lock_part(upload_id: str):
+    """Abrir el .part con lock exclusivo, posicionado al final. Lanza UploadBusy"""
+    _, part_path = _session_paths(upload_id)
+    try:
+        fh = open(part_path, "r+b")  # Sin crear: una subida ya finalizada no revive
+    except FileNotFoundError:
+        raise UploadNotFound()
+    if fcntl is not None:
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            fh.close()
+            raise UploadBusy()
+    else:
+        with _appending_lock:
+            if upload_id in _appending:
+                fh.close()
+                raise UploadBusy()
+            _appending.add(upload_id)
+    fh.seek(0, os.SEEK_END)
+    return fh
+
+
+def _unlock_part(upload_id: str, fh) -> None:
+    fh.close()  # Libera el flock
+    if fcntl is None:
+        with _appending_lock:
+            _appending.discard(upload_id)
+
+
+async def append_chunk(meta: dict, offset: int, chunks: AsyncIterator[bytes]) -> int:
+    """Añadir un bloque en ``offset``; devuelve el nuevo offset"""
+    upload_id = meta["upload_id"]
+    fh = await run_in_threadpool(_lock_part, upload_id)
+    written = offset
+    try:
+        current = fh.tell()
+        if offset != current:
+            meta["offset"] = current
+            raise UploadOffsetMismatch(current)
+        async for chunk in chunks:
+            written += len(chunk)
+            if written > meta["size"]:
+                raise UploadTooLarge()
+            await run_in_threadpool(fh.write, chunk)
+    except UploadTooLarge:
+        # Se descarta el bloque entero para que el cliente pueda reintentarlo
+        await run_in_threadpool(fh.truncate, offset)
+        raise
+    finally:
+        await run_in_threadpool(_unlock_part, upload_id, fh)
+    meta["offset"] = written
+    return written
+
+
+def _hash_file(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _finalize_session(meta: dict) -> StoredFile:
+    meta_path, part_path = _session_paths(meta["upload_id"])
+    # Con el lock: de dos peticiones que completan la subida solo una la mueve,
+    # la otra recibe UploadBusy o UploadNotFound
+    fh = _lock_part(meta["upload_id"])
+    try:
+        sha256 = _hash_file(part_path)
+        key = storage_key(sha256, meta["filename"])
+        _commit_blob(part_path, key)
+        os.remove(meta_path)
+    finally:
+        _unlock_part(meta["upload_id"], fh)
+    return StoredFile(storage_key=key, sha256=sha256, size=meta["size"])
+
+
+async def finalize_session(meta: dict) -> StoredFile:
+    """Mover una subida completa al almacenamiento direccionado por contenido"""
+    return await run_in_threadpool(_finalize_session, meta)
+
+
+def _cleanup_partial_uploads(max_age: float) -> int:
+    if not os.path.isdir(PARTIAL_DIR):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for name in os.listdir(PARTIAL_DIR):
+        path = os.path.join(PARTIAL_DIR, name)
+        upload_id, ext = os.path.splitext(name)
+        try:
+            orphan = ext == ".part" and not os.path.exists(_session_paths(upload_id)[0])
+            if (ext == ".tmp" or orphan) and os.path.getmtime(path) < cutoff:
+                # Restos de un proceso que murió a mitad de escribir o finalizar
+                os.remove(path)
+                removed += 1
+            elif ext == ".json" and _UPLOAD_ID_RE.match(upload_id):
+                meta_path, part_path = _session_paths(upload_id)
+                last_write = os.path.getmtime(part_path) if os.path.exists(part_path) else os.path.getmtime(meta_path)
+                if last_write >= cutoff:
+                    continue
+                try:
+                    fh = _lock_part(upload_id)
+                except UploadBusy:
+                    continue  # Recibiendo un bloque justo ahora
+                except UploadNotFound:
+                    fh = None
+                try:
+                    os.remove(meta_path)
+                    if fh is not None:
+                        os.remove(part_path)
+                finally:
+                    if fh is not None:
+                        _unlock_part(upload_id, fh)
+                removed += 1
+        except FileNotFoundError:
+            continue  # Finalizada o borrada mientras tanto
+    return removed
+
+
+async def cleanup_partial_uploads(max_age: float = UPLOAD_SESSION_TTL_HOURS * 3600) -> int:
+    """Borrar las subidas reanudables abandonadas; devuelve cuántas"""
+    return await run_in_threadpool(_cleanup_partial_uploads, max_age)
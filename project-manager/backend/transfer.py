@@ -0,0 +1,312 @@
+"""
+Exportación e importación de tareas y proyectos.
+
+GET /export recorre las tablas con un cursor de servidor (``yield_per``) y
+envía cada lote en cuanto llega, así que la memoria no depende del número de
+filas. En NDJSON cada línea lleva "type" (project o task) y los proyectos van
+antes que las tareas; en CSV se exporta una sola entidad. Las tareas
+archivadas (archived_tasks) se exportan después de las de tasks.
+
+POST /import lee el fichero por bloques y lo procesa en lotes de
+IMPORT_BATCH_SIZE filas: cada fila se valida con el esquema de creación y las
+válidas se insertan con un INSERT de varias filas (COPY en Postgres) y un
+commit por lote. Una fila inválida se anota con su número de línea y no
+detiene la carga. Al importar una exportación, los project_id de las tareas se
+traducen a los ids de los proyectos recién creados.
+"""
+
+import codecs
+import csv
+import io
+import os
+from datetime import datetime
+from itertools import islice
+from typing import AsyncIterator, BinaryIO, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+import crud
+import database
+import models
+import schemas
+import serialization
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+MAX_IMPORT_ERRORS = int(os.getenv("MAX_IMPORT_ERRORS", "100"))
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+ENTITIES = ("projects", "tasks")
+READ_CHUNK_SIZE = 64 * 1024
+
+_EXPORT_COLUMNS = {"projects": list(crud.PROJECT_FIELDS), "tasks": list(crud.TASK_FIELDS)}
+_EXPORT_MODELS = {"projects": [models.Project], "tasks": [models.Task, models.ArchivedTask]}
+_ROW_TYPES = {"project": "projects", "task": "tasks"}
+
+# Columnas que rellena la importación (COPY necesita la misma lista en cada fila)
+TASK_IMPORT_COLUMNS = [
+    "title", "description", "priority", "status", "category", "due_date", "project_id",
+    "progress", "completed", "completed_at", "created_at", "owner_id", "change_seq",
+]
+
+
+def parse_entities(entity: Optional[str], fmt: str) -> List[str]:
+    """Entidades a exportar/importar; CSV solo admite una. Lanza ValueError"""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if entity is None:
+        if fmt == "csv":
+            raise ValueError("entity (projects or tasks) is required for CSV")
+        return list(ENTITIES)
+    if entity not in ENTITIES:
+        raise ValueError(f"entity must be one of {', '.join(ENTITIES)}")
+    return [entity]
+
+# ==================== EXPORTACIÓN ====================
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _encode_csv(rows) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([_csv_value(value) for value in row] for row in rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+def _encode_ndjson(row_type: str, names: List[str], rows) -> bytes:
+    return b"".join(
+        serialization.dumps({"type": row_type, **dict(zip(names, row))}) + b"\n" for row in rows
+    )
+
+
+async def export_stream(owner_id: int, fmt: str, entities: List[str]) -> AsyncIterator[bytes]:
+    """
+    Cuerpo de la exportación. Abre su propia sesión: la de la dependencia
+    get_db ya está cerrada cuando empieza a enviarse la respuesta.
+    """
+    async with database.AsyncSessionLocal(replica=True) as db:
+        conn = await db.connection()
+        if conn.dialect.name == "postgresql":
+            # Una sola instantánea para proyectos y tareas
+            await conn.exec_driver_sql("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        for entity in entities:
+            names = _EXPORT_COLUMNS[entity]
+            if fmt == "csv":
+                yield _encode_csv([names])
+            for model in _EXPORT_MODELS[entity]:
+                result = await db.stream(
+                    select(*[getattr(model, name) for name in names])
+                    .where(model.owner_id == owner_id)
+                    .order_by(model.id)
+                    .execution_options(yield_per=EXPORT_BATCH_SIZE)
+                )
+                async for partition in result.partitions():
+                    if fmt == "csv":
+                        yield _encode_csv(partition)
+                    else:
+                        yield _encode_ndjson(entity[:-1], names, partition)
+
+# ==================== IMPORTACIÓN ====================
+# Las filas leídas son (línea, entidad, datos) o (línea, None, mensaje de error)
+
+ParsedRow = Tuple[int, Optional[str], object]
+
+
+def _iter_lines(fh: BinaryIO) -> Iterator[str]:
+    """Líneas de texto de un fichero binario leído por bloques (UTF-8, con o sin BOM)"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    while True:
+        chunk = fh.read(READ_CHUNK_SIZE)
+        pending += decoder.decode(chunk, final=not chunk)
+        # Solo "\n" separa líneas: U+2028 y similares pueden ir dentro de un JSON.
+        # El último trozo queda pendiente hasta el siguiente bloque
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+        if not chunk:
+            if pending:
+                yield pending
+            return
+
+
+def _iter_ndjson(fh: BinaryIO, entity: Optional[str]) -> Iterator[ParsedRow]:
+    default_entity = entity or "tasks"
+    for line_number, line in enumerate(_iter_lines(fh), start=1):
+        if not line.strip():
+            continue
+        try:
+            data = serialization.loads(line)
+        except ValueError:
+            yield line_number, None, "Invalid JSON"
+            continue
+        if not isinstance(data, dict):
+            yield line_number, None, "Expected a JSON object"
+            continue
+        row_type = data.pop("type", None)
+        if row_type is not None and row_type not in _ROW_TYPES:
+            yield line_number, None, f"Unknown type: {row_type}"
+            continue
+        row_entity = _ROW_TYPES[row_type] if row_type is not None else default_entity
+        if entity is not None and row_entity != entity:
+            continue
+        yield line_number, row_entity, data
+
+
+def _iter_csv(fh: BinaryIO, entity: Optional[str]) -> Iterator[ParsedRow]:
+    reader = csv.DictReader(_iter_lines(fh))
+    if entity is None:
+        # Sin entidad explícita se deduce de la cabecera (los proyectos tienen "name")
+        entity = "projects" if "name" in (reader.fieldnames or []) else "tasks"
+    for data in reader:
+        # Una celda vacía es un valor ausente, no una cadena vacía
+        yield reader.line_num, entity, {k: v for k, v in data.items() if k and v not in ("", None)}
+
+
+def _validation_detail(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc']) or 'row'}: {item['msg']}" for item in error.errors()
+    )
+
+
+class _Importer:
+    def __init__(self, db: AsyncSession, owner_id: int):
+        self.db = db
+        self.owner_id = owner_id
+        self.project_ids = {}  # id del fichero -> id creado
+        self.created_projects = set()
+        self.owned_projects = None  # Ids de proyectos que ya tenía el usuario
+        self.result = {"projects_created": 0, "tasks_created": 0, "error_count": 0, "errors": []}
+
+    def error(self, line: int, detail: str) -> None:
+        self.result["error_count"] += 1
+        if len(self.result["errors"]) < MAX_IMPORT_ERRORS:
+            self.result["errors"].append({"line": line, "detail": detail})
+
+    async def run(self, rows: Iterator[ParsedRow]) -> dict:
+        while True:
+            batch = await run_in_threadpool(lambda: list(islice(rows, IMPORT_BATCH_SIZE)))
+            if not batch:
+                return self.result
+            projects, tasks = [], []
+            for line, entity, data in batch:
+                if entity is None:
+                    self.error(line, data)
+                    continue
+                schema = schemas.ProjectImport if entity == "projects" else schemas.TaskImport
+                try:
+                    item = schema.model_validate(data)
+                except ValidationError as e:
+                    self.error(line, _validation_detail(e))
+                    continue
+                (projects if entity == "projects" else tasks).append((line, item))
+            if projects:
+                await self._insert_projects(projects)
+            if tasks:
+                await self._insert_tasks(tasks)
+
+    async def _write(self, lines: List[int], write) -> bool:
+        """Ejecutar y confirmar un lote; si la base de datos lo rechaza se anotan sus filas"""
+        try:
+            await write()
+            await self.db.commit()
+            return True
+        except Exception as e:
+            await self.db.rollback()
+            logger.warning("Lote de importación rechazado", exc_info=True, extra={"owner_id": self.owner_id})
+            for line in lines:
+                self.error(line, f"Batch rejected by the database: {e.__class__.__name__}")
+            return False
+
+    async def _insert_projects(self, projects) -> None:
+        now = datetime.utcnow()
+        created = []
+
+        async def write():
+            seq = await crud.next_change_seq(self.db, self.owner_id)
+            rows = [
+                {**item.model_dump(exclude={"id"}), "created_at": item.created_at or now,
+                 "owner_id": self.owner_id, "change_seq": seq}
+                for _, item in projects
+            ]
+            new_ids = (await self.db.scalars(insert(models.Project).returning(models.Project.id), rows)).all()
+            await self.db.execute(
+                insert(models.ProjectTaskCounter),
+                [{"project_id": pid, "task_count": 0, "completed_count": 0, "progress_sum": 0} for pid in new_ids],
+            )
+            created.extend(new_ids)
+
+        if await self._write([line for line, _ in projects], write):
+            for (_, item), new_id in zip(projects, created):
+                if item.id is not None:
+                    self.project_ids[item.id] = new_id
+            self.created_projects.update(created)
+            self.result["projects_created"] += len(created)
+
+    async def _insert_tasks(self, tasks) -> None:
+        if self.owned_projects is None:
+            self.owned_projects = set((await self.db.scalars(
+                select(models.Project.id).where(models.Project.owner_id == self.owner_id)
+            )).all())
+        now = datetime.utcnow()
+        rows, lines = [], []
+        for line, item in tasks:
+            row = item.model_dump()
+            project_id = row["project_id"]
+            if project_id is not None:
+                # Primero los proyectos de este mismo fichero, luego los del usuario
+                project_id = self.project_ids.get(project_id, project_id)
+                if project_id not in self.owned_projects and project_id not in self.created_projects:
+                    self.error(line, "project_id: Project not found")
+                    continue
+                row["project_id"] = project_id
+            if row["completed"] and row["completed_at"] is None:
+                row["completed_at"] = now
+            row["created_at"] = row["created_at"] or now
+            row["owner_id"] = self.owner_id
+            rows.append(row)
+            lines.append(line)
+        if not rows:
+            return
+
+        async def write():
+            seq = await crud.next_change_seq(self.db, self.owner_id)
+            for row in rows:
+                row["change_seq"] = seq
+            await _insert_rows(self.db, models.Task.__table__, TASK_IMPORT_COLUMNS, rows)
+            await crud.refresh_project_counters(self.db, {row["project_id"] for row in rows})
+
+        if await self._write(lines, write):
+            self.result["tasks_created"] += len(rows)
+
+
+async def _insert_rows(db: AsyncSession, table, columns: List[str], rows: List[dict]) -> None:
+    """COPY en Postgres (asyncpg); en otras bases de datos, INSERT de varias filas"""
+    conn = await db.connection()
+    if conn.dialect.driver == "asyncpg":
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            table.name, columns=columns, records=[tuple(row[c] for c in columns) for row in rows]
+        )
+    else:
+        await db.execute(insert(table), [{c: row[c] for c in columns} for row in rows])
+
+
+async def import_file(db: AsyncSession, owner_id: int, fh: BinaryIO, fmt: str, entity: Optional[str]) -> dict:
+    rows = _iter_csv(fh, entity) if fmt == "csv" else _iter_ndjson(fh, entity)
+    return await _Importer(db, owner_id).run(rows)